@@ -0,0 +1,416 @@
+import threading
+import wave
+from math import gcd
+
+import numpy as np
+from scipy.signal import resample_poly
+
+DISCORD_SAMPLE_RATE = 48000
+DISCORD_CHANNELS = 2
+DISCORD_SAMPLE_WIDTH = 2
+STT_SAMPLE_RATE = 16000
+
+
+class UserAudioBuffer:
+    """
+    Growable PCM ring buffer for a single speaker. Samples are kept interleaved in one preallocated
+    NumPy array which grows by half when it runs out of room, so appending a packet is a single copy
+    instead of a new object per packet. Offsets are absolute positions in the speaker's stream;
+    release() drops consumed audio from the front so a long-lived recording stays bounded.
+
+    The recorder thread appends while other threads read, so every access to the backing array holds
+    the buffer's lock. Growing and releasing move the samples into a new array and appending only writes
+    after the held samples, so a view stays valid once it has been handed out.
+    """
+
+    def __init__(self, dtype=np.int16, initial_samples: int = DISCORD_SAMPLE_RATE * DISCORD_CHANNELS * 2):
+        self.dtype = np.dtype(dtype)
+        self._data = np.empty(initial_samples, dtype=self.dtype)
+        self.base = 0  # absolute offset of the first held sample
+        self.length = 0  # absolute offset after the last written sample
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self) -> int:
+        return self._data.shape[0]
+
+    @property
+    def held(self) -> int:
+        """Number of samples currently held in memory."""
+        return self.length - self.base
+
+    def append(self, samples: np.ndarray) -> int:
+        """
+        Copies the samples to the end of the buffer.
+        :param samples: 1-D array of interleaved samples
+        :return: Offset (in samples) at which the data was written
+        """
+        with self._lock:
+            offset = self.length
+            start = offset - self.base
+            end = start + samples.shape[0]
+            if end > self.capacity:
+                self._grow(end)
+            self._data[start:end] = samples
+            self.length += samples.shape[0]
+        return offset
+
+    def _grow(self, needed: int):
+        data = np.empty(max(needed, self.capacity * 3 // 2), dtype=self.dtype)
+        data[:self.held] = self._data[:self.held]
+        self._data = data
+
+    def view(self, start: int | None = None, end: int | None = None) -> np.ndarray:
+        """Returns a zero-copy view of the held samples between the given absolute offsets."""
+        with self._lock:
+            return self._slice(start, end)
+
+    def copy(self, start: int | None = None, end: int | None = None) -> np.ndarray:
+        """Returns a copy of the held samples between the given absolute offsets."""
+        with self._lock:
+            return self._slice(start, end).copy()
+
+    def _slice(self, start: int | None, end: int | None) -> np.ndarray:
+        if start is None or start < self.base:
+            start = self.base
+        if end is None or end > self.length:
+            end = self.length
+        return self._data[start - self.base:max(start, end) - self.base]
+
+    def release(self, upto: int):
+        """
+        Drops the samples before the given absolute offset. The remaining samples are moved into a
+        new array instead of being shifted in place, so views handed out earlier stay valid.
+        """
+        with self._lock:
+            upto = min(upto, self.length)
+            if upto <= self.base:
+                return
+            remaining = self.length - upto
+            data = np.empty(max(remaining, self.capacity // 2, 1), dtype=self.dtype)
+            data[:remaining] = self._data[upto - self.base:self.held]
+            self._data = data
+            self.base = upto
+
+
+class CaptureStore:
+    """
+    Compact store for everything recorded during one sink's lifetime. Audio is kept in one
+    UserAudioBuffer per speaker and every received packet is described by a row in four parallel
+    columns: (timestamp, user index, offset, length). Offsets and lengths are in samples and point
+    into the speaker's buffer, so any run of packets can be read back as one slice.
+    """
+
+    def __init__(self, sample_rate: int = DISCORD_SAMPLE_RATE, channels: int = DISCORD_CHANNELS,
+                 sample_width: int = DISCORD_SAMPLE_WIDTH, initial_packets: int = 1024):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sample_width = sample_width
+        self.buffers = {}
+        self.user_ids = []  # user index -> user id
+        self.display_names = {}
+        self._user_index = {}
+        self._lock = threading.Lock()
+
+        self._timestamps = np.empty(initial_packets, dtype=np.float64)
+        self._users = np.empty(initial_packets, dtype=np.int32)
+        self._offsets = np.empty(initial_packets, dtype=np.int64)
+        self._lengths = np.empty(initial_packets, dtype=np.int32)
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def users(self) -> list:
+        """Returns the ids of every user who has audio in the store, in order of first packet."""
+        return list(self.user_ids)
+
+    def buffer(self, user) -> UserAudioBuffer:
+        return self.buffers[user]
+
+    def append(self, user, data: bytes, timestamp: float) -> int:
+        """Appends one packet of raw PCM for the given user and returns its offset."""
+        return self.append_samples(user, np.frombuffer(data, dtype=np.int16), timestamp)
+
+    def append_samples(self, user, samples: np.ndarray, timestamp: float) -> int:
+        """Appends already decoded samples for the given user and returns their offset."""
+        with self._lock:
+            index = self._user_index.get(user)
+            if index is None:
+                index = len(self.user_ids)
+                self._user_index[user] = index
+                self.user_ids.append(user)
+                self.buffers[user] = UserAudioBuffer(dtype=samples.dtype)
+
+            offset = self.buffers[user].append(samples)
+
+            if self._count == self._timestamps.shape[0]:
+                self._grow_index()
+            row = self._count
+            self._timestamps[row] = timestamp
+            self._users[row] = index
+            self._offsets[row] = offset
+            self._lengths[row] = samples.shape[0]
+            self._count += 1
+        return offset
+
+    def _grow_index(self):
+        capacity = self._timestamps.shape[0] * 2
+        for name in ("_timestamps", "_users", "_offsets", "_lengths"):
+            column = getattr(self, name)
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self._count] = column[:self._count]
+            setattr(self, name, grown)
+
+    def packets(self) -> tuple:
+        """
+        Returns zero-copy views of the packet index columns.
+        :return: (timestamps, user indices, offsets, lengths)
+        """
+        count = self._count
+        return (self._timestamps[:count], self._users[:count],
+                self._offsets[:count], self._lengths[:count])
+
+    def merge_runs(self, merge_threshold: float) -> tuple:
+        """
+        Groups the packets into per-user runs, where consecutive packets of a user less than merge_threshold
+        seconds apart belong to the same run. Gap detection and grouping are vectorized over the index columns,
+        and since a user's packets are stored back to back every run is one slice of the user's buffer.
+        :return: (end timestamps, user indices, offsets, end offsets) of the runs, ordered by user and time
+        """
+        timestamps, users, offsets, lengths = self.packets()
+        count = timestamps.shape[0]
+        if count == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return np.empty(0, dtype=np.float64), empty.astype(np.int32), empty, empty
+
+        order = np.lexsort((timestamps, users))
+        timestamps = timestamps[order]
+        users = users[order]
+        new_run = np.empty(count, dtype=bool)
+        new_run[0] = True
+        np.not_equal(users[1:], users[:-1], out=new_run[1:])
+        new_run[1:] |= np.diff(timestamps) >= merge_threshold
+
+        starts = np.flatnonzero(new_run)
+        ends = np.append(starts[1:], count) - 1
+        last = order[ends]
+        return timestamps[ends], users[starts], offsets[order[starts]], offsets[last] + lengths[last]
+
+    def release(self, user, upto: int):
+        """
+        Drops a user's audio before the given offset, along with the index rows that only point
+        at released audio.
+        """
+        with self._lock:
+            if upto <= self.buffers[user].base:
+                return
+            self.buffers[user].release(upto)
+            count = self._count
+            bases = np.array([self.buffers[u].base for u in self.user_ids], dtype=np.int64)
+            keep = np.flatnonzero(self._offsets[:count] + self._lengths[:count] > bases[self._users[:count]])
+            if keep.shape[0] == count:
+                return
+            for name in ("_timestamps", "_users", "_offsets", "_lengths"):
+                column = getattr(self, name)
+                column[:keep.shape[0]] = column[keep]
+            self._count = keep.shape[0]
+
+    def duration(self, user) -> float:
+        """Length of the held audio for a user in seconds."""
+        return self.buffers[user].held / (self.sample_rate * self.channels)
+
+    def nbytes(self) -> int:
+        """Bytes of audio currently held across all speakers."""
+        return sum(buf.held * buf.dtype.itemsize for buf in self.buffers.values())
+
+    def write_wav(self, user, file_path: str):
+        """Writes a user's held audio to disk as a WAV file."""
+        write_wav(file_path, self.buffers[user].view(), self.sample_rate, self.channels, self.sample_width)
+
+
+def to_int16(samples: np.ndarray) -> np.ndarray:
+    """Converts float samples in [-1, 1] to int16, int16 samples are returned as they are."""
+    if samples.dtype == np.int16:
+        return samples
+    return (np.clip(samples, -1.0, 1.0) * 32767.0).astype(np.int16)
+
+
+def write_wav(file_path: str, samples: np.ndarray, sample_rate: int = DISCORD_SAMPLE_RATE,
+              channels: int = DISCORD_CHANNELS, sample_width: int = DISCORD_SAMPLE_WIDTH):
+    """Writes interleaved PCM samples to disk as a WAV file. Float samples are stored as 16-bit."""
+    with wave.open(file_path, "wb") as f:
+        f.setnchannels(channels)
+        f.setsampwidth(sample_width)
+        f.setframerate(sample_rate)
+        f.writeframes(to_int16(samples).tobytes())
+
+
+def to_discord_pcm(samples: np.ndarray, sample_rate: int) -> bytes:
+    """
+    Converts mono float samples to what Discord plays: 48 kHz stereo 16-bit PCM.
+    :param samples: Mono float samples in [-1, 1]
+    :param sample_rate: Sample rate of the samples
+    :return: Interleaved little-endian int16 PCM
+    """
+    samples = np.asarray(samples, dtype=np.float32)
+    if sample_rate != DISCORD_SAMPLE_RATE:
+        divisor = gcd(DISCORD_SAMPLE_RATE, sample_rate)
+        samples = resample_poly(samples, DISCORD_SAMPLE_RATE // divisor, sample_rate // divisor)
+    return np.repeat(to_int16(samples), DISCORD_CHANNELS).tobytes()
+
+
+def pcm_duration(pcm: bytes) -> float:
+    """Length in seconds of 48 kHz stereo 16-bit PCM."""
+    return len(pcm) / (DISCORD_SAMPLE_RATE * DISCORD_CHANNELS * DISCORD_SAMPLE_WIDTH)
+
+
+class StreamingDownsampler:
+    """
+    Ingest stage for the STT path: downmixes interleaved int16 Discord audio to mono float32 and decimates
+    it from 48 kHz to 16 kHz with a windowed-sinc low-pass filter. The filter history and decimation phase
+    are carried across packets, so feeding a stream packet by packet gives the same result as feeding it
+    all at once.
+    """
+
+    def __init__(self, in_rate: int = DISCORD_SAMPLE_RATE, out_rate: int = STT_SAMPLE_RATE,
+                 channels: int = DISCORD_CHANNELS, taps: int = 63):
+        if in_rate % out_rate:
+            raise ValueError(f"Cannot decimate {in_rate} Hz to {out_rate} Hz by an integer factor.")
+        self.factor = in_rate // out_rate
+        self.channels = channels
+        # Cut off a bit below the new Nyquist frequency to leave room for the transition band.
+        cutoff = 0.9 / self.factor
+        n = np.arange(taps) - (taps - 1) / 2
+        kernel = np.sinc(cutoff * n) * np.hamming(taps)
+        self.kernel = (kernel / kernel.sum()).astype(np.float32)
+        self.history = np.zeros(taps - 1, dtype=np.float32)
+        self.phase = 0  # index of the next input sample which lands on the output grid
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """
+        :param samples: Interleaved int16 samples
+        :return: Mono float32 samples at the output rate
+        """
+        mono = samples.reshape(-1, self.channels).mean(axis=1, dtype=np.float32)
+        mono *= 1.0 / 32768.0
+        x = np.concatenate((self.history, mono))
+        filtered = np.convolve(x, self.kernel, mode="valid")
+        out = filtered[self.phase::self.factor]
+        self.phase = (self.phase - mono.shape[0]) % self.factor
+        self.history = x[x.shape[0] - self.history.shape[0]:]
+        return out
+
+
+def level_db(samples: np.ndarray) -> float:
+    """RMS level of a packet of int16 samples in dBFS."""
+    if samples.shape[0] == 0:
+        return -120.0
+    rms = np.sqrt(np.mean(np.square(samples, dtype=np.float32))) / 32768.0
+    return float(20.0 * np.log10(rms + 1e-6))
+
+
+class EnergyEndpointer:
+    """
+    Cuts per-speaker utterances out of a live capture store using packet energy. A packet louder
+    than threshold_db is voiced; an utterance opens on the first voiced packet and closes once the
+    speaker has been unvoiced for `hangover` seconds, either on a quiet packet or from poll() when
+    Discord stops sending packets altogether. Utterances with less than `min_utterance` seconds of
+    voiced audio are dropped, and `padding` seconds of context are kept on both ends.
+    """
+
+    def __init__(self, threshold_db: float = -45.0, hangover: float = 0.6, min_utterance: float = 0.3,
+                 padding: float = 0.2, max_utterance: float = 30.0):
+        self.threshold_db = threshold_db
+        self.hangover = hangover
+        self.min_utterance = min_utterance
+        self.padding = padding
+        self.max_utterance = max_utterance
+        self.active = {}  # user -> state of the utterance being spoken
+        self._lock = threading.Lock()
+
+    def configure(self, **settings):
+        """Updates the thresholds, ignoring unknown or missing settings."""
+        for name in ("threshold_db", "hangover", "min_utterance", "padding", "max_utterance"):
+            if settings.get(name) is not None:
+                setattr(self, name, float(settings[name]))
+
+    def is_idle(self) -> bool:
+        """True when no speaker has an open utterance."""
+        return not self.active
+
+    def open_utterances(self) -> dict:
+        """Returns the start offset of every open utterance by user."""
+        with self._lock:
+            return {user: state["offset"] for user, state in self.active.items()}
+
+    def process(self, capture: CaptureStore, user, timestamp: float, level: float, offset: int, end: int) -> list:
+        """
+        Feeds one stored packet to the endpointer.
+        :return: List of finished utterances (usually empty)
+        """
+        finished = []
+        with self._lock:
+            state = self.active.get(user)
+            if level >= self.threshold_db:
+                if state is None:
+                    pad = int(self.padding * capture.sample_rate) * capture.channels
+                    state = {"start": timestamp, "offset": max(offset - pad, capture.buffer(user).base),
+                             "voiced": 0.0, "last_voice": timestamp, "voice_end": end}
+                    self.active[user] = state
+                state["voiced"] += (end - offset) / (capture.sample_rate * capture.channels)
+                state["last_voice"] = timestamp
+                state["voice_end"] = end
+                if timestamp - state["start"] >= self.max_utterance:
+                    finished.append(self._close(capture, user))
+            elif state is not None and timestamp - state["last_voice"] >= self.hangover:
+                finished.append(self._close(capture, user))
+            elif state is None:
+                # Nothing open: quiet audio is only needed as padding for the next utterance.
+                pad = int(self.padding * capture.sample_rate) * capture.channels
+                self._release(capture, user, end - pad)
+        return [utterance for utterance in finished if utterance is not None]
+
+    def poll(self, capture: CaptureStore, now: float) -> list:
+        """
+        Closes utterances of speakers who stopped sending packets.
+        :return: List of finished utterances
+        """
+        finished = []
+        with self._lock:
+            for user, state in list(self.active.items()):
+                if now - state["last_voice"] >= self.hangover:
+                    finished.append(self._close(capture, user))
+        return [utterance for utterance in finished if utterance is not None]
+
+    def flush(self, capture: CaptureStore) -> list:
+        """Closes every open utterance, e.g. when the recording stops."""
+        with self._lock:
+            finished = [self._close(capture, user) for user in list(self.active)]
+        return [utterance for utterance in finished if utterance is not None]
+
+    def _close(self, capture: CaptureStore, user) -> dict | None:
+        state = self.active.pop(user)
+        pad = int(self.padding * capture.sample_rate) * capture.channels
+        end = min(state["voice_end"] + pad, capture.buffer(user).length)
+        utterance = None
+        if state["voiced"] >= self.min_utterance:
+            utterance = {
+                "user": user,
+                "start": state["start"],
+                "end": state["last_voice"],
+                "offset": state["offset"],
+                "offset_end": end,
+                "samples": capture.buffer(user).copy(state["offset"], end),
+                "sample_rate": capture.sample_rate,
+                "channels": capture.channels
+            }
+        self._release(capture, user, end)
+        return utterance
+
+    @staticmethod
+    def _release(capture: CaptureStore, user, upto: int):
+        # Release in chunks so quiet packets don't reallocate the buffer every time.
+        buffer = capture.buffer(user)
+        if upto - buffer.base >= capture.sample_rate * capture.channels:
+            capture.release(user, upto)
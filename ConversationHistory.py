@@ -0,0 +1,119 @@
+import asyncio
+import logging
+
+LOGGER: logging.Logger = logging.getLogger("ConversationHistory")
+
+summary_prompt = (
+    "Summarize the conversation below for your own memory. "
+    "Keep the names of the people, what they asked or said and anything that was agreed on or promised. "
+    "Leave out greetings and small talk. Answer with the summary only, in at most a few sentences. "
+)
+
+
+class ConversationHistory:
+    """
+    Message history for the LLM with a token budget. The system prompt and the most recent turns are always
+    sent. Once the history grows past the budget, the oldest turns are compressed into a running summary in
+    the background and replaced by it.
+
+    Token counts are estimated from the character count, and the characters-per-token ratio is calibrated
+    from the prompt token counts Ollama reports.
+    """
+
+    def __init__(self, system_message: str, max_tokens: int = 2048, recent_turns: int = 6):
+        """
+        :param system_message: System prompt, always sent first
+        :param max_tokens: Token budget of the history, None keeps the whole history
+        :param recent_turns: Number of most recent messages that are never summarized
+        """
+        self.system_message = system_message
+        self.max_tokens = max_tokens
+        self.recent_turns = recent_turns
+        self.turns = []  # user and assistant messages, oldest first
+        self.summary = ""
+        self.chars_per_token = 4.0
+        self.summarizing = None  # background summary task
+
+    def estimate_tokens(self, messages: list) -> int:
+        # A few tokens per message go to the chat template.
+        return int(sum(len(m["content"]) / self.chars_per_token + 4 for m in messages))
+
+    def calibrate(self, messages: list, prompt_tokens: int):
+        """
+        Updates the characters-per-token estimate from the prompt token count of a call.
+        :param messages: Messages that were sent
+        :param prompt_tokens: prompt_eval_count Ollama reported for them
+        """
+        if not prompt_tokens:
+            return
+        characters = sum(len(m["content"]) for m in messages)
+        overhead = 4 * len(messages)
+        if prompt_tokens > overhead:
+            ratio = characters / (prompt_tokens - overhead)
+            self.chars_per_token = 0.8 * self.chars_per_token + 0.2 * ratio
+
+    def messages(self, message: dict = None) -> list:
+        """
+        Builds the messages for a call: the system prompt, the summary and as many of the newest turns as fit
+        in the budget. Turns that are waiting to be summarized are still sent while they fit.
+        :param message: The new user message, appended last
+        :return: List of Ollama messages
+        """
+        system = self.system_message
+        if self.summary:
+            system += f"\nSummary of the earlier conversation: {self.summary}"
+        head = [{"role": "system", "content": system}]
+        tail = [message] if message is not None else []
+        if self.max_tokens is None:
+            return head + self.turns + tail
+
+        budget = self.max_tokens - self.estimate_tokens(head + tail)
+        kept = []
+        for i, turn in enumerate(reversed(self.turns)):
+            cost = self.estimate_tokens([turn])
+            if cost > budget and i >= self.recent_turns:
+                LOGGER.warning(f"History is over its token budget, leaving out {len(self.turns) - i} older messages.")
+                break
+            budget -= cost
+            kept.append(turn)
+        return head + kept[::-1] + tail
+
+    def add(self, message: dict, summarize=None):
+        """
+        Adds a message to the history, and starts summarizing the oldest turns in the background once the
+        history has grown past three quarters of the budget.
+        :param message: Ollama message
+        :param summarize: Coroutine function that takes the summary prompt and returns the summary text
+        """
+        self.turns.append(message)
+        if summarize is None or self.max_tokens is None or self.summarizing is not None:
+            return
+        system = {"content": self.system_message + self.summary}
+        if self.estimate_tokens([system] + self.turns) <= 0.75 * self.max_tokens:
+            return
+
+        # Fold the oldest turns until what's left is around half of the budget.
+        foldable = len(self.turns) - self.recent_turns
+        count = 0
+        while count < foldable and self.estimate_tokens(self.turns[count:]) > 0.5 * self.max_tokens:
+            count += 1
+        # Messages are added in user/assistant pairs, keep the pairs together.
+        count -= count % 2
+        if count > 0:
+            self.summarizing = asyncio.create_task(self._summarize(count, summarize))
+
+    async def _summarize(self, count: int, summarize):
+        folded = self.turns[:count]
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in folded)
+        if self.summary:
+            transcript = f"Earlier summary: {self.summary}\n{transcript}"
+        try:
+            summary = await summarize(summary_prompt + "\n\n" + transcript)
+            # Turns are only ever appended while this runs, so the folded ones are still first.
+            self.summary = summary.strip()
+            del self.turns[:count]
+            LOGGER.info(f"Summarized {count} older messages into {len(self.summary)} characters.")
+        except Exception as e:
+            LOGGER.error(f"Summarizing the conversation history failed: {e}")
+        finally:
+            self.summarizing = None
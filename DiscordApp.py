@@ -3,19 +3,29 @@ from discord.ext import commands
 import os
 import dotenv
 import asyncio
-import io
 import datetime
 import time
 import redis.asyncio as redis
 import json
 import logging
-from pydub import AudioSegment
-
-from OllamaChat import OllamaClient
-from TextToSpeech import TTSManager
-from SpeechToText import STTManager
-from constants import audio_to_play_directory as audio_directory, recorded_audio_directory, transcriptions_directory, BOT_CONFIG_KEY, llm_output_texts_directory
-
+import numpy as np
+
+from AudioCapture import CaptureStore, EnergyEndpointer, StreamingDownsampler, level_db, write_wav, STT_SAMPLE_RATE, \
+    DISCORD_SAMPLE_RATE, DISCORD_CHANNELS, DISCORD_SAMPLE_WIDTH
+from OllamaChat import OllamaClient, SentenceSplitter
+from ResponseCache import ResponseCache
+from TTSCache import TTSCache
+from TTSService import TTSService
+from LLMScheduler import LLMScheduler, VOICE, CHAT, GREETING
+from PlaybackScheduler import PlaybackScheduler
+from TurnTaking import TurnTaking
+from VoiceCommands import VoiceCommands
+from StreamingReply import StreamingReply
+from SpeechToText import STTManager, IncrementalTranscriber
+from ModelLoader import ModelLifecycle
+from constants import audio_to_play_directory as audio_directory, recorded_audio_directory, transcriptions_directory, BOT_CONFIG_KEY, llm_output_texts_directory, TWITCH_CHATTERS_KEY, tts_cache_directory
+
+STARTED = time.perf_counter()
 dotenv.load_dotenv()
 LOGGER: logging.Logger = logging.getLogger("DiscordClient")
 
@@ -29,28 +39,175 @@ logging.basicConfig(
 )
 
 class AutoRecordSink(discord.sinks.WaveSink):
-    def __init__(self):
+    def __init__(self, archive: bool = False, on_voice=None):
+        """
+        :param archive: Also keep the original 48 kHz stereo audio
+        :param on_voice: Called with the user from the recorder thread for every packet with voice in it
+        """
         super().__init__()
+        self.on_voice = on_voice
         timestamp = time.time()
         self.last_active = timestamp  # record when audio was last received
-        self.utterances = []
+        self.last_voice = 0.0  # when a packet was last received, Discord only sends them while someone speaks
+        # 16 kHz mono float32 audio for the STT path, downsampled per user as packets arrive
+        self.capture = CaptureStore(sample_rate=STT_SAMPLE_RATE, channels=1)
+        # Original 48 kHz stereo audio, only kept when recordings are archived
+        self.archive = CaptureStore() if archive else None
+        self.downsamplers = {}
 
     # This method is called each time audio data is processed.
     def write(self, data: bytes, user):
-        super().write(data, user)
         timestamp = time.time()
         self.last_active = timestamp  # update on every frame
+        self.last_voice = timestamp
+        if self.on_voice is not None:
+            self.on_voice(user)
+
+        try:
+            self.ingest(user, np.frombuffer(data, dtype=np.int16), timestamp)
+        except Exception as e:
+            LOGGER.error(f"Error storing audio packet for user {user}: {e}")
+
+    def ingest(self, user, samples: np.ndarray, timestamp: float) -> tuple:
+        """
+        Stores one packet of 48 kHz stereo samples.
+        :return: (offset, end) of the downsampled packet in the user's capture buffer
+        """
+        if self.archive is not None:
+            self.archive.append_samples(user, samples, timestamp)
+        downsampler = self.downsamplers.get(user)
+        if downsampler is None:
+            downsampler = self.downsamplers[user] = StreamingDownsampler()
+        downsampled = downsampler.process(samples)
+        offset = self.capture.append_samples(user, downsampled, timestamp)
+        return offset, offset + downsampled.shape[0]
+
+class ContinuousRecordSink(AutoRecordSink):
+    """
+    Long-lived sink which keeps recording between turns. Every packet goes through an EnergyEndpointer
+    and each finished utterance is handed to on_utterance as soon as the speaker stops.
+    on_utterance may be called from the recorder thread.
+    """
+    def __init__(self, on_utterance, endpointer_settings: dict, archive: bool = False, on_voice=None):
+        super().__init__(archive, on_voice)
+        self.on_utterance = on_utterance
+        self.endpointer = EnergyEndpointer()
+        self.endpointer.configure(**endpointer_settings)
+        self.last_voice = 0.0  # when a voiced packet was last received
+
+    def write(self, data: bytes, user):
+        timestamp = time.time()
+        self.last_active = timestamp
 
         try:
-            seg = AudioSegment.from_raw(io.BytesIO(data), sample_width=2, frame_rate=48000, channels=2)
-            self.utterances.append((timestamp, user, seg))
+            samples = np.frombuffer(data, dtype=np.int16)
+            offset, end = self.ingest(user, samples, timestamp)
+            level = level_db(samples)
+            if level >= self.endpointer.threshold_db:
+                self.last_voice = timestamp
+                if self.on_voice is not None:
+                    self.on_voice(user)
+            utterances = self.endpointer.process(self.capture, user, timestamp, level, offset, end)
         except Exception as e:
-            LOGGER.error(f"Error parsing audio segment for user {user}: {e}")
+            LOGGER.error(f"Error endpointing audio packet for user {user}: {e}")
+            return
+
+        self.hand_over(utterances, user)
+
+    def poll(self):
+        """Closes the utterances of speakers who have stopped sending audio."""
+        utterances = self.endpointer.poll(self.capture, time.time())
+        self.hand_over(utterances)
+
+    def flush(self):
+        """Hands over every utterance that is still open."""
+        utterances = self.endpointer.flush(self.capture)
+        self.hand_over(utterances)
+
+    def hand_over(self, utterances: list, user=None):
+        if self.archive is not None:
+            # The archive is kept in step with the capture store: offsets scale by the ratio of samples per second.
+            ratio = (self.archive.sample_rate * self.archive.channels) // (self.capture.sample_rate * self.capture.channels)
+            for utterance in utterances:
+                utterance["archive"] = self.archive.buffer(utterance["user"]).copy(
+                    utterance["offset"] * ratio, utterance["offset_end"] * ratio)
+            users = [user] if user is not None else self.capture.users()
+            for released_user in users:
+                self.archive.release(released_user, self.capture.buffer(released_user).base * ratio)
+
+        for utterance in utterances:
+            self.on_utterance(utterance)
+
+TRANSCRIPTION_ERROR = "There was an error with the transcription process."
+RESPONSE_ERROR = "There was an error creating a response."
+GREETING_PROMPT = "{name} joined the call. You should greet them."
+# Greetings only differ by the name, so the response cache only matches them exactly.
+GREETING_TEMPLATE = r" joined the call\. You should greet them\.$"
+
+# 20 ms of 48 kHz stereo 16-bit PCM, what discord.AudioSource.read returns.
+FRAME_SIZE = DISCORD_SAMPLE_RATE // 50 * DISCORD_CHANNELS * DISCORD_SAMPLE_WIDTH
+
+
+class PCMAudio(discord.AudioSource):
+    """Plays 48 kHz stereo 16-bit PCM from memory, without an ffmpeg process."""
+
+    def __init__(self, pcm: bytes):
+        self.pcm = memoryview(pcm)
+        self.position = 0
+
+    def read(self) -> bytes:
+        frame = self.pcm[self.position:self.position + FRAME_SIZE]
+        self.position += FRAME_SIZE
+        if len(frame) < FRAME_SIZE and len(frame) > 0:
+            return bytes(frame) + bytes(FRAME_SIZE - len(frame))
+        return bytes(frame)
+
+    def is_opus(self) -> bool:
+        return False
+
+
+class OpusFrames(discord.AudioSource):
+    """Plays Opus packets that were encoded beforehand, Discord sends them without encoding them again."""
+
+    def __init__(self, frames: list):
+        self.frames = iter(frames)
+
+    def read(self) -> bytes:
+        return next(self.frames, b"")
+
+    def is_opus(self) -> bool:
+        return True
+
+
+def encode_opus(pcm: bytes) -> list | None:
+    """Encodes PCM into 20 ms Opus packets for OpusFrames, None if the Opus library isn't loaded."""
+    if not discord.opus.is_loaded():
+        return None
+    encoder = discord.opus.Encoder()
+    frames = []
+    for start in range(0, len(pcm), FRAME_SIZE):
+        frame = pcm[start:start + FRAME_SIZE]
+        frame += bytes(FRAME_SIZE - len(frame))
+        frames.append(encoder.encode(frame, encoder.SAMPLES_PER_FRAME))
+    return frames
+
+
+def audio_source(audio: bytes | list | str) -> discord.AudioSource:
+    """A source for synthesized PCM, Opus packets, or ffmpeg for an audio file."""
+    if isinstance(audio, bytes):
+        return PCMAudio(audio)
+    if isinstance(audio, list):
+        return OpusFrames(audio)
+    return discord.FFmpegPCMAudio(audio)
 
 # When no audio is received for 2 seconds, a response is triggered.
-async def monitor_silence(vc: discord.VoiceClient, sink: AutoRecordSink):
+async def monitor_silence(vc: discord.VoiceClient, sink: AutoRecordSink, on_speech=None):
     while True:
         await asyncio.sleep(0.1)
+        if on_speech is not None and sink.last_voice:
+            # Called once, when the first audio of the segment arrives.
+            on_speech()
+            on_speech = None
         elapsed = time.time() - sink.last_active
         if elapsed >= 1:
             vc.stop_recording()  # this triggers the segment callback below
@@ -72,60 +229,179 @@ class DiscordClient(commands.Bot):
         self.single_speaker = True
         self.speaker = ""
         self.last_activity = None
-        self.recording_file_path = None
         self.segment_event = None
-        self.get_response = False
-        self.transcription_segments = []
-        self.audio_queue = asyncio.Queue()
+        self.playback = PlaybackScheduler()
+        self.responses = {}  # playback group -> task generating or synthesizing the response, for barge-in
+        self.interruption = None  # the barge-in that stopped the current playback
         self.redis_conn = redis.Redis(host="localhost", port=6379, db=0)
         self.config = {}
         self.twitch_raids = []
         self.priority_messages = []
         self.twitch_subscriptions = []
-        self.transcribe_tasks = 0
-        self.stt = STTManager()
+        self.stt = None
+        self.stt_pool = None
         self.ollama_client = None
+        self.llm_scheduler = None
         self.tts = None
-        self.previous_silence_segments = []
-        self.existing_audio = False
-        self.checking_response_flag = False
+        self.tts_service = None
+        self.tts_cache = None
+        self.models = ModelLifecycle(STARTED)
+        self.turns = TurnTaking(self.respond_to_turn, self.start_speculation,
+                                lambda: self.cancel_speculation("the speaker resumed"))
+        self.recording_sink = None
+        self.partials = {}
+        self.speculation = None
+        self.voice_commands = VoiceCommands()
 
     async def on_ready(self):
-        config_data = await self.redis_conn.get(BOT_CONFIG_KEY)
-        if config_data:
-            self.config = json.loads(config_data)
-        else:
-            # Set default values if no configuration exists.
-            self.config = {
-                "timeout_duration": 600,
-                "discord_actions_enabled": True,
-                "handle_twitch_events": True,
-                "dc_invite_link": True
-            }
-            await self.redis_conn.set(BOT_CONFIG_KEY, json.dumps(self.config))
+        self.models.timings["connect"] = time.perf_counter() - STARTED
+        with self.models.phase("config"):
+            await self.load_config()
+        self.turns.configure(self.config.get("turn_end_silence", 2.0), self.config.get("speculative_silence", 0.6))
+        self.voice_commands.usernames.cutoff = self.config.get("voice_command_cutoff", 0.9)
         self.guild_id = int(os.getenv('DISCORD_GUILD'))
         self.guild: discord.Guild = self.get_guild(self.guild_id)
-        self.ollama_client = OllamaClient()
+        self.ollama_client = OllamaClient(self.config.get("llm_history_tokens", 2048),
+                                          self.config.get("llm_recent_turns", 6),
+                                          timeout=self.config.get("llm_timeout", 60))
+        self.llm_scheduler = LLMScheduler(self.config.get("llm_concurrency", 1), self.config.get("llm_max_age"))
+        self.ollama_client.scheduler = self.llm_scheduler
+        self.playback.configure(self.config.get("playback_max_age"))
+        if self.config.get("llm_cache", False):
+            self.ollama_client.enable_cache(self.config.get("llm_cache_entries", 256),
+                                            self.config.get("llm_cache_ttl", 3600),
+                                            self.config.get("llm_cache_similarity", 0.92),
+                                            self.config.get("llm_cache_embedding_model"),
+                                            self.config.get("llm_cache_min_words", 4),
+                                            [GREETING_TEMPLATE])
         os.makedirs(audio_directory, exist_ok=True)
         os.makedirs(recorded_audio_directory, exist_ok=True)
         os.makedirs(transcriptions_directory, exist_ok=True)
         os.makedirs(llm_output_texts_directory, exist_ok=True)
+        if self.config.get("tts_cache", True):
+            self.tts_cache = TTSCache(tts_cache_directory, self.config.get("tts_cache_size_mb", 256) * 1024 * 1024)
+            asyncio.create_task(self.prewarm_tts_cache())
         self.channel: discord.VoiceChannel = discord.utils.get(self.guild.channels, name="AIChat")
         self.text_channel: discord.TextChannel = discord.utils.get(self.guild.channels, name="general")
         self.logs_channel: discord.TextChannel = discord.utils.get(self.guild.channels, name="logs")
-        self.tts = TTSManager()
+        if self.config.get("llm_preload", True):
+            asyncio.create_task(self.ollama_client.preload())
+        # Whisper and the TTS model load in the background, voice handling waits for them in get_vc.
+        self.models.start(self.config.get("stt_workers", 0),
+                          self.config.get("inference_mode", "default") == "quantized",
+                          self.config.get("inference_threads"),
+                          self.config.get("stt_pool_timeout", 300))
 
         for member in self.guild.members:
             self.username_to_id[member.display_name] = member.id
 
         asyncio.create_task(self.listen_for_config_updates())
         asyncio.create_task(self.listen_for_twitch_events())
+        asyncio.create_task(self.refresh_usernames())
         asyncio.create_task(self._audio_player())
         LOGGER.info(f'Logged on as {self.user}!')
         LOGGER.info(f"User id: {self.user.id}")
 
         await self.get_vc()
 
+    async def load_config(self):
+        config_data = await self.redis_conn.get(BOT_CONFIG_KEY)
+        if config_data:
+            self.config = json.loads(config_data)
+        else:
+            # Set default values if no configuration exists.
+            self.config = {
+                "timeout_duration": 600,
+                "discord_actions_enabled": True,
+                "handle_twitch_events": True,
+                "dc_invite_link": True,
+                "continuous_recording": False,
+                "vad_threshold_db": -45.0,
+                "vad_hangover": 0.6,
+                "vad_min_utterance": 0.3,
+                "vad_padding": 0.2,
+                "vad_max_utterance": 30.0,
+                "turn_end_silence": 2.0,
+                "barge_in": False,
+                "stream_responses": False,
+                "save_tts_output": False,
+                "tts_max_queue": 32,
+                "tts_batch_size": 4,
+                "tts_cache": True,
+                "tts_cache_size_mb": 256,
+                "tts_cache_prewarm": [TRANSCRIPTION_ERROR, RESPONSE_ERROR],
+                "chat_edit_interval": 1.0,
+                "speculative_responses": False,
+                "speculative_silence": 0.6,
+                "voice_commands": False,
+                "voice_command_users": [],
+                "voice_command_cutoff": 0.9,
+                "llm_history_tokens": 2048,
+                "llm_recent_turns": 6,
+                "llm_timeout": 60,
+                "llm_concurrency": 1,
+                "llm_max_age": {"voice": 60, "chat": 120, "greeting": 30, "twitch": 120},
+                "playback_max_age": {"voice": 30, "greeting": 20, "twitch": 60},
+                "llm_preload": True,
+                "llm_keep_alive": "10m",
+                "llm_keep_alive_interval": 240,
+                "llm_cache": False,
+                "llm_cache_entries": 256,
+                "llm_cache_ttl": 3600,
+                "llm_cache_similarity": 0.92,
+                "llm_cache_embedding_model": "nomic-embed-text",
+                "llm_cache_min_words": 4,
+                "inference_mode": "default",
+                "inference_threads": None,
+                "stt_workers": 0,
+                "stt_pool_timeout": 300,
+                "stt_batch_size": 8,
+                "stt_streaming_partials": False,
+                "stt_partial_interval": 1.0,
+                "save_recordings": False,
+                "archive_recordings": False
+            }
+            await self.redis_conn.set(BOT_CONFIG_KEY, json.dumps(self.config))
+
+    async def wait_for_models(self):
+        """Waits until the STT and TTS models are loaded and warmed up."""
+        if not self.models.ready:
+            LOGGER.info("Waiting for the models to be ready...")
+        await self.models.wait_ready()
+        self.stt = self.models.stt
+        self.stt_pool = self.models.stt_pool
+        await self.wait_for_tts()
+
+    async def wait_for_tts(self):
+        await self.models.tts_ready.wait()
+        self.tts = self.models.tts
+        if self.tts_service is None:
+            self.tts_service = TTSService(self.tts, self.config.get("tts_max_queue", 32),
+                                          self.config.get("tts_batch_size", 4))
+            self.tts_service.start()
+
+    async def close(self):
+        if self.models.stt_pool is not None:
+            self.models.stt_pool.close()
+        if self.tts_service is not None:
+            self.tts_service.close()
+        await super().close()
+
+    async def run_stt(self, method: str, *args) -> dict:
+        """
+        Runs an STTManager method in the STT worker pool if there is one, otherwise in a thread. The in-process
+        model transcribes one call at a time, so utterances of overlapping speakers wait for each other.
+        """
+        if self.stt_pool is not None:
+            return await getattr(self.stt_pool, method)(*args)
+        return await asyncio.to_thread(getattr(self.stt, method), *args)
+
+    def stt_backend(self):
+        """An object with STTManager's blocking methods, for code which runs in a thread."""
+        if self.stt_pool is not None:
+            return self.stt_pool.proxy(self.loop)
+        return self.stt
+
     async def on_message(self, message: discord.Message):
         if message.author == self.user:
             return
@@ -144,6 +420,13 @@ class DiscordClient(commands.Bot):
                     new_config = json.loads(message["data"])
                     # Update local configuration. You might merge dictionaries.
                     self.config.update(new_config)
+                    if isinstance(self.recording_sink, ContinuousRecordSink):
+                        self.recording_sink.endpointer.configure(**self.endpointer_settings())
+                    if self.llm_scheduler is not None:
+                        self.llm_scheduler.configure(self.config.get("llm_max_age"))
+                    self.playback.configure(self.config.get("playback_max_age"))
+                    self.turns.configure(self.config.get("turn_end_silence"), self.config.get("speculative_silence"))
+                    self.voice_commands.usernames.cutoff = self.config.get("voice_command_cutoff", 0.9)
                     LOGGER.info(f"Configuration updated: {self.config}")
                 except Exception as e:
                     LOGGER.error("Failed to process config update:", e)
@@ -170,6 +453,16 @@ class DiscordClient(commands.Bot):
                     LOGGER.error("Failed to process twitch event:", e)
             await asyncio.sleep(1)
 
+    async def refresh_usernames(self):
+        """Keeps the username index of the voice commands up to date with the Twitch chatters."""
+        while True:
+            try:
+                chatters = await self.redis_conn.smembers(TWITCH_CHATTERS_KEY)
+                self.voice_commands.usernames.add(sorted(name.decode("utf-8") for name in chatters))
+            except Exception as e:
+                LOGGER.error(f"Failed to refresh the Twitch chatters: {e}")
+            await asyncio.sleep(60)
+
     async def on_voice_state_update(self, member: discord.Member, before: discord.VoiceState, after: discord.VoiceState):
         if before.channel is not None and after.channel is None:
             message = f"{member.display_name} left the vc: {before.channel.name}."
@@ -184,8 +477,8 @@ class DiscordClient(commands.Bot):
                     self.config["handle_twitch_events"] = False
                     update_config = True
                 if member.id != self.user.id:
-                    message = f"{member.display_name} joined the call. You should greet them."
-                    asyncio.create_task(self.transform_message(message))
+                    message = GREETING_PROMPT.format(name=member.display_name)
+                    asyncio.create_task(self.transform_message(message, GREETING, f"greeting:{member.id}"))
         elif before.channel is not None and before.channel.id == self.channel.id:
             if after.channel is None or after.channel != self.channel.id:
                 member_count = len(before.channel.members)
@@ -201,26 +494,47 @@ class DiscordClient(commands.Bot):
             message = f"Updated config: {config_json}"
             #await self.logs_channel.send(message)
 
+        await self.update_llm_session()
+
+    async def update_llm_session(self):
+        """Keeps the LLM loaded while the bot is in the voice channel with someone, and releases it after."""
+        vc = self.connections.get(self.guild_id)
+        listeners = [member for member in self.channel.members if not member.bot]
+        if vc is not None and vc.is_connected() and listeners:
+            self.ollama_client.start_session(self.config.get("llm_keep_alive", "10m"),
+                                             self.config.get("llm_keep_alive_interval", 240))
+        else:
+            await self.ollama_client.end_session()
+
     async def get_vc(self, ctx = None):
         if self.guild_id not in self.connections:
-            vc: discord.VoiceClient = await self.channel.connect()  # Connect to the voice channel specified
+            with self.models.phase("voice_connect"):
+                vc: discord.VoiceClient = await self.channel.connect()  # Connect to the voice channel specified
             self.connections.update({self.guild_id: vc})  # Updating the cache with the guild and channel.
         else:
             vc = self.connections[self.guild_id]
 
         self.vc: discord.VoiceClient = vc
+        await self.update_llm_session()
 
         if ctx is not None:
             await ctx.reply(f"Joined the vc: {vc.channel.name}")
 
+        # Voice handling only starts once both models can be used.
+        await self.wait_for_models()
+
         while vc.is_connected():
-            await self.record()
+            if self.config.get("continuous_recording", False):
+                await self.record_continuous()
+            else:
+                await self.record()
 
         return vc
 
     async def record(self):
         # Create a fresh sink for this segment
-        sink = AutoRecordSink()
+        sink = AutoRecordSink(archive=self.archive_recordings(), on_voice=self.detect_barge_in)
+        self.recording_sink = sink
 
         # Create an event that the callback will set once the segment is finished.
         self.segment_event = asyncio.Event()
@@ -229,7 +543,7 @@ class DiscordClient(commands.Bot):
         self.vc.start_recording(sink, self.segment_callback, self.channel)
 
         # In parallel, monitor for silence (stopping recording after 1 sec quiet).
-        monitor_task = asyncio.create_task(monitor_silence(self.vc, sink))
+        monitor_task = asyncio.create_task(monitor_silence(self.vc, sink, self.turns.speech_started))
         # Wait for the segment (silence) event
         await self.segment_event.wait()
 
@@ -240,10 +554,147 @@ class DiscordClient(commands.Bot):
         # A short delay before starting the next recording session.
         await asyncio.sleep(0.1)
 
+    def archive_recordings(self) -> bool:
+        """The original-quality stream is only kept when saved recordings are archived."""
+        return self.config.get("save_recordings", False) and self.config.get("archive_recordings", False)
+
+    def endpointer_settings(self) -> dict:
+        """Voice-activity endpointing thresholds from the bot config."""
+        return {
+            "threshold_db": self.config.get("vad_threshold_db"),
+            "hangover": self.config.get("vad_hangover"),
+            "min_utterance": self.config.get("vad_min_utterance"),
+            "padding": self.config.get("vad_padding"),
+            "max_utterance": self.config.get("vad_max_utterance")
+        }
+
+    async def record_continuous(self):
+        """
+        Records with a single sink that is never stopped between turns. Utterances are cut out of the live
+        stream by the sink's endpointer and transcribed as soon as each one ends. The endpointer's voice
+        activity is passed on to the turn-taking state machine, which decides when to respond.
+        """
+        def on_utterance(utterance: dict):
+            asyncio.run_coroutine_threadsafe(self.handle_utterance(utterance), self.loop)
+
+        sink = ContinuousRecordSink(on_utterance, self.endpointer_settings(), archive=self.archive_recordings(),
+                                    on_voice=self.detect_barge_in)
+        self.recording_sink = sink
+        self.segment_event = asyncio.Event()
+        self.vc.start_recording(sink, self.continuous_callback, self.channel)
+
+        speaking = False
+        while not self.segment_event.is_set():
+            await asyncio.sleep(0.05)
+            sink.poll()
+            if self.config.get("stt_streaming_partials", False):
+                self.update_partials(sink)
+            if speaking == sink.endpointer.is_idle():
+                speaking = not speaking
+                if speaking:
+                    self.turns.speech_started()
+                else:
+                    self.turns.speech_stopped(sink.last_voice)
+
+            if not self.config.get("continuous_recording", False) and not self.segment_event.is_set():
+                # Switched back to segment recording.
+                self.vc.stop_recording()
+                await self.segment_event.wait()
+
+        self.recording_sink = None
+        self.partials = {}
+
+    def update_partials(self, sink: ContinuousRecordSink):
+        """
+        Keeps one IncrementalTranscriber per utterance that is still being spoken and transcribes the speaker's
+        audio again every stt_partial_interval seconds, one pass per speaker at a time. handle_utterance
+        finalizes the transcriber of an utterance once it ends.
+        """
+        interval = self.config.get("stt_partial_interval", 1.0)
+        now = time.perf_counter()
+        for user, offset in sink.endpointer.open_utterances().items():
+            partial = self.partials.get(user)
+            if partial is None or partial["offset"] != offset:
+                partial = self.partials[user] = {
+                    "offset": offset,
+                    "transcriber": IncrementalTranscriber(self.stt_backend(), offset, STT_SAMPLE_RATE),
+                    "task": None,
+                    "updated": now,
+                    "text": ""
+                }
+            if partial["task"] is not None and not partial["task"].done():
+                continue
+            if now - partial["updated"] < interval:
+                continue
+
+            audio = sink.capture.buffer(user).copy(partial["transcriber"].committed_offset)
+            if audio.shape[0] < STT_SAMPLE_RATE // 2:
+                continue
+            partial["updated"] = now
+            partial["task"] = asyncio.create_task(self.update_partial(user, partial, audio))
+
+    async def update_partial(self, user, partial: dict, audio: np.ndarray):
+        text = await asyncio.to_thread(partial["transcriber"].update, audio)
+        if text != partial["text"]:
+            partial["text"] = text
+            LOGGER.info(f"Partial transcript of {self.id_to_display_name.get(user, user)}: {text}")
+
+    async def continuous_callback(self, sink_obj: ContinuousRecordSink, text_channel: discord.TextChannel):
+        sink_obj.flush()
+        self.segment_event.set()
+
+    async def handle_utterance(self, utterance: dict):
+        """Transcribes one utterance cut out of the continuous recording."""
+        self.turns.transcription_started()
+        partial = self.partials.get(utterance["user"])
+        if partial is not None and partial["offset"] == utterance["offset"]:
+            del self.partials[utterance["user"]]
+        else:
+            partial = None
+
+        user_id = utterance["user"]
+        if user_id in self.id_to_display_name.keys():
+            display_name = self.id_to_display_name[user_id]
+        else:
+            try:
+                user_obj = await self.fetch_user(int(user_id))
+                display_name = user_obj.display_name
+                self.id_to_display_name[user_id] = display_name
+            except Exception as e:
+                LOGGER.error(f"Error retrieving user {user_id}: {e}")
+                display_name = str(user_id)
+
+        if self.config.get("save_recordings", False):
+            asyncio.create_task(asyncio.to_thread(self.save_utterance, utterance, display_name))
+
+        started = time.perf_counter()
+        if partial is not None:
+            if partial["task"] is not None:
+                # The model transcribes one call at a time anyway, and the pass may commit more of the utterance.
+                await asyncio.wait([partial["task"]])
+            # Most of the utterance was transcribed while it was spoken, only the tail is left.
+            transcription_result = await asyncio.to_thread(
+                partial["transcriber"].finalize, utterance["samples"], utterance["offset"], utterance["start"]
+            )
+        else:
+            transcription_result = await self.run_stt("transcribe_array", utterance["samples"], utterance["start"])
+        LOGGER.info(f"Utterance transcribed {time.perf_counter() - started:.2f} s after it ended.")
+        await self.process_transcription_result(transcription_result, display_name, [(display_name, user_id)])
+
+    @staticmethod
+    def save_utterance(utterance: dict, display_name: str):
+        """Writes an utterance to disk, in the original quality if it was archived."""
+        date = datetime.datetime.fromtimestamp(utterance["start"]).strftime("%Y-%m-%d_%H-%M-%S")
+        file_path = os.path.join(recorded_audio_directory, f"{date}-recording_{display_name}.wav")
+        if "archive" in utterance:
+            write_wav(file_path, utterance["archive"])
+        else:
+            write_wav(file_path, utterance["samples"], utterance["sample_rate"], utterance["channels"])
+        LOGGER.info(f"Saved utterance to disk: {file_path}")
+
     async def convert_utterances_usernames(self, sink: AutoRecordSink):
-        """Converts stored user IDs in utterances to usernames (or display names)."""
-        new_utterances = []
-        for timestamp, user_id, data in sink.utterances:
+        """Resolves the user IDs in the sink's capture store to usernames (or display names)."""
+        for user_id in sink.capture.users():
             try:
                 if user_id in self.id_to_display_name.keys():
                     username = self.id_to_display_name[user_id]
@@ -254,11 +705,14 @@ class DiscordClient(commands.Bot):
             except Exception as e:
                 LOGGER.error(f"Error retrieving user {user_id}: {e}")
                 username = str(user_id)  # fallback in case of an error
-            new_utterances.append((timestamp, username, data))
-        sink.utterances = new_utterances
+            sink.capture.display_names[user_id] = username
 
     # Callback once recording stops (i.e. when silence is detected)
     async def segment_callback(self, sink_obj: AutoRecordSink, text_channel: discord.TextChannel):
+        if sink_obj.capture:
+            # Counted here already, so the turn can't end before handle_segment gets going.
+            self.turns.speech_stopped(sink_obj.last_voice)
+            self.turns.transcription_started()
         # Offload handling the audio data on the sink on a separate task so that recording isn't paused
         asyncio.create_task(self.handle_segment(sink_obj))
         self.segment_event.set()  # signal that the segment is done
@@ -266,132 +720,320 @@ class DiscordClient(commands.Bot):
     async def handle_segment(self, sink_obj):
         await self.convert_utterances_usernames(sink_obj)
         # Process the recorded data only if some audio was captured.
-        if sink_obj.audio_data:
-            self.transcribe_tasks += 1
-            self.previous_silence_segments = []
-            self.existing_audio = True
+        if sink_obj.capture:
             # Format a list of users for whom audio was recorded.
-            recorded_users = [f"<@{user_id}>" for user_id in sink_obj.audio_data.keys()]
-
-            for user_id, audio in sink_obj.audio_data.items():
-                display_name = self.id_to_display_name[user_id]
-                self.speaker = display_name
-                # Extract the entire content from the BytesIO buffer.
-                audio.file.seek(0)
-                data = audio.file.read()
-                date = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-
-                disk_filename = f"{date}-recording_{display_name}.{sink_obj.encoding}"
-                self.recording_file_path = os.path.join(recorded_audio_directory, disk_filename)
-                with open(self.recording_file_path, "wb") as f:
-                    f.write(data)
-                LOGGER.info(f"Saved file to disk: {self.recording_file_path}")
+            recorded_users = [f"<@{user_id}>" for user_id in sink_obj.capture.users()]
+
+            speaker_id = sink_obj.capture.users()[-1]
+            self.speaker = sink_obj.capture.display_names[speaker_id]
+
+            if self.config.get("save_recordings", False):
+                # Saving is a side channel, transcription doesn't wait for it.
+                asyncio.create_task(asyncio.to_thread(self.save_segment, sink_obj))
 
             if self.single_speaker:
-                LOGGER.info("Started transcribing the audio file.")
-                await self.transcribe_segment()
+                LOGGER.info("Started transcribing the recorded audio.")
+                await self.transcribe_segment(sink_obj.capture.buffer(speaker_id).view(), [(self.speaker, speaker_id)])
             else:
                 LOGGER.info("Started processing individual utterances to get a transcription.")
                 await self.transcribe_utterances(sink_obj)
         else:
             LOGGER.info(f"Silence segment, no data recorded.")
-            if len(self.previous_silence_segments) >= 3:
-                # a check if the silence has been at least 2 seconds to signal for a response process
-                if (self.previous_silence_segments[-1] - self.previous_silence_segments[-3] >= 2
-                        and not self.get_response and self.existing_audio):
-                    LOGGER.info("Signaling to get a response...")
-                    self.get_response = True
-                    self.existing_audio = False
-
-                    if not self.checking_response_flag:
-                        asyncio.create_task(self.check_response_flag())
+
+    def save_segment(self, sink_obj: AutoRecordSink):
+        """Writes every user's audio in the segment to disk, in the original quality if it was archived."""
+        for user_id in sink_obj.capture.users():
+            display_name = sink_obj.capture.display_names[user_id]
+            date = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+
+            disk_filename = f"{date}-recording_{display_name}.{sink_obj.encoding}"
+            file_path = os.path.join(recorded_audio_directory, disk_filename)
+            if sink_obj.archive is not None:
+                sink_obj.archive.write_wav(user_id, file_path)
             else:
-                self.previous_silence_segments.append(time.time())
+                sink_obj.capture.write_wav(user_id, file_path)
+            LOGGER.info(f"Saved file to disk: {file_path}")
 
-    async def transcribe_segment(self):
-        transcription_result = await asyncio.to_thread(
-            self.stt.transcribe_audiofile, self.recording_file_path
-        )
-        await self.process_transcription_result(transcription_result)
+    async def transcribe_segment(self, audio: np.ndarray, users: list):
+        started = time.perf_counter()
+        transcription_result = await self.run_stt("transcribe_array", audio)
+        LOGGER.info(f"Segment transcribed {time.perf_counter() - started:.2f} s after it ended.")
+        await self.process_transcription_result(transcription_result, users=users)
 
     async def transcribe_utterances(self, sink_obj):
-        transcription_result = await asyncio.to_thread(
-            self.stt.process_utterances, sink_obj
-        )
-        await self.process_transcription_result(transcription_result)
-
-    async def process_transcription_result(self, transcription_result: dict):
+        started = time.perf_counter()
+        batch_size = self.config.get("stt_batch_size", 8)
+        if self.stt_pool is not None:
+            # Merging needs the capture store, so only the transcription goes to the workers.
+            merged_utterances = STTManager.merge_utterances(sink_obj.capture)
+            transcription_result = await self.stt_pool.transcribe_segments(
+                [segment for _, _, segment in merged_utterances], batch_size
+            )
+            if transcription_result["success"]:
+                transcription_result = STTManager.format_utterances(
+                    merged_utterances, transcription_result["transcriptions"]
+                )
+        else:
+            transcription_result = await asyncio.to_thread(
+                self.stt.process_utterances, sink_obj, batch_size
+            )
+        LOGGER.info(f"Utterances transcribed {time.perf_counter() - started:.2f} s after the segment ended.")
+        users = [(display_name, user_id) for user_id, display_name in sink_obj.capture.display_names.items()]
+        await self.process_transcription_result(transcription_result, users=users)
+
+    async def process_transcription_result(self, transcription_result: dict, speaker: str = None,
+                                           users: list = None):
+        """
+        :param transcription_result: Result of the transcription
+        :param speaker: Display name of the speaker, in single speaker mode
+        :param users: (display name, Discord user ID) of the users whose audio was transcribed
+        """
         if transcription_result["success"]:
             LOGGER.info("Transcribing was successful.")
             timestamp = transcription_result["timestamp"]
             transcription = transcription_result["transcription"]
             segment = {
                 "timestamp": timestamp,
+                "users": users or []
             }
-            self.transcription_segments.append(segment)
             if self.single_speaker:
-                segment["speaker"] = self.speaker
+                speaker = speaker or self.speaker
+                segment["speaker"] = speaker
                 ts_str = time.strftime("%Y-%m-%d %H.%M:%S", time.localtime(timestamp))
-                transcription = f"[{ts_str}] <{self.speaker}>: {transcription}\n"
+                transcription = f"[{ts_str}] <{speaker}>: {transcription}\n"
             else:
                 transcription = f"{transcription}"
 
             segment["text"] = transcription
 
-            self.transcribe_tasks -= 1
+            self.turns.transcription_finished(segment)
         else:
             LOGGER.error(transcription_result["error"])
-            message = "There was an error with the transcription process."
+            message = TRANSCRIPTION_ERROR
+            self.turns.transcription_failed()
             await self.error_message(message)
-            self.transcribe_tasks = 0
-            self.get_response = False
-            self.transcription_segments = []
-            self.previous_silence_segments = []
-
-    async def check_response_flag(self):
-        self.checking_response_flag = True
-        while True:
-            if self.transcribe_tasks <= 0 and self.get_response:
-                sorted_segments = sorted(self.transcription_segments, key=lambda s: s["timestamp"])
-                file_timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-                filename = f"transcription_{file_timestamp}.txt"
-
-                final_transcription = ""
-                for seg in sorted_segments:
-                    final_transcription += f"{seg['text']}"
 
-                file_path = os.path.join(transcriptions_directory, filename)
+    def start_speculation(self, transcript: str):
+        """
+        Starts generating a response to the turn so far when the speakers pause and every transcription is done,
+        long before the turn is confirmed to have ended. The response is only used if the turn ends with the
+        same transcript, and is discarded if someone speaks again.
+        :param transcript: Transcript of the turn so far
+        """
+        if not self.config.get("speculative_responses", False):
+            return
+        if self.speculation is not None and self.speculation["transcript"] == transcript:
+            return
 
-                with open(file_path, "w", encoding="utf-8") as f:
-                    f.write(final_transcription)
+        self.cancel_speculation("the transcript changed")
+        LOGGER.info("Pause detected, generating a speculative response.")
+        self.speculation = {
+            "transcript": transcript,
+            "task": asyncio.create_task(self.speculative_response(transcript)),
+            "started": time.perf_counter()
+        }
 
-                LOGGER.info(f"Transcription saved at {file_path}.")
+    async def speculative_response(self, message: str) -> dict:
+        """Generates and synthesizes a response without adding it to the history or queueing it."""
+        ollama_result = await self.llm_scheduler.submit(self.ollama_client.ollama_chat, message, False, priority=VOICE)
+        if not ollama_result["success"]:
+            return ollama_result
+        tts_result = await self.synthesize(ollama_result["response"])
+        if not tts_result["success"]:
+            return {"success": False, "error": "There was an error in the TTS method."}
+        return {"success": True, "response": ollama_result["response"], "audio": [tts_result["audio"]],
+                "clips": [ollama_result["response"]]}
+
+    def cancel_speculation(self, reason: str):
+        if self.speculation is not None:
+            self.speculation["task"].cancel()
+            self.speculation = None
+            LOGGER.info(f"Discarded the speculative response, {reason}.")
+
+    async def commit_speculation(self, message: str) -> bool:
+        """
+        Uses the speculative response if it was generated for the final transcript of the turn.
+        :param message: Final transcript of the turn
+        :return: Whether the speculative response was used
+        """
+        speculation, self.speculation = self.speculation, None
+        if speculation is None:
+            return False
+        if speculation["transcript"] != message:
+            speculation["task"].cancel()
+            LOGGER.info("Discarded the speculative response, the final transcript is different.")
+            return False
+
+        confirmed = time.perf_counter()
+        group = self.start_response()
+        try:
+            result = await speculation["task"]
+            if not result["success"]:
+                LOGGER.error(f"Speculative response failed: {result['error']}")
+                return False
+
+            cache_entry = await self.ollama_client.commit(message, result["response"])
+            if cache_entry is not None:
+                ResponseCache.attach_clips(cache_entry, result["clips"])
+            timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+            file_path = os.path.join(llm_output_texts_directory, f"output_{timestamp}.txt")
+            with open(file_path, "w", encoding="utf-8") as f:
+                f.write(result["response"])
+            for clip in result["audio"]:
+                await self.queue_audio(clip, group=group)
+        finally:
+            self.finish_response(group)
+        LOGGER.info(f"Committed the speculative response, queued {time.perf_counter() - confirmed:.2f} s after the "
+                    f"end of the turn (started {confirmed - speculation['started']:.2f} s before it).")
+        return True
+
+    async def respond_to_turn(self, transcript: str, segments: list):
+        """
+        Responds to a finished turn, called by the turn-taking state machine.
+        :param transcript: Transcript of the turn
+        :param segments: Transcribed segments of the turn, with the users who spoke in "users"
+        """
+        ended = time.perf_counter()
+        file_timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        file_path = os.path.join(transcriptions_directory, f"transcription_{file_timestamp}.txt")
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(transcript)
+        LOGGER.info(f"Transcription saved at {file_path}.")
+
+        if self.config.get("voice_commands", False):
+            transcript = await self.run_voice_commands(transcript, segments, ended)
+            if not transcript:
+                self.cancel_speculation("the turn only had voice commands")
+                return
+        try:
+            if not await self.commit_speculation(transcript):
+                await self.transform_message(transcript)
+        except asyncio.CancelledError:
+            LOGGER.info("Stopped responding to the turn, a user barged in.")
 
-                await self.transform_message(final_transcription)
-                self.get_response = False
-                self.transcription_segments = []
-                self.previous_silence_segments = []
-            await asyncio.sleep(0.5)
+    def voice_command_speakers(self, segments: list) -> set:
+        """
+        The display names in a turn that may give voice commands: the ones that belong to a single Discord user
+        in the capture, whose ID is listed in voice_command_users. Nobody may if the list is empty.
+        :param segments: Transcribed segments of the turn
+        """
+        allowed = {str(user_id) for user_id in self.config.get("voice_command_users", [])}
+        user_ids = {}
+        for segment in segments:
+            for display_name, user_id in segment.get("users", []):
+                user_ids.setdefault(display_name, set()).add(str(user_id))
+        # A display name used by two people in the turn can't tell them apart.
+        return {display_name for display_name, ids in user_ids.items() if len(ids) == 1 and ids <= allowed}
+
+    async def run_voice_commands(self, transcript: str, segments: list, ended: float) -> str:
+        """
+        Carries out the moderation commands spoken in a turn without going through the LLM. Commands whose
+        username only matched approximately aren't carried out, the speaker is asked to say the exact name.
+        :param transcript: Transcript of the turn
+        :param segments: Transcribed segments of the turn, for who said what
+        :param ended: perf_counter time when the turn ended
+        :return: The rest of the transcript, for the LLM
+        """
+        result = self.voice_commands.match(transcript, self.voice_command_speakers(segments))
+        reports = []
+        for command in result["commands"]:
+            await self.mod_command(command["action"], command["target"],
+                                   reason=command.get("reason", "Voice command"), duration=command.get("duration"))
+            published = time.perf_counter() - ended
+            duration = f" for {command['duration']} s" if "duration" in command else ""
+            LOGGER.info(f"Voice command from {command['speaker']}: {command['action']} {command['target']}{duration} "
+                        f"(similarity {command['similarity']:.2f}), matched in {result['seconds'] * 1000:.1f} ms "
+                        f"and published {published * 1000:.1f} ms after the end of the turn.")
+            reports.append(f"Voice command: {command['action']} {command['target']}{duration}, "
+                           f"published {published * 1000:.1f} ms after the end of the turn.")
+        for command in result["unconfirmed"]:
+            LOGGER.info(f"Voice command from {command['speaker']}: {command['action']} {command['target']} not "
+                        f"carried out, the name only matched with similarity {command['similarity']:.2f}.")
+            reports.append(f"Voice command from {command['speaker']} not carried out: did you mean to "
+                           f"{command['action']} {command['target']}? Say the exact username to confirm.")
+        # Reported only once every command is published, so the Discord API doesn't hold the next one up.
+        for report in reports:
+            await self.logs_channel.send(report)
+        return result["remaining"]
 
     async def error_message(self, message):
         """
         Synthesize given error message to speech and add it to playback queue.
+        Error messages that are still queued are replaced by the new one.
         :param message: Error message
         :return: None
         """
-        tts_result = await asyncio.to_thread(self.tts.text_to_audio_file, message)
-        if tts_result["success"]:
-            await self.queue_audio(tts_result["output-path"])
+        group = self.start_response()
+        try:
+            tts_result = await self.synthesize(message)
+            if tts_result["success"]:
+                await self.queue_audio(tts_result["audio"], kind="error", group=group)
+        finally:
+            self.finish_response(group)
 
-    async def transform_message(self, message: str):
+    async def transform_message(self, message: str, priority: int = VOICE, key: str = None):
         """
         Calls Ollama to get a response to an input, synthesize it to speech and add it to playback queue.
+        A user barging in cancels it, see barge_in.
         :param message: Input for Ollama
+        :param priority: Priority of the LLM request, see LLMScheduler
+        :param key: LLM requests with the same key are coalesced while queued, and so is the queued audio
         :return: None
         """
-        ollama_result = await self.get_ollama_response(message)
+        started = time.perf_counter()
+        playback = {"priority": priority, "kind": key, "group": self.start_response()}
+        try:
+            await self.respond(message, priority, key, started, playback)
+        finally:
+            self.finish_response(playback["group"])
+
+    def start_response(self) -> int:
+        """
+        Opens a playback group for a response produced by the current task, which barge_in cancels.
+        :return: The group
+        """
+        group = self.playback.new_group()
+        self.responses[group] = asyncio.current_task()
+        return group
+
+    def finish_response(self, group: int):
+        """Closes a response's playback group once all of its clips are queued, or it was cancelled."""
+        self.responses.pop(group, None)
+        self.playback.close_group(group)
+
+    async def respond(self, message: str, priority: int, key: str, started: float, playback: dict):
+        """
+        Gets the response to an input and queues its audio, see transform_message.
+        :param message: Input for Ollama
+        :param priority: Priority of the LLM request, see LLMScheduler
+        :param key: Key the LLM request and the queued audio are coalesced by
+        :param started: perf_counter time of the request, for logging the time to first audio
+        :param playback: Arguments for queue_audio
+        """
+        if self.config.get("stream_responses", False):
+            ollama_result = await self.llm_scheduler.submit(self.stream_response, message, started, playback,
+                                                            priority=priority, key=key)
+            if ollama_result.get("streamed"):
+                await self.finish_streamed_response(message, ollama_result)
+                return
+        else:
+            ollama_result = await self.get_ollama_response(message, priority, key)
+        if ollama_result.get("dropped"):
+            return
+        await self.wait_for_tts()
 
         if ollama_result["success"]:
+            cache_entry = ollama_result.get("cache_entry")
+            if cache_entry is not None and cache_entry["clips"] and self.tts_cache is not None:
+                # The clips were synthesized before, their audio is in the TTS cache.
+                for text in cache_entry["clips"]:
+                    tts_result = await self.synthesize(text)
+                    if tts_result["success"]:
+                        await self.queue_audio(tts_result["audio"], **playback)
+                LOGGER.info(f"Cached response queued for playback {time.perf_counter() - started:.2f} s "
+                            f"after the request.")
+                return
+
             timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
             filename = f"output_{timestamp}.txt"
             file_path = os.path.join(llm_output_texts_directory, filename)
@@ -399,54 +1041,277 @@ class DiscordClient(commands.Bot):
             with open(file_path, "w", encoding="utf-8") as f:
                 f.write(ollama_result["response"])
 
-            tts_result = await asyncio.to_thread(self.tts.text_to_audio_file, ollama_result["response"])
+            tts_result = await self.synthesize(ollama_result["response"])
 
             if tts_result["success"]:
-                await self.queue_audio(tts_result["output-path"])
+                LOGGER.info(f"Response queued for playback {time.perf_counter() - started:.2f} s after the request.")
+                if cache_entry is not None:
+                    ResponseCache.attach_clips(cache_entry, [ollama_result["response"]])
+                await self.queue_audio(tts_result["audio"], **playback)
             else:
                 LOGGER.error("There was an error in the TTS method.")
         else:
             LOGGER.error(ollama_result["error"])
-            message = "There was an error creating a response."
+            message = RESPONSE_ERROR
             await self.error_message(message)
 
-    async def get_ollama_response(self, message: str) -> dict:
+    async def stream_response(self, message: str, started: float, playback: dict) -> dict:
+        """
+        Streams a response from Ollama and hands it to a synthesis task sentence by sentence, so that the first
+        sentence is already playing while the rest of the response is generated and synthesized.
+        Runs in the LLM scheduler, which is free again as soon as the stream has ended.
+        :param message: Input for Ollama
+        :param started: perf_counter time of the request, for logging the time to first audio
+        :param playback: Arguments for queue_audio
+        :return: Cached response, or a result with "streamed" set and the synthesis task in "synthesis"
+        """
+        cache_entry = await self.ollama_client.cached_response(message)
+        if cache_entry is not None:
+            return {"success": True, "response": cache_entry["response"], "cache_entry": cache_entry}
+
+        sentences = asyncio.Queue()
+        synthesis = asyncio.create_task(self.synthesize_sentences(sentences, started, playback))
+        splitter = SentenceSplitter()
+        response = ""
+        error = None
+        try:
+            async for chunk in self.ollama_client.ollama_chat_stream(message):
+                response += chunk
+                for sentence in splitter.feed(chunk):
+                    sentences.put_nowait(sentence)
+            rest = splitter.flush()
+            if rest:
+                sentences.put_nowait(rest)
+        except asyncio.CancelledError:
+            # The sentences that are left wouldn't be wanted either.
+            synthesis.cancel()
+            raise
+        except Exception as e:
+            error = e
+        finally:
+            sentences.put_nowait(None)
+
+        if error is not None and not response:
+            return {"success": False, "error": error}
+        return {"success": True, "streamed": True, "response": response, "error": error, "synthesis": synthesis}
+
+    async def finish_streamed_response(self, message: str, ollama_result: dict):
+        """Waits for the last sentences of a streamed response to be synthesized and stores the response."""
+        texts = await ollama_result["synthesis"]
+
+        if ollama_result["error"] is not None:
+            LOGGER.error(ollama_result["error"])
+        elif self.ollama_client.cache is not None:
+            cache_entry = self.ollama_client.cache.peek(message)
+            if cache_entry is not None:
+                ResponseCache.attach_clips(cache_entry, texts)
+
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        file_path = os.path.join(llm_output_texts_directory, f"output_{timestamp}.txt")
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(ollama_result["response"])
+
+    async def synthesize_sentences(self, sentences: asyncio.Queue, started: float, playback: dict):
+        """
+        Synthesizes sentences from the queue in order and adds them to the playback queue, until it gets None.
+        The sentences that arrived while the previous ones were synthesized are submitted together, so the TTS
+        service can batch them.
+        :param sentences: Queue of sentences of a streamed response
+        :param started: perf_counter time of the request, for logging the time to first audio
+        :param playback: Arguments for queue_audio
+        :return: The synthesized sentences, in order
+        """
+        texts = []
+        first = True
+        done = False
+        while not done:
+            batch = [await sentences.get()]
+            while not sentences.empty():
+                batch.append(sentences.get_nowait())
+            if None in batch:
+                done = True
+                batch = batch[:batch.index(None)]
+            tasks = [asyncio.create_task(self.synthesize(sentence)) for sentence in batch]
+            for sentence, task in zip(batch, tasks):
+                try:
+                    tts_result = await task
+                except asyncio.CancelledError:
+                    for pending in tasks:
+                        pending.cancel()
+                    raise
+                if tts_result["success"]:
+                    if first:
+                        LOGGER.info(f"First sentence queued for playback {time.perf_counter() - started:.2f} s "
+                                    f"after the request.")
+                        first = False
+                    texts.append(sentence)
+                    await self.queue_audio(tts_result["audio"], **playback)
+                else:
+                    LOGGER.error("There was an error in the TTS method.")
+        return texts
+
+    async def synthesize(self, text: str) -> dict:
+        """
+        Synthesizes text for playback in the voice channel, see TTSManager.text_to_pcm. Text that is in the TTS
+        cache isn't synthesized again, and new audio is added to the cache in the background.
+        The audio is also saved in the output directory if save_tts_output is set.
+        :return: Result dict with the playable audio in "audio"
+        """
+        await self.wait_for_tts()
+        key = None
+        if self.tts_cache is not None:
+            key = TTSCache.key(self.tts.model_id, text)
+            cached = await asyncio.to_thread(self.tts_cache.get, key)
+            if cached is not None:
+                return {"success": True, "pcm": cached["pcm"], "audio": cached["opus"] or cached["pcm"]}
+
+        tts_result = await self.tts_service.synthesize(text, self.config.get("save_tts_output", False))
+        if tts_result["success"]:
+            tts_result["audio"] = tts_result["pcm"]
+            if key is not None:
+                asyncio.create_task(asyncio.to_thread(self.cache_speech, key, tts_result["pcm"]))
+        return tts_result
+
+    def cache_speech(self, key: str, pcm: bytes):
+        """Encodes synthesized speech to Opus and stores it in the TTS cache, runs in a thread."""
+        self.tts_cache.put(key, pcm, encode_opus(pcm))
+
+    async def prewarm_tts_cache(self):
+        """Synthesizes the tts_cache_prewarm phrases that aren't cached yet once the TTS model is loaded."""
+        await self.wait_for_tts()
+        synthesized = 0
+        for phrase in self.config.get("tts_cache_prewarm", [TRANSCRIPTION_ERROR, RESPONSE_ERROR]):
+            key = TTSCache.key(self.tts.model_id, phrase)
+            if key in self.tts_cache:
+                continue
+            tts_result = await self.tts_service.synthesize(phrase)
+            if tts_result["success"]:
+                await asyncio.to_thread(self.cache_speech, key, tts_result["pcm"])
+                synthesized += 1
+        LOGGER.info(f"TTS cache prewarmed, synthesized {synthesized} phrases: {self.tts_cache.metrics()}")
+
+    async def get_ollama_response(self, message: str, priority: int = CHAT, key: str = None) -> dict:
+        """
+        Gets a response from the cache or from Ollama, through the LLM scheduler.
+        :param message: Input for Ollama
+        :param priority: Priority of the request, see LLMScheduler
+        :param key: Requests with the same key are coalesced while queued
+        :return: Result dict, with "dropped" set if the scheduler dropped the request
+        """
+        return await self.llm_scheduler.submit(self._ollama_response, message, priority=priority, key=key)
+
+    async def _ollama_response(self, message: str) -> dict:
+        cache_entry = await self.ollama_client.cached_response(message)
+        if cache_entry is not None:
+            return {"success": True, "response": cache_entry["response"], "cache_entry": cache_entry}
         ollama_response = await self.ollama_client.ollama_chat(message)
 
         return ollama_response
 
-    async def queue_audio(self, file_path: str):
-        """Add an audio file to the playback queue."""
-        await self.audio_queue.put(file_path)
+    async def stream_chat(self, ctx: commands.Context, message: str):
+        """
+        Replies to a text chat message right away and edits the reply as the response streams in from Ollama.
+        :param ctx: Context of the chat command
+        :param message: Input for Ollama
+        """
+        started = time.perf_counter()
+        reply = StreamingReply(ctx.reply, ctx.send, self.config.get("chat_edit_interval", 1.0), started)
+        await reply.start()
+        result = await self.llm_scheduler.submit(self._stream_chat, message, reply, priority=CHAT)
+        if not result["success"]:
+            LOGGER.error(result.get("error"))
+            stats = await reply.finish("There was an error creating a response for you.")
+        else:
+            stats = await reply.finish(result.get("response"))
+        if stats["first_visible"] is not None:
+            LOGGER.info(f"Chat reply: first text visible after {stats['first_visible']:.2f} s, done after "
+                        f"{time.perf_counter() - started:.2f} s with {stats['edits']} edits in "
+                        f"{stats['messages']} message(s).")
+
+    async def _stream_chat(self, message: str, reply: StreamingReply) -> dict:
+        cache_entry = await self.ollama_client.cached_response(message)
+        if cache_entry is not None:
+            return {"success": True, "response": cache_entry["response"]}
+        try:
+            async for chunk in self.ollama_client.ollama_chat_stream(message):
+                reply.feed(chunk)
+        except Exception as e:
+            if not reply.text:
+                return {"success": False, "error": e}
+            LOGGER.error(f"The chat response stream broke off: {e!r}")
+        return {"success": True, "response": reply.text}
 
-    async def play_audio(self, file_path):
+    async def queue_audio(self, audio: bytes | list | str, priority: int = VOICE, kind: str = None, group: int = None):
+        """
+        Add synthesized audio or an audio file to the playback queue, see PlaybackScheduler.put.
+        :param audio: Synthesized PCM, Opus packets or the path of an audio file
+        :param priority: Priority of the clip, see LLMScheduler
+        :param kind: A queued response of the same kind is replaced by this one
+        :param group: The response the clip belongs to
+        """
+        self.playback.put(audio, priority, kind, group)
+
+    async def play_audio(self, audio: bytes | str):
         if not self.vc.is_playing():
-            source = discord.FFmpegPCMAudio(file_path)
-            self.vc.play(source)
+            self.vc.play(audio_source(audio))
+
+    def detect_barge_in(self, user):
+        """
+        Stops the playback when a user starts speaking over the bot, if barge_in is set. Called by the recording
+        sinks from the recorder thread for every packet with voice in it, so the player stops at its next frame.
+        The rest of the response is dropped on the event loop by barge_in.
+        :param user: ID of the speaking user
+        """
+        if not self.config.get("barge_in", False) or self.vc is None or not self.vc.is_playing():
+            return
+        member = self.guild.get_member(int(user)) if self.guild is not None else None
+        if member is not None and member.bot:
+            return
+        self.interruption = {"user": user, "heard": time.perf_counter()}
+        self.vc.stop()
+        self.loop.call_soon_threadsafe(self.barge_in, user)
+
+    def barge_in(self, user):
+        """
+        Drops every response that is playing or queued, whatever it answers, and cancels the ones that are still
+        being generated or synthesized. Their groups are dropped too, so audio that is synthesized anyway isn't played.
+        """
+        flushed = self.playback.flush()
+        responses = list(self.responses.items())
+        for group, task in responses:
+            self.playback.drop(group)
+            task.cancel()
+        LOGGER.info(f"User {user} barged in, dropped {flushed} queued clips and cancelled {len(responses)} "
+                    f"responses.")
 
     async def _audio_player(self):
-        """Background task for playing queued audio files sequentially."""
+        """Background task for playing queued audio sequentially."""
         while True:
-            # Wait for the next file in the queue.
-            file_path = await self.audio_queue.get()
-            # Create the audio source.
-            source = discord.FFmpegPCMAudio(file_path)
+            # Wait for the next clip in the queue, expired clips are dropped on the way.
+            audio = (await self.playback.get())["audio"]
+            # Create the audio source, synthesized PCM is played straight from memory.
+            source = audio_source(audio)
 
-            # Create an asyncio.Event that we'll wait on until playback is finished.
-            finished = asyncio.Event()
+            # Create a future that we'll wait on until playback is finished, it gets the time playback stopped.
+            finished = self.loop.create_future()
 
             # Define a function to be run when playback is done.
             def after_playback(error):
+                stopped = time.perf_counter()
                 if error:
                     LOGGER.error(f"Playback error: {error}")
                 # Safely notify the main thread that playback is complete.
-                self.loop.call_soon_threadsafe(finished.set)
+                self.loop.call_soon_threadsafe(finished.set_result, stopped)
 
             # Begin playback. The callback is called when done.
             self.vc.play(source, after=after_playback)
 
             # Wait until the audio finishes playing.
-            await finished.wait()
+            stopped = await finished
+            interruption, self.interruption = self.interruption, None
+            if interruption is not None:
+                LOGGER.info(f"Barge-in: playback stopped {(stopped - interruption['heard']) * 1000:.1f} ms after "
+                            f"user {interruption['user']} started speaking.")
 
     async def stop_record(self):
         if self.guild.id in discord_client.connections:  # Check if the guild is in the cache.
@@ -456,28 +1321,35 @@ class DiscordClient(commands.Bot):
             await self.text_channel.respond(
                 "I am currently not recording here.")  # Respond with this if we aren't recording.
 
-    async def mod_timeout(self, target: str, *, reason: str = "Voice command"):
+    async def mod_command(self, action: str, target: str, *, reason: str = "Voice command", duration: int = None):
         """
-        Sends a timeout command for a Twitch user.
+        Publishes a moderation command for the Twitch bot.
+        :param action: "timeout" or "ban"
+        :param target: Twitch username
+        :param reason: Reason shown on Twitch
+        :param duration: Timeout length in seconds, the Twitch bot's timeout_duration if None
         """
         command = {
-            "action": "timeout",
+            "action": action,
             "target": target,
             "reason": reason
         }
+        if duration is not None:
+            command["duration"] = duration
         await self.redis_conn.publish("mod_commands", json.dumps(command))
+
+    async def mod_timeout(self, target: str, *, reason: str = "Voice command", duration: int = None):
+        """
+        Sends a timeout command for a Twitch user.
+        """
+        await self.mod_command("timeout", target, reason=reason, duration=duration)
         await self.logs_channel.send(f"Sent timeout command for {target}. Reason: {reason}")
 
     async def mod_ban(self, target: str, *, reason: str = "Voice command"):
         """
         Sends a ban command for a Twitch user.
         """
-        command = {
-            "action": "ban",
-            "target": target,
-            "reason": reason
-        }
-        await self.redis_conn.publish("mod_commands", json.dumps(command))
+        await self.mod_command("ban", target, reason=reason)
         await self.logs_channel.send(f"Sent ban command for {target}")
 
     async def dm_user(self, username: str, message: str):
@@ -510,12 +1382,7 @@ async def stop_recording(ctx: commands.Context):
 
 @discord_client.command()
 async def chat(ctx: commands.Context, *, message):
-    ollama_response = await discord_client.get_ollama_response(message)
-
-    if ollama_response["success"]:
-        await ctx.reply(ollama_response["response"])
-    else:
-        await ctx.reply("There was an error creating a response for you.")
+    await discord_client.stream_chat(ctx, message)
 
 @discord_client.slash_command(name="hello", description="Greets the user")
 async def hello(ctx: discord.ApplicationContext):
@@ -528,6 +1395,7 @@ async def leave(ctx: commands.Context):
         await discord_client.vc.disconnect()
         discord_client.vc = None
         del discord_client.connections[ctx.guild.id]
+        await discord_client.update_llm_session()
     else:
         await ctx.send("I am currently not in a voice channel.")
 
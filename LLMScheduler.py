@@ -0,0 +1,141 @@
+import asyncio
+import itertools
+import logging
+import time
+
+LOGGER: logging.Logger = logging.getLogger("LLMScheduler")
+
+# Priorities, lower runs first.
+VOICE = 0
+CHAT = 1
+GREETING = 2
+TWITCH = 3
+BACKGROUND = 4  # work nobody is waiting for, like summarizing the history
+PRIORITY_NAMES = {VOICE: "voice", CHAT: "chat", GREETING: "greeting", TWITCH: "twitch", BACKGROUND: "background"}
+
+
+class LLMScheduler:
+    """
+    Runs LLM requests through a priority queue with a bounded number of them in flight, so requests don't
+    hit Ollama concurrently and the conversation history is updated one response at a time. Voice replies
+    go before text chat, greetings and Twitch announcements, and background work runs last.
+
+    A request that waited longer than the maximum age of its priority is dropped when it comes up. A request
+    with the same key as one that is still queued is coalesced into it and dropped right away. Cancelling the
+    task waiting in submit skips the request, or stops it if it's already running.
+    """
+
+    def __init__(self, concurrency: int = 1, max_age: dict = None):
+        """
+        :param concurrency: Maximum number of requests running at the same time
+        :param max_age: Priority name -> seconds a request may wait before it's dropped, missing means no limit
+        """
+        self.concurrency = concurrency
+        self.max_age = max_age or {}
+        self.queue = asyncio.PriorityQueue()
+        self.queued = {}  # coalescing key -> queued job
+        self.running = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.waits = {name: [] for name in PRIORITY_NAMES.values()}  # recent queue waits in seconds
+        self._ids = itertools.count()
+        self._workers = []
+
+    def start(self):
+        for _ in range(self.concurrency):
+            self._workers.append(asyncio.create_task(self._work()))
+
+    def configure(self, max_age: dict = None):
+        if max_age is not None:
+            self.max_age = max_age
+
+    def queue_depth(self) -> int:
+        return self.queue.qsize()
+
+    def metrics(self) -> dict:
+        def percentile(values: list, q: float):
+            values = sorted(values)
+            return values[min(int(len(values) * q), len(values) - 1)] if values else None
+
+        return {
+            "queue_depth": self.queue_depth(),
+            "running": self.running,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "wait_p50": {name: percentile(waits, 0.5) for name, waits in self.waits.items()},
+            "wait_p95": {name: percentile(waits, 0.95) for name, waits in self.waits.items()}
+        }
+
+    async def submit(self, func, *args, priority: int = VOICE, key: str = None) -> dict:
+        """
+        Queues an LLM request and waits for its result.
+        :param func: Coroutine function making the request, returns a result dict
+        :param args: Arguments for func
+        :param priority: One of VOICE, CHAT, GREETING, TWITCH and BACKGROUND
+        :param key: Requests with the same key are coalesced while queued
+        :return: func's result, or a failed result with "dropped" set if the request went stale or was coalesced
+        """
+        if not self._workers:
+            self.start()
+        if key is not None and key in self.queued:
+            # The queued request does the same thing, so this one has nothing left to do.
+            self.coalesced += 1
+            LOGGER.info(f"Coalesced LLM request {key} with the one already queued.")
+            return {"success": False, "error": f"Coalesced with the queued {key} request.", "dropped": True}
+
+        job = {
+            "func": func,
+            "args": args,
+            "priority": priority,
+            "key": key,
+            "submitted": time.perf_counter(),
+            "future": asyncio.get_running_loop().create_future()
+        }
+        if key is not None:
+            self.queued[key] = job
+        self.queue.put_nowait((priority, next(self._ids), job))
+        try:
+            return await asyncio.shield(job["future"])
+        except asyncio.CancelledError:
+            # Nobody wants the result any more, so the request is skipped or stopped.
+            job["cancelled"] = True
+            if job.get("task") is not None:
+                job["task"].cancel()
+            raise
+
+    async def _work(self):
+        while True:
+            _, _, job = await self.queue.get()
+            if job["key"] is not None and self.queued.get(job["key"]) is job:
+                del self.queued[job["key"]]
+
+            if job.get("cancelled"):
+                continue
+
+            name = PRIORITY_NAMES.get(job["priority"], str(job["priority"]))
+            waited = time.perf_counter() - job["submitted"]
+            self.waits[name] = self.waits.get(name, [])[-199:] + [waited]
+            max_age = self.max_age.get(name)
+            if max_age is not None and waited > max_age:
+                self.dropped += 1
+                LOGGER.info(f"Dropped a stale {name} LLM request after waiting {waited:.2f} s.")
+                job["future"].set_result({"success": False, "error": f"Stale {name} request.", "dropped": True})
+                continue
+
+            LOGGER.info(f"Running a {name} LLM request after waiting {waited:.2f} s, "
+                        f"queue depth {self.queue_depth()}.")
+            self.running += 1
+            job["task"] = asyncio.create_task(job["func"](*job["args"]))
+            try:
+                result = await job["task"]
+            except asyncio.CancelledError:
+                if not job.get("cancelled"):
+                    raise
+                LOGGER.info(f"Cancelled a running {name} LLM request.")
+                result = {"success": False, "error": "Cancelled.", "dropped": True}
+            except Exception as e:
+                result = {"success": False, "error": e}
+            finally:
+                self.running -= 1
+            if not job["future"].done():
+                job["future"].set_result(result)
@@ -0,0 +1,105 @@
+import asyncio
+import contextlib
+import logging
+import time
+
+import numpy as np
+
+from SpeechToText import STTManager
+from SpeechToTextPool import STTWorkerPool
+from TextToSpeech import TTSManager
+
+LOGGER: logging.Logger = logging.getLogger("ModelLoader")
+
+
+class ModelLifecycle:
+    """
+    Loads the STT and TTS models in the background, runs a small warm-up inference on each so the first
+    real request doesn't pay for lazy initialisation, and exposes readiness. Every phase of the startup is
+    timed so the breakdown can be logged once everything is ready.
+    """
+
+    def __init__(self, started: float = None):
+        self.started = started if started is not None else time.perf_counter()
+        self.stt = None
+        self.stt_pool = None
+        self.tts = None
+        self.stt_ready = asyncio.Event()
+        self.tts_ready = asyncio.Event()
+        self.timings = {}  # phase -> seconds
+        self.task = None
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """Times a startup phase."""
+        phase_started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = time.perf_counter() - phase_started
+
+    def start(self, stt_workers: int = 0, quantize: bool = False, num_threads: int = None,
+              stt_pool_timeout: float = 300.0):
+        """
+        Starts loading both models in the background.
+        :param stt_workers: Number of STT worker processes, 0 runs Whisper in this process
+        :param quantize: Use the dynamically quantized int8 models
+        :param num_threads: Number of torch threads for inference, per STT worker when there are workers
+        :param stt_pool_timeout: Seconds the STT workers get to load, after that Whisper runs in this process
+        """
+        if self.task is None:
+            self.task = asyncio.create_task(self._load(stt_workers, quantize, num_threads, stt_pool_timeout))
+            self.task.add_done_callback(self._log_failure)
+        return self.task
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            LOGGER.error(f"Loading the models failed: {task.exception()}")
+
+    @property
+    def ready(self) -> bool:
+        return self.stt_ready.is_set() and self.tts_ready.is_set()
+
+    async def wait_ready(self):
+        await asyncio.gather(self.stt_ready.wait(), self.tts_ready.wait())
+
+    async def _load(self, stt_workers: int, quantize: bool, num_threads: int, stt_pool_timeout: float):
+        await asyncio.gather(self._load_stt(stt_workers, quantize, num_threads, stt_pool_timeout),
+                             self._load_tts(quantize, num_threads))
+        self.timings["until_ready"] = time.perf_counter() - self.started
+        LOGGER.info("Startup timing: " + ", ".join(f"{name} {seconds:.2f} s" for name, seconds in self.timings.items()))
+
+    async def _load_stt(self, stt_workers: int, quantize: bool, num_threads: int, stt_pool_timeout: float):
+        warm_up = np.zeros(16000, dtype=np.float32)
+        pool = None
+        if stt_workers > 0:
+            with self.phase("stt_load"):
+                pool = STTWorkerPool(stt_workers, quantize=quantize, num_threads=num_threads)
+                pool.start()
+                if not await asyncio.to_thread(pool.wait_ready, stt_pool_timeout):
+                    LOGGER.error("The STT workers didn't become ready, running Whisper in this process instead.")
+                    pool.close()
+                    pool = None
+        if pool is not None:
+            with self.phase("stt_warm_up"):
+                # One job per worker, so that each of them gets warmed up.
+                await asyncio.gather(*(pool.transcribe_array(warm_up) for _ in range(stt_workers)))
+            self.stt_pool = pool
+        else:
+            with self.phase("stt_load"):
+                stt = await asyncio.to_thread(STTManager, quantize=quantize, num_threads=num_threads)
+            with self.phase("stt_warm_up"):
+                await asyncio.to_thread(stt.transcribe_array, warm_up)
+            self.stt = stt
+        LOGGER.info("STT model is ready.")
+        self.stt_ready.set()
+
+    async def _load_tts(self, quantize: bool, num_threads: int):
+        with self.phase("tts_load"):
+            tts = await asyncio.to_thread(TTSManager, quantize, num_threads)
+        with self.phase("tts_warm_up"):
+            await asyncio.to_thread(tts.text_to_audio, "Hello.")
+        self.tts = tts
+        LOGGER.info("TTS model is ready.")
+        self.tts_ready.set()
@@ -1,10 +1,20 @@
 import asyncio
+import logging
+import os
+import re
+import time
 
-from ollama import chat, ChatResponse, AsyncClient
+from ollama import chat, ChatResponse
 import dotenv
 import json
 
+from ConversationHistory import ConversationHistory
+from LLMScheduler import BACKGROUND
+from OllamaPool import OllamaPool
+from ResponseCache import ResponseCache
+
 dotenv.load_dotenv()
+LOGGER: logging.Logger = logging.getLogger("OllamaChat")
 
 # system_message = (
 #     "You are to respond ONLY in valid JSON format. "
@@ -29,29 +39,236 @@ system_message = (
 )
 
 
+ABBREVIATIONS = {"mr.", "mrs.", "ms.", "dr.", "prof.", "st.", "vs.", "etc.", "e.g.", "i.e.", "a.m.", "p.m."}
+SENTENCE_END = re.compile(r"[.!?…]+[\"')\]]*\s+|\n+")
+
+
+class SentenceSplitter:
+    """
+    Splits streamed text into sentences as the chunks arrive. A sentence is only returned once the
+    whitespace after its punctuation has been seen, so a chunk ending in "3." doesn't cut "3.5" in two.
+    Sentences shorter than min_length are joined with the next one, so the TTS doesn't get fragments.
+    """
+
+    def __init__(self, min_length: int = 20):
+        self.min_length = min_length
+        self.buffer = ""
+
+    def feed(self, chunk: str) -> list:
+        """
+        :param chunk: Next piece of the streamed text
+        :return: Sentences completed by the chunk
+        """
+        self.buffer += chunk
+        sentences = []
+        start = 0
+        for match in SENTENCE_END.finditer(self.buffer):
+            sentence = self.buffer[start:match.end()].strip()
+            words = sentence.split()
+            if len(sentence) < self.min_length or (words and words[-1].lower() in ABBREVIATIONS):
+                continue
+            sentences.append(sentence)
+            start = match.end()
+        self.buffer = self.buffer[start:]
+        return sentences
+
+    def flush(self) -> str | None:
+        """Returns whatever is left once the stream has ended."""
+        rest = self.buffer.strip()
+        self.buffer = ""
+        return rest or None
+
+
 class OllamaClient:
-    def __init__(self):
-        self.client = AsyncClient(
-            host='http://localhost:11434',
-        )
-        self.messages = [
-            {
-                "role": "system",
-                "content": system_message
-            }
-        ]
-
-    async def ollama_chat(self, message) -> dict:
+    def __init__(self, max_history_tokens: int = 2048, recent_turns: int = 6, hosts: list = None,
+                 timeout: float = 60):
+        """
+        :param max_history_tokens: Token budget of the conversation history, None keeps the whole history
+        :param recent_turns: Number of most recent messages that are never summarized
+        :param hosts: Ollama URLs, by default the comma-separated OLLAMA_HOSTS environment variable
+        :param timeout: Seconds a request may wait for a host before it is tried on another one
+        """
+        if hosts is None:
+            hosts = os.getenv("OLLAMA_HOSTS", "http://localhost:11434").split(",")
+        self.client = OllamaPool(hosts, timeout)
+        self.model = 'llama3.2:3b'
+        self.history = ConversationHistory(system_message, max_history_tokens, recent_turns)
+        self.last_call = {}  # stats of the latest call, see log_call
+        self.cache = None
+        self.embedding_model = None
+        self.scheduler = None  # LLMScheduler that summaries wait in, so they don't run next to the replies
+        self.keep_alive = None  # sent with every request, None leaves it to the Ollama server
+        self.keep_warm = None  # keep-alive task of the voice session
+
+    async def preload(self, keep_alive=None):
+        """
+        Loads the model on the Ollama hosts so that the first response doesn't have to wait for it.
+        :param keep_alive: How long the model should stay loaded, None leaves it to the Ollama server
+        """
+        started = time.perf_counter()
+        load_times = await self.client.load(self.model, keep_alive)
+        LOGGER.info(f"Preloaded {self.model} in {time.perf_counter() - started:.2f} s: " +
+                    ", ".join(f"{url} {'failed' if seconds is None else f'{seconds:.2f} s'}"
+                              for url, seconds in load_times.items()))
+
+    def start_session(self, keep_alive: str = "10m", interval: float = 240):
+        """
+        Keeps the model loaded while a voice session is active, by sending every request with keep_alive and
+        refreshing it every interval seconds even when nobody talks.
+        :param keep_alive: How long the model stays loaded after each request or refresh
+        :param interval: Seconds between refreshes, shorter than keep_alive
+        """
+        self.keep_alive = keep_alive
+        if self.keep_warm is None:
+            LOGGER.info("Voice session started, keeping the model loaded.")
+            self.keep_warm = asyncio.create_task(self._keep_warm(interval))
+
+    async def end_session(self):
+        """Stops the keep-alive refreshes and unloads the model."""
+        if self.keep_warm is None:
+            return
+        self.keep_warm.cancel()
+        self.keep_warm = None
+        self.keep_alive = None
+        await self.client.load(self.model, 0)
+        LOGGER.info("Voice session ended, released the model.")
+
+    async def _keep_warm(self, interval: float):
+        while True:
+            await self.preload(self.keep_alive)
+            await asyncio.sleep(interval)
+
+    def enable_cache(self, max_entries: int = 256, ttl: float = 3600, similarity_threshold: float = 0.92,
+                     embedding_model: str = None, min_words: int = 4, templates=()):
+        """
+        Puts a response cache in front of the LLM.
+        :param max_entries: Maximum number of cached responses
+        :param ttl: Seconds a response stays valid
+        :param similarity_threshold: Minimum cosine similarity of a semantic match
+        :param embedding_model: Ollama model for the semantic matches, None only matches exactly
+        :param min_words: Inputs with fewer words aren't cached
+        :param templates: Regular expressions of templated inputs, which are only matched exactly
+        """
+        self.embedding_model = embedding_model
+        self.cache = ResponseCache(max_entries, ttl, similarity_threshold, self.embed if embedding_model else None,
+                                   min_words, templates)
+
+    async def embed(self, text: str) -> list:
+        response = await self.client.embed(model=self.embedding_model, input=text)
+        return response.embeddings[0]
+
+    async def cached_response(self, message) -> dict | None:
+        """
+        Looks up a cached response to a message. A hit is added to the history like any other response.
+        :param message: Input for Ollama
+        :return: The cache entry, with the response in "response", or None
+        """
+        if self.cache is None:
+            return None
+        entry = await self.cache.lookup(message)
+        if entry is not None:
+            self.history.add({'role': 'user', 'content': message})
+            self.history.add({'role': 'assistant', 'content': entry["response"]}, self.summarize)
+        return entry
+
+    async def ollama_chat(self, message, commit: bool = True) -> dict:
+        """
+        :param message: Input for Ollama
+        :param commit: Add the message and the response to the history and the cache. Without it the
+            response is speculative and only kept if commit is called with it later.
+        :return: Result dict with the response in "response"
+        """
         ollama_message = {
             'role': 'user',
             'content': message
         }
-        self.messages.append(ollama_message)
+        messages = self.history.messages(ollama_message)
 
         try:
-            response: ChatResponse = await self.client.chat(model='llama3.2:3b', messages=self.messages)
-            self.messages.append({'role': 'assistant', 'content': response.message.content})
+            started = time.perf_counter()
+            response: ChatResponse = await self.client.chat(model=self.model, messages=messages,
+                                                            keep_alive=self.keep_alive)
+            self.log_call(messages, response, time.perf_counter() - started)
 
-            return {"success": True, "response": response.message.content}
+            result = {"success": True, "response": response.message.content}
+            if commit:
+                result["cache_entry"] = await self.commit(message, response.message.content)
+            return result
         except Exception as e:
             return {"success": False, "error": e}
+
+    async def ollama_chat_stream(self, message):
+        """
+        Streams the response to a message as it is generated. The message and the response are added to the
+        history, and to the cache if there is one, once the stream has ended.
+        :param message: Input for Ollama
+        :return: Async iterator of response text chunks
+        """
+        ollama_message = {
+            'role': 'user',
+            'content': message
+        }
+        messages = self.history.messages(ollama_message)
+
+        started = time.perf_counter()
+        response = ""
+        async for part in await self.client.chat(model=self.model, messages=messages, stream=True,
+                                                  keep_alive=self.keep_alive):
+            response += part.message.content
+            if part.done:
+                self.log_call(messages, part, time.perf_counter() - started)
+            yield part.message.content
+        await self.commit(message, response)
+
+    async def commit(self, message, response: str) -> dict | None:
+        """
+        Adds a message and its response to the history, and to the cache if there is one.
+        :return: The cache entry, None without a cache
+        """
+        self.history.add({'role': 'user', 'content': message})
+        self.history.add({'role': 'assistant', 'content': response}, self.summarize)
+        if self.cache is not None:
+            return await self.cache.store(message, response)
+        return None
+
+    async def summarize(self, prompt: str) -> str:
+        """
+        Runs a one-off completion outside of the conversation, used for summarizing the history. With a scheduler
+        it runs at background priority, after every reply that is waiting.
+        """
+        if self.scheduler is None:
+            result = await self._complete(prompt)
+        else:
+            result = await self.scheduler.submit(self._complete, prompt, priority=BACKGROUND, key="summary")
+        if not result["success"]:
+            raise RuntimeError(result["error"])
+        return result["response"]
+
+    async def _complete(self, prompt: str) -> dict:
+        response: ChatResponse = await self.client.chat(model=self.model, messages=[{'role': 'user', 'content': prompt}],
+                                                        keep_alive=self.keep_alive)
+        return {"success": True, "response": response.message.content}
+
+    def log_call(self, messages: list, response: ChatResponse, elapsed: float):
+        """
+        Logs the prompt size and the timings Ollama reports for a call, and calibrates the history's token
+        estimate with the prompt token count.
+        """
+        self.history.calibrate(messages, response.prompt_eval_count)
+        self.last_call = {
+            "messages": len(messages),
+            "estimated_tokens": self.history.estimate_tokens(messages),
+            "prompt_tokens": response.prompt_eval_count,
+            "prompt_seconds": (response.prompt_eval_duration or 0) / 1e9,
+            "load_seconds": (response.load_duration or 0) / 1e9,
+            "generated_tokens": response.eval_count,
+            "generation_seconds": (response.eval_duration or 0) / 1e9,
+            "seconds": elapsed
+        }
+        LOGGER.info(f"Ollama call: model loaded in {self.last_call['load_seconds']:.2f} s, "
+                    f"{self.last_call['prompt_tokens']} prompt tokens from {len(messages)} messages "
+                    f"in {self.last_call['prompt_seconds']:.2f} s, {self.last_call['generated_tokens']} tokens "
+                    f"generated in {self.last_call['generation_seconds']:.2f} s, {elapsed:.2f} s in total.")
+        if self.last_call["load_seconds"] > 0.5:
+            LOGGER.warning(f"Cold start: the model had to be loaded for this call "
+                           f"({self.last_call['load_seconds']:.2f} s).")
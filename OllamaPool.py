@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import time
+
+import httpx
+from ollama import AsyncClient, ResponseError
+
+LOGGER: logging.Logger = logging.getLogger("OllamaPool")
+
+# A host that already has the model loaded is still preferred while it has up to this many more requests
+# in flight than a host that would have to load it first.
+COLD_PENALTY = 2
+
+
+def is_host_failure(error: Exception) -> bool:
+    """Whether an error means the host is down or overloaded, rather than that the request was bad."""
+    if isinstance(error, ResponseError):
+        return error.status_code >= 500
+    return isinstance(error, (ConnectionError, httpx.TransportError, asyncio.TimeoutError, OSError))
+
+
+class OllamaHost:
+    def __init__(self, url: str, timeout: float):
+        self.url = url
+        self.client = AsyncClient(host=url, timeout=timeout)
+        self.in_flight = 0
+        self.healthy = True
+        self.ejected_at = None
+        self.warm_models = set()
+        self.calls = 0
+        self.failures = 0
+        self.latency = None  # moving average of call durations in seconds
+
+    def load_score(self, model: str) -> tuple:
+        cold = 0 if model in self.warm_models else COLD_PENALTY
+        return self.in_flight + cold, self.latency or 0.0
+
+    def record_success(self, model: str, seconds: float):
+        self.calls += 1
+        self.warm_models.add(model)
+        self.latency = seconds if self.latency is None else 0.8 * self.latency + 0.2 * seconds
+
+
+class OllamaPool:
+    """
+    Routes Ollama requests to the least loaded healthy host out of several, preferring the hosts that already
+    have the model loaded. A host whose request fails with a connection error, a timeout or a server error is
+    ejected and the request is retried on another host. Ejected hosts are probed in the background and put
+    back once they answer again. The probes also refresh which models each host has loaded.
+
+    The methods mirror the AsyncClient methods OllamaClient uses.
+    """
+
+    def __init__(self, hosts: list, timeout: float = 60, probe_interval: float = 10):
+        """
+        :param hosts: Ollama URLs
+        :param timeout: Seconds a request may wait for the host before it counts as failed
+        :param probe_interval: Seconds between health probes
+        """
+        self.hosts = [OllamaHost(url.strip(), timeout) for url in hosts if url.strip()]
+        self.probe_interval = probe_interval
+        self._prober = None
+
+    def _ensure_probing(self):
+        if self._prober is None:
+            self._prober = asyncio.create_task(self._probe_loop())
+
+    def metrics(self) -> dict:
+        return {
+            host.url: {
+                "healthy": host.healthy,
+                "in_flight": host.in_flight,
+                "calls": host.calls,
+                "failures": host.failures,
+                "latency": host.latency,
+                "warm_models": sorted(host.warm_models)
+            }
+            for host in self.hosts
+        }
+
+    def pick(self, model: str, exclude=()) -> OllamaHost | None:
+        """
+        The healthy host with the fewest requests in flight, counting a cold model as extra load. Ejected hosts
+        are only used when no healthy one is left.
+        """
+        candidates = [host for host in self.hosts if host not in exclude]
+        healthy = [host for host in candidates if host.healthy]
+        if healthy:
+            return min(healthy, key=lambda host: host.load_score(model))
+        if candidates:
+            return min(candidates, key=lambda host: host.ejected_at or 0.0)
+        return None
+
+    def eject(self, host: OllamaHost, error: Exception):
+        host.failures += 1
+        host.warm_models.clear()
+        if host.healthy:
+            host.healthy = False
+            host.ejected_at = time.time()
+            LOGGER.warning(f"Ejected Ollama host {host.url}: {error!r}")
+
+    def restore(self, host: OllamaHost):
+        if not host.healthy:
+            host.healthy = True
+            LOGGER.info(f"Ollama host {host.url} is back after {time.time() - host.ejected_at:.1f} s.")
+            host.ejected_at = None
+
+    async def _request(self, model: str, request):
+        """Runs request(host) on the best host, failing over to the others on host failures."""
+        self._ensure_probing()
+        tried = []
+        while True:
+            host = self.pick(model, tried)
+            if host is None:
+                raise ConnectionError(f"None of the Ollama hosts could take the request ({len(tried)} tried).")
+            tried.append(host)
+            host.in_flight += 1
+            started = time.perf_counter()
+            try:
+                result = await request(host)
+            except Exception as e:
+                if not is_host_failure(e):
+                    raise
+                self.eject(host, e)
+                continue
+            finally:
+                host.in_flight -= 1
+            host.record_success(model, time.perf_counter() - started)
+            self.restore(host)
+            return result
+
+    async def chat(self, model: str = '', messages: list = None, stream: bool = False, **kwargs):
+        if stream:
+            return self._chat_stream(model, messages, **kwargs)
+        return await self._request(model, lambda host: host.client.chat(model=model, messages=messages, **kwargs))
+
+    async def _chat_stream(self, model: str, messages: list, **kwargs):
+        """
+        Streams a chat response. The request fails over to another host only until the first part has arrived,
+        after that a failure is raised to the caller.
+        """
+        self._ensure_probing()
+        tried = []
+        while True:
+            host = self.pick(model, tried)
+            if host is None:
+                raise ConnectionError(f"None of the Ollama hosts could take the request ({len(tried)} tried).")
+            tried.append(host)
+            host.in_flight += 1
+            started = time.perf_counter()
+            received = False
+            try:
+                async for part in await host.client.chat(model=model, messages=messages, stream=True, **kwargs):
+                    received = True
+                    yield part
+            except Exception as e:
+                if not is_host_failure(e):
+                    raise
+                self.eject(host, e)
+                if received:
+                    raise
+                continue
+            finally:
+                host.in_flight -= 1
+            host.record_success(model, time.perf_counter() - started)
+            self.restore(host)
+            return
+
+    async def embed(self, model: str = '', input='', **kwargs):
+        return await self._request(model, lambda host: host.client.embed(model=model, input=input, **kwargs))
+
+    async def load(self, model: str, keep_alive) -> dict:
+        """
+        Loads a model on every healthy host, or unloads it when keep_alive is 0.
+        :param model: Model name
+        :param keep_alive: How long the hosts should keep the model loaded, in seconds or as a duration like "10m"
+        :return: Host URL -> seconds the host spent loading the model, None if the request failed
+        """
+        self._ensure_probing()
+
+        async def load_on(host: OllamaHost):
+            try:
+                response = await host.client.chat(model=model, messages=[], keep_alive=keep_alive)
+            except Exception as e:
+                if is_host_failure(e):
+                    self.eject(host, e)
+                LOGGER.error(f"Loading {model} on {host.url} failed: {e!r}")
+                return None
+            if keep_alive == 0:
+                host.warm_models.discard(model)
+            else:
+                host.warm_models.add(model)
+            return (response.load_duration or 0) / 1e9
+
+        hosts = [host for host in self.hosts if host.healthy]
+        results = await asyncio.gather(*(load_on(host) for host in hosts))
+        return {host.url: seconds for host, seconds in zip(hosts, results)}
+
+    async def probe(self, host: OllamaHost) -> bool:
+        """Checks that a host answers and refreshes the models it has loaded."""
+        try:
+            response = await host.client.ps()
+        except Exception as e:
+            if host.healthy:
+                self.eject(host, e)
+            return False
+        host.warm_models = {model.model or model.name for model in response.models}
+        self.restore(host)
+        return True
+
+    async def _probe_loop(self):
+        while True:
+            await asyncio.sleep(self.probe_interval)
+            await asyncio.gather(*(self.probe(host) for host in self.hosts))
@@ -0,0 +1,186 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+from LLMScheduler import VOICE, PRIORITY_NAMES
+
+LOGGER: logging.Logger = logging.getLogger("PlaybackScheduler")
+
+
+class PlaybackScheduler:
+    """
+    Decides what the bot says next. Every clip is queued with a priority and an expiry, lower priorities play
+    first and clips of the same priority play in the order they were queued. A clip that is still queued when
+    it expires is dropped instead of played, together with the rest of its response.
+
+    The clips of one response share a group. Once a response has started playing its remaining clips no longer
+    expire, so a long response isn't cut off halfway. Clips can have a kind, like "error" or a greeting for a
+    member, and a response of the same kind as one that is still queued replaces it.
+
+    A group is open from new_group until its producer calls close_group or the response is dropped. Clips are
+    only accepted for open groups, so the rest of a dropped response is discarded however late it arrives.
+    """
+
+    def __init__(self, max_age: dict = None):
+        """
+        :param max_age: Priority name -> seconds a clip may wait before it expires, missing means no limit
+        """
+        self.max_age = max_age or {}
+        self.heap = []
+        self.kinds = {}  # kind -> group of the queued clips of that kind
+        self.depth = 0  # queued clips that will still be played or expire
+        self.playing_group = None
+        self.open_groups = set()  # groups that can still get clips
+        self.played = 0
+        self.expired = 0
+        self.coalesced = 0
+        self.ages = {name: [] for name in PRIORITY_NAMES.values()}  # recent ages at play time in seconds
+        self.depths = []  # recent queue depths at play time
+        self._ids = itertools.count()
+        self._groups = itertools.count()
+        self._available = asyncio.Event()
+
+    def configure(self, max_age: dict = None):
+        if max_age is not None:
+            self.max_age = max_age
+
+    def new_group(self) -> int:
+        """A group for the clips of one response, open until close_group is called."""
+        group = next(self._groups)
+        self.open_groups.add(group)
+        return group
+
+    def close_group(self, group: int):
+        """Called by the producer of a response once it has queued all of its clips."""
+        self.open_groups.discard(group)
+
+    def queue_depth(self) -> int:
+        return self.depth
+
+    def metrics(self) -> dict:
+        def percentile(values: list, q: float):
+            values = sorted(values)
+            return values[min(int(len(values) * q), len(values) - 1)] if values else None
+
+        return {
+            "queue_depth": self.queue_depth(),
+            "played": self.played,
+            "expired": self.expired,
+            "coalesced": self.coalesced,
+            "depth_p95": percentile(self.depths, 0.95),
+            "age_p50": {name: percentile(ages, 0.5) for name, ages in self.ages.items()},
+            "age_p95": {name: percentile(ages, 0.95) for name, ages in self.ages.items()}
+        }
+
+    def put(self, audio, priority: int = VOICE, kind: str = None, group: int = None, max_age: float = None):
+        """
+        Queues a clip.
+        :param audio: The clip, passed on to the player as it is
+        :param priority: One of LLMScheduler's priorities, lower plays first
+        :param kind: A queued response of the same kind is replaced by this one
+        :param group: Open group of the response the clip belongs to, see new_group, a clip of its own if None
+        :param max_age: Seconds the clip may wait, the maximum age of its priority by default
+        """
+        if group is None:
+            group = self.new_group()
+        elif group not in self.open_groups:
+            LOGGER.info("Dropped a clip of a response that was already dropped or finished.")
+            return
+
+        name = PRIORITY_NAMES.get(priority, str(priority))
+        if max_age is None:
+            max_age = self.max_age.get(name)
+        queued = time.perf_counter()
+        item = {
+            "audio": audio,
+            "priority": priority,
+            "name": name,
+            "kind": kind,
+            "group": group,
+            "queued": queued,
+            "expires": queued + max_age if max_age is not None else None
+        }
+
+        if kind is not None:
+            previous = self.kinds.get(kind)
+            if previous is not None and previous != group and previous != self.playing_group:
+                removed = self._drop_group(previous)
+                if removed:
+                    self.coalesced += removed
+                    LOGGER.info(f"Replaced {removed} queued {kind} clip(s) with a newer response.")
+            self.kinds[kind] = group
+
+        heapq.heappush(self.heap, (priority, next(self._ids), item))
+        self.depth += 1
+        self._available.set()
+
+    def flush(self) -> int:
+        """
+        Drops every queued clip, and the clips that are still to come for their responses, including the one
+        that is playing.
+        :return: Number of clips dropped
+        """
+        flushed = self.depth
+        for _, _, item in self.heap:
+            self.open_groups.discard(item["group"])
+        self.open_groups.discard(self.playing_group)
+        self.playing_group = None
+        self.heap = []
+        self.kinds = {}
+        self.depth = 0
+        self._available.clear()
+        return flushed
+
+    def drop(self, group: int) -> int:
+        """
+        Drops a response, its queued clips and the ones that are still to come, even if it is playing.
+        :param group: The response's group
+        :return: Number of clips dropped
+        """
+        if group == self.playing_group:
+            self.playing_group = None
+        return self._drop_group(group)
+
+    def _drop_group(self, group: int) -> int:
+        removed = 0
+        for _, _, item in self.heap:
+            if item["group"] == group and not item.get("dropped"):
+                item["dropped"] = True
+                removed += 1
+        self.depth -= removed
+        self.open_groups.discard(group)
+        self.kinds = {kind: queued for kind, queued in self.kinds.items() if queued != group}
+        return removed
+
+    async def get(self) -> dict:
+        """
+        Waits for the next clip to play, dropping the ones that expired.
+        :return: The clip's item, with the audio in "audio"
+        """
+        while True:
+            while not self.heap:
+                self._available.clear()
+                await self._available.wait()
+            _, _, item = heapq.heappop(self.heap)
+            if item.get("dropped"):
+                continue
+            self.depth -= 1
+            if item["kind"] is not None and self.kinds.get(item["kind"]) == item["group"]:
+                if not any(queued["group"] == item["group"] for _, _, queued in self.heap):
+                    del self.kinds[item["kind"]]
+
+            now = time.perf_counter()
+            age = now - item["queued"]
+            if item["expires"] is not None and now > item["expires"] and item["group"] != self.playing_group:
+                self.expired += 1 + self._drop_group(item["group"])
+                LOGGER.info(f"Dropped an expired {item['name']} clip after {age:.2f} s, and the rest of its response.")
+                continue
+
+            self.playing_group = item["group"]
+            self.played += 1
+            self.ages[item["name"]] = self.ages.get(item["name"], [])[-199:] + [age]
+            self.depths = self.depths[-199:] + [self.depth]
+            LOGGER.info(f"Playing a {item['name']} clip queued {age:.2f} s ago, queue depth {self.depth}.")
+            return item
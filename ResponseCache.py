@@ -0,0 +1,168 @@
+import logging
+import re
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+LOGGER: logging.Logger = logging.getLogger("ResponseCache")
+
+# "[2025-05-12 13.59:53] " before the speaker at the start of a transcribed line
+TRANSCRIPT_TIMESTAMP = re.compile(r"^\s*\[[^\]]*\]\s*(?=<[^>]*>:)", re.MULTILINE)
+SPEAKER = re.compile(r"<([^>]*)>")
+
+
+def normalize(message: str) -> str:
+    """
+    Drops the timestamps of transcribed lines, punctuation, case and extra whitespace. The speakers are kept as
+    "<name>", the same question from someone else can need another answer.
+    """
+    message = TRANSCRIPT_TIMESTAMP.sub("", message)
+    message = re.sub(r"[^\w\s'<>]", " ", message.lower())
+    return " ".join(message.split())
+
+
+def speakers(key: str) -> tuple:
+    """The speakers of a normalized input."""
+    return tuple(sorted(set(SPEAKER.findall(key))))
+
+
+class ResponseCache:
+    """
+    Caches LLM responses by their input. An exact match on the normalized input is tried first. If there is
+    an embedding function, inputs whose embedding is close enough to a cached one from the same speakers are
+    matched too. Entries are evicted least recently used first and expire after ttl seconds.
+
+    Short inputs like "yes" or "why?" depend on the conversation, so they are never cached. Inputs matching one
+    of the templates, like a greeting for a member, only differ by a name that embeddings hardly tell apart,
+    so they are only matched exactly.
+
+    An entry also remembers the texts its response was synthesized in, one per clip, so a hit can find the
+    audio in the TTS cache. The audio itself isn't kept in memory.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 3600, similarity_threshold: float = 0.92, embed=None,
+                 min_words: int = 4, templates=()):
+        """
+        :param max_entries: Maximum number of cached responses
+        :param ttl: Seconds a response stays valid
+        :param similarity_threshold: Minimum cosine similarity of a semantic match
+        :param embed: Coroutine function that returns the embedding of a text, None only matches exactly
+        :param min_words: Inputs with fewer words aren't cached
+        :param templates: Regular expressions of templated inputs, which are only matched exactly
+        """
+        self.max_entries = max_entries
+        self.min_words = min_words
+        self.templates = [re.compile(template) for template in templates]
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.embed = embed
+        self.entries = OrderedDict()  # normalized input -> entry, least recently used first
+        self.embeddings = OrderedDict()  # embeddings computed by lookups, reused when the response is stored
+        self.hits = {"exact": 0, "semantic": 0}
+        self.misses = 0
+        self.skipped = 0
+
+    def metrics(self) -> dict:
+        lookups = self.hits["exact"] + self.hits["semantic"] + self.misses
+        return {
+            "entries": len(self.entries),
+            "exact_hits": self.hits["exact"],
+            "semantic_hits": self.hits["semantic"],
+            "misses": self.misses,
+            "skipped": self.skipped,
+            "hit_rate": (lookups - self.misses) / lookups if lookups else None
+        }
+
+    def _expire(self):
+        now = time.time()
+        for key in [key for key, entry in self.entries.items() if now - entry["created"] > self.ttl]:
+            del self.entries[key]
+
+    def cacheable(self, key: str) -> bool:
+        return len(SPEAKER.sub(" ", key).split()) >= self.min_words
+
+    def templated(self, message: str) -> bool:
+        return any(template.search(message) for template in self.templates)
+
+    async def _embedding(self, key: str) -> np.ndarray | None:
+        if self.embed is None:
+            return None
+        if key in self.embeddings:
+            return self.embeddings[key]
+        try:
+            embedding = np.asarray(await self.embed(key), dtype=np.float32)
+        except Exception as e:
+            LOGGER.error(f"Embedding the input failed, only exact matches are used: {e}")
+            return None
+        embedding /= np.linalg.norm(embedding) or 1.0
+        self.embeddings[key] = embedding
+        while len(self.embeddings) > 32:
+            self.embeddings.popitem(last=False)
+        return embedding
+
+    async def lookup(self, message: str) -> dict | None:
+        """
+        :param message: LLM input
+        :return: The cached entry with "response" and "clips" keys, or None
+        """
+        self._expire()
+        key = normalize(message)
+        if not self.cacheable(key):
+            self.skipped += 1
+            return None
+        kind, similarity = "exact", 1.0
+        entry = self.entries.get(key)
+
+        if entry is None and not self.templated(message):
+            kind = "semantic"
+            embedding = await self._embedding(key)
+            candidates = [(k, e) for k, e in self.entries.items()
+                          if e["embedding"] is not None and e["speakers"] == speakers(key)]
+            if embedding is not None and candidates:
+                similarities = np.stack([e["embedding"] for _, e in candidates]) @ embedding
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    key, entry = candidates[best]
+                    similarity = float(similarities[best])
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits[kind] += 1
+        LOGGER.info(f"Response cache hit ({kind}, similarity {similarity:.3f}), "
+                    f"hit rate {self.metrics()['hit_rate'] * 100:.0f}%.")
+        return entry
+
+    def peek(self, message: str) -> dict | None:
+        """Exact lookup that doesn't count as a hit or a miss."""
+        return self.entries.get(normalize(message))
+
+    async def store(self, message: str, response: str) -> dict | None:
+        """
+        :param message: LLM input
+        :param response: LLM response to it
+        :return: The new entry
+        """
+        key = normalize(message)
+        if not self.cacheable(key):
+            return None
+        entry = self.entries[key] = {
+            "response": response,
+            "clips": [],
+            "speakers": speakers(key),
+            # Templated entries are left out of the semantic matches.
+            "embedding": None if self.templated(message) else await self._embedding(key),
+            "created": time.time()
+        }
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return entry
+
+    @staticmethod
+    def attach_clips(entry: dict, texts: list):
+        """Remembers the texts an entry's response was synthesized in, in playback order."""
+        entry["clips"] = list(texts)
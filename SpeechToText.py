@@ -1,10 +1,10 @@
 import time
-import os
+import threading
 import dotenv
 import whisper
-import tempfile
-import io
 import logging
+import numpy as np
+import torch
 
 dotenv.load_dotenv()
 
@@ -20,140 +20,284 @@ logging.basicConfig(
 )
 
 class STTManager:
-    def __init__(self):
-        self.model = whisper.load_model("turbo")
+    """
+    Transcribes audio with one Whisper model. Whisper keeps the decoder's key/value cache in hooks on the
+    model itself, so two decodes can't run on it at the same time: every method holds the model's lock while
+    it transcribes, and calls from several threads run one after another.
+    """
+
+    def __init__(self, model_name: str = "turbo", device: str = None, quantize: bool = False, num_threads: int = None):
+        """
+        :param model_name: Whisper model name or checkpoint path
+        :param device: Torch device, defaults to CUDA when available
+        :param quantize: Apply dynamic int8 quantization to the linear layers (CPU only)
+        :param num_threads: Number of threads torch uses for inference
+        """
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self.model = whisper.load_model(model_name, device=device)
+        if quantize:
+            self.model = self._quantize(self.model)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _quantize(model):
+        if model.device.type != "cpu":
+            LOGGER.warning("Dynamic quantization is only supported on CPU, using the full precision model.")
+            return model
+        # Whisper's Linear subclass only adds a dtype cast for fp16, which doesn't apply on CPU.
+        # quantize_dynamic matches module types exactly, so it has to be a plain nn.Linear to be quantized.
+        for module in model.modules():
+            if isinstance(module, whisper.model.Linear):
+                module.__class__ = torch.nn.Linear
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
 
     def transcribe_audiofile(self, file_path):
         # Transcribe the audio file.
         # The transcribe function returns a dictionary containing the transcription and extra info.
         try:
             timestamp = time.time()
-            result = self.model.transcribe(audio=file_path, language="en")
+            with self._lock:
+                result = self.model.transcribe(audio=file_path, language="en")
 
             # Return the transcribed text.
             return {"success": True, "transcription": result["text"], "timestamp": timestamp}
         except Exception:
             return {"success": False}
 
-    def transcribe_audio_stream(self, audio_stream: io.BytesIO, model) -> dict:
+    def transcribe_array(self, audio: np.ndarray, timestamp: float = None, prompt: str = None) -> dict:
         """
-        Given an io.BytesIO stream (containing WAV audio), writes the stream
-        to a temporary file and transcribes it using the provided Whisper model.
-        Returns the transcribed text.
+        Transcribes audio that is already in memory, so no files are written and no ffmpeg process is started.
+        :param audio: Mono float32 samples at 16 kHz
+        :param timestamp: Timestamp for the result, defaults to now
+        :param prompt: Text that precedes the audio, if any
         """
-        transcription_result = {}
-        # Use a temporary file to interface with Whisper.
-        fd, temp_path = tempfile.mkstemp(suffix=".wav")
+        if timestamp is None:
+            timestamp = time.time()
         try:
-            # Write the BytesIO data to the temporary file.
-            with os.fdopen(fd, "wb") as f:
-                audio_stream.seek(0)
-                data = audio_stream.read()
-                f.write(data)
-
-            # Call the Whisper transcription in an executor to avoid blocking.
-            result = self.model.transcribe(audio=temp_path, language="en")
-            transcription = result.get("text", "").strip()
-            transcription_result = {"success": True, "transcription": transcription}
+            with self._lock:
+                result = self.model.transcribe(audio=np.ascontiguousarray(audio, dtype=np.float32), language="en",
+                                               initial_prompt=prompt)
+
+            return {"success": True, "transcription": result.get("text", ""), "timestamp": timestamp}
         except Exception as e:
-            transcription_result = {"success": False, "error": e}
-        finally:
-            # Remove the temporary file.
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+            return {"success": False, "error": e}
 
-        return transcription_result
+    def transcribe_words(self, audio: np.ndarray, prompt: str = None) -> dict:
+        """
+        Transcribes audio with word-level timestamps, used for partial transcripts of live audio.
+        :param audio: Mono float32 samples at 16 kHz
+        :param prompt: Text that precedes the audio, e.g. the already committed part of the transcript
+        :return: Dictionary with a list of (word, start, end) tuples under "words", times in seconds
+        """
+        try:
+            with self._lock:
+                result = self.model.transcribe(audio=np.ascontiguousarray(audio, dtype=np.float32), language="en",
+                                               word_timestamps=True, initial_prompt=prompt,
+                                               condition_on_previous_text=False)
+            words = [(word["word"], word["start"], word["end"])
+                     for segment in result["segments"] for word in segment.get("words", [])]
+
+            return {"success": True, "words": words}
+        except Exception as e:
+            return {"success": False, "error": e}
 
-    def process_utterances(self, sink_obj) -> dict:
+    def transcribe_batch(self, audios: list) -> list:
         """
-        Sorts the logged audio chunks by timestamp, transcribes each one using Whisper,
-        and returns a combined string with one line per utterance containing the timestamp,
-        user info, and the transcribed speech.
+        Transcribes several clips of at most 30 seconds in one pass: the clips are padded into a single
+        mel batch, so the encoder and decoder run once for all of them instead of once per clip.
+        Clips which the greedy batch decode gets wrong by Whisper's own measures (repetitive output or
+        low confidence) are transcribed again on their own, with temperature fallback.
+        :param audios: Mono float32 clips at 16 kHz
+        :return: The transcribed text of each clip
         """
-        # Ensure utterances are in chronological order grouped by the user
-        sorted_utterances = sorted(sink_obj.utterances, key=lambda x: (x[1], x[0]))
+        mel = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(np.ascontiguousarray(audio, dtype=np.float32)),
+                                        n_mels=self.model.dims.n_mels)
+            for audio in audios
+        ]).to(self.model.device)
+        options = whisper.DecodingOptions(language="en", without_timestamps=True,
+                                          fp16=self.model.device.type != "cpu")
+        with self._lock:
+            results = whisper.decode(self.model, mel, options)
 
-        merged_utterances = []
-        merge_threshold = 0.5
-        current_merge = None  # will contain [timestamp, user_id, merged_data]
-
-        LOGGER.info(f"Started merging the utterances. There are {len(sorted_utterances)} utterances in total.")
-
-        for timestamp, user, segment in sorted_utterances:
-            if current_merge is None:
-                # Initialize with a list of segments.
-                current_merge = {
-                    "start": timestamp,
-                    "end": timestamp,
-                    "user": user,
-                    "segments": [segment]
-                }
-            else:
-                if user == current_merge["user"]:
-                    gap = timestamp - current_merge["end"]
-                    if gap < merge_threshold:
-                        current_merge["end"] = timestamp
-                        current_merge["segments"].append(segment)
-                    else:
-                        # Finalize current merge.
-                        merged_raw = b"".join(seg.raw_data for seg in current_merge["segments"])
-                        # noinspection PyProtectedMember
-                        concatenated_segment = current_merge["segments"][0]._spawn(merged_raw)
-                        merged_utterances.append(
-                            (current_merge["end"], current_merge["user"], concatenated_segment)
-                        )
-                        current_merge = {
-                            "start": timestamp,
-                            "end": timestamp,
-                            "user": user,
-                            "segments": [segment]
-                        }
+            texts = []
+            for audio, result in zip(audios, results):
+                if result.compression_ratio > 2.4 or result.avg_logprob < -1.0:
+                    texts.append(self.model.transcribe(audio=np.ascontiguousarray(audio, dtype=np.float32),
+                                                       language="en")["text"])
                 else:
-                    # Speaker changed: finalize the merge.
-                    merged_raw = b"".join(seg.raw_data for seg in current_merge["segments"])
-                    # noinspection PyProtectedMember
-                    concatenated_segment = current_merge["segments"][0]._spawn(merged_raw)
-                    merged_utterances.append(
-                        (current_merge["end"], current_merge["user"], concatenated_segment)
-                    )
-                    current_merge = {
-                        "start": timestamp,
-                        "end": timestamp,
-                        "user": user,
-                        "segments": [segment]
-                    }
-
-        if current_merge is not None and current_merge["segments"]:
-            merged_raw = b"".join(seg.raw_data for seg in current_merge["segments"])
-            # noinspection PyProtectedMember
-            concatenated_segment = current_merge["segments"][0]._spawn(merged_raw)
-            merged_utterances.append(
-                (current_merge["end"], current_merge["user"], concatenated_segment)
-            )
+                    texts.append(result.text)
+        return texts
+
+    def transcribe_segments(self, segments: list, batch_size: int = 1) -> dict:
+        """
+        Transcribes a list of clips, batch_size clips at a time. Clips longer than Whisper's 30 second
+        window are always transcribed on their own.
+        :return: Dictionary with the transcribed text of each clip under "transcriptions"
+        """
+        transcriptions = [None] * len(segments)
+        try:
+            if batch_size > 1:
+                short = [i for i, segment in enumerate(segments) if segment.shape[0] <= whisper.audio.N_SAMPLES]
+                for start in range(0, len(short), batch_size):
+                    indices = short[start:start + batch_size]
+                    texts = self.transcribe_batch([segments[i] for i in indices])
+                    for i, text in zip(indices, texts):
+                        transcriptions[i] = text
+        except Exception as e:
+            # Whatever wasn't decoded in a batch is transcribed one by one below.
+            LOGGER.error(f"Batched transcription failed, falling back to sequential: {e}")
+
+        for i, segment in enumerate(segments):
+            if transcriptions[i] is None:
+                transcription_result = self.transcribe_array(segment)
+                if not transcription_result["success"]:
+                    return transcription_result
+                transcriptions[i] = transcription_result["transcription"]
+
+        return {"success": True, "transcriptions": transcriptions}
+
+    @staticmethod
+    def merge_utterances(capture, merge_threshold: float = 0.5) -> list:
+        """
+        Merges the packets in a capture store into per-user utterances.
+        :return: List of (timestamp of the last packet, username, samples) sorted by time, where the samples
+            are a zero-copy slice of the user's buffer
+        """
+        end_timestamps, users, offsets, offset_ends = capture.merge_runs(merge_threshold)
+        # Sort the merged utterances by time, so that transcription has proper timing
+        order = np.argsort(end_timestamps, kind="stable")
+
+        merged_utterances = []
+        for i in order:
+            user_id = capture.user_ids[users[i]]
+            user = capture.display_names.get(user_id, str(user_id))
+            samples = capture.buffer(user_id).view(int(offsets[i]), int(offset_ends[i]))
+            merged_utterances.append((float(end_timestamps[i]), user, samples))
+        return merged_utterances
+
+    def process_utterances(self, sink_obj, batch_size: int = 1) -> dict:
+        """
+        Merges the packets in the sink's capture store per user, transcribes each merged utterance
+        using Whisper, and returns a combined string with one line per utterance containing the
+        timestamp, user info, and the transcribed speech.
+        :param batch_size: How many short utterances to decode together, 1 decodes them one by one
+        """
+        LOGGER.info(f"Started merging the utterances. There are {len(sink_obj.capture)} utterances in total.")
+
+        merged_utterances = self.merge_utterances(sink_obj.capture)
 
         LOGGER.info(f"Merging process is done. There are {len(merged_utterances)} merged utterances in total. "
                     f"Starting transcription...")
 
-        # Sort the merged utterances by time, so that transcription has proper timing
-        merged_utterances = sorted(merged_utterances, key=lambda x: x[0])
+        if not merged_utterances:
+            return {"success": True, "transcription": "", "timestamp": time.time()}
+
+        segments_result = self.transcribe_segments([segment for _, _, segment in merged_utterances], batch_size)
+        if not segments_result["success"]:
+            return segments_result
+
+        return self.format_utterances(merged_utterances, segments_result["transcriptions"])
 
+    @staticmethod
+    def format_utterances(merged_utterances: list, transcriptions: list) -> dict:
+        """
+        Combines the transcriptions of merged utterances into one line per utterance with the timestamp
+        and the user.
+        """
         full_transcription = ""
         ts = merged_utterances[0][0]
-        for timestamp, user, segment in merged_utterances:
+        for (timestamp, user, _), transcription in zip(merged_utterances, transcriptions):
             if timestamp < ts:
                 ts = timestamp
-            # Wrap the raw audio data in a BytesIO object.
-            buf = io.BytesIO()
-            segment.export(buf, format="wav")
-            # Ensure the buffer is positioned at the start.
-            buf.seek(0)
-            # Transcribe the audio data using the helper.
-            transcription_result = self.transcribe_audio_stream(buf, self.model)
-            if not transcription_result["success"]:
-                return transcription_result
             # Format the timestamp (HH.MM:SS).
             ts_str = time.strftime("%Y-%m-%d %H.%M:%S", time.localtime(timestamp))
             # Append to the full transcription with a user label.
-            full_transcription += f"[{ts_str}] <{user}>: {transcription_result["transcription"]}\n"
+            full_transcription += f"[{ts_str}] <{user}>: {transcription.strip()}\n"
+
+        return {"success": True, "transcription": full_transcription, "timestamp": ts}
+
+
+class IncrementalTranscriber:
+    """
+    Keeps a stable partial transcript of one speaker's live audio. Every update() transcribes the audio
+    after the committed part again (an overlapping, growing window), and a word is committed once two
+    consecutive hypotheses agree on it. Committed words are never revised and the audio they cover is left
+    out of later windows, so when the turn ends only the uncommitted tail has to be transcribed.
+    """
+
+    def __init__(self, stt: STTManager, offset: int, sample_rate: int = 16000, max_window: float = 20.0):
+        self.stt = stt
+        self.sample_rate = sample_rate
+        self.max_window = max_window
+        self.committed_words = []
+        self.committed_offset = offset  # absolute offset in the speaker's buffer where the uncommitted audio starts
+        self.previous = []  # uncommitted words of the previous hypothesis
+        self.finalized = False
+        self._lock = threading.Lock()
+
+    @property
+    def committed_text(self) -> str:
+        return "".join(self.committed_words).strip()
+
+    @staticmethod
+    def _normalize(word: str) -> str:
+        return "".join(c for c in word.lower() if c.isalnum())
+
+    def update(self, audio: np.ndarray) -> str:
+        """
+        Transcribes the uncommitted audio and commits the words that agree with the previous hypothesis.
+        :param audio: The speaker's audio from committed_offset up to now
+        :return: The committed text so far
+        """
+        result = self.stt.transcribe_words(audio, prompt=self.committed_text or None)
+        if not result["success"]:
+            LOGGER.error(f"Partial transcription failed: {result['error']}")
+            return self.committed_text
+        hypothesis = result["words"]
+
+        with self._lock:
+            if self.finalized:
+                # The turn ended while this window was being transcribed.
+                return self.committed_text
+            self._commit(hypothesis, audio)
+        return self.committed_text
+
+    def _commit(self, hypothesis: list, audio: np.ndarray):
+        agreed = 0
+        while (agreed < len(hypothesis) and agreed < len(self.previous)
+               and self._normalize(hypothesis[agreed][0]) == self._normalize(self.previous[agreed][0])):
+            agreed += 1
+        # Whisper's window is limited: when there's too much uncommitted audio, commit all but the last word.
+        if audio.shape[0] / self.sample_rate >= self.max_window:
+            agreed = max(agreed, len(hypothesis) - 1)
+
+        if agreed:
+            self.committed_words.extend(word for word, _, _ in hypothesis[:agreed])
+            self.committed_offset += min(int(hypothesis[agreed - 1][2] * self.sample_rate), audio.shape[0])
+        self.previous = hypothesis[agreed:]
+
+    def finalize(self, samples: np.ndarray, offset: int, timestamp: float = None) -> dict:
+        """
+        Ends the turn: transcribes only the audio after the committed words. Call it once the last update has
+        returned, the result of an update that is still running is discarded.
+        :param samples: The speaker's whole utterance
+        :param offset: Absolute offset of the utterance in the speaker's buffer
+        :param timestamp: Timestamp for the result
+        :return: Transcription result with the full transcript
+        """
+        with self._lock:
+            self.finalized = True
+            committed_offset, committed_text = self.committed_offset, self.committed_text
+
+        tail = samples[max(committed_offset - offset, 0):]
+        LOGGER.info(f"Finalizing partial transcript: {tail.shape[0] / self.sample_rate:.1f} s of "
+                    f"{samples.shape[0] / self.sample_rate:.1f} s left to transcribe.")
+        if tail.shape[0] < self.sample_rate // 10:
+            return {"success": True, "transcription": committed_text, "timestamp": timestamp or time.time()}
 
-        return {"success": True, "transcription": full_transcription, "timestamp": ts}
\ No newline at end of file
+        result = self.stt.transcribe_array(tail, timestamp, prompt=committed_text or None)
+        if result["success"]:
+            result["transcription"] = f"{committed_text} {result['transcription'].strip()}".strip()
+        return result
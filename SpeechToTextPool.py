@@ -0,0 +1,291 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+LOGGER: logging.Logger = logging.getLogger("SpeechToTextPool")
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Attaches to a block created by the bot process, which stays responsible for unlinking it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 the block is always registered, but spawned workers share the bot
+        # process' resource tracker, so that is harmless.
+        return shared_memory.SharedMemory(name=name)
+
+
+def _worker_main(model_name: str, device: str, quantize: bool, num_threads: int, jobs, results):
+    """Entry point of a worker process: loads the model once and serves jobs until it gets None."""
+    # Imported here so the bot process doesn't need to import Whisper for the pool itself.
+    from SpeechToText import STTManager
+
+    stt = STTManager(model_name, device, quantize, num_threads)
+    pid = multiprocessing.current_process().pid
+    results.put((None, "ready", pid, None))
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        job_id, method, shm_name, lengths, kwargs = job
+        results.put((job_id, "started", pid, time.time()))
+
+        shm = None
+        try:
+            shm = _attach(shm_name)
+            audio = np.ndarray((sum(lengths),), dtype=np.float32, buffer=shm.buf)
+            bounds = np.cumsum([0] + list(lengths))
+            clips = [audio[bounds[i]:bounds[i + 1]] for i in range(len(lengths))]
+            if method == "transcribe_segments":
+                result = stt.transcribe_segments(clips, **kwargs)
+            else:
+                result = getattr(stt, method)(clips[0], **kwargs)
+            # The views have to be gone before the block can be closed.
+            del audio, clips
+        except Exception as e:
+            result = {"success": False, "error": e}
+        finally:
+            if shm is not None:
+                shm.close()
+
+        if "error" in result:
+            # Not every exception can be pickled.
+            result["error"] = repr(result["error"])
+        results.put((job_id, "done", pid, result))
+
+
+class STTWorkerPool:
+    """
+    Runs Whisper in separate worker processes so that inference doesn't compete with the voice gateway,
+    the recorder thread and the event loop for the GIL. Each worker loads the model once. Audio is copied
+    into a shared memory block and only the block's name goes through the job queue, so no audio is pickled.
+    The methods mirror STTManager's but are coroutines.
+    """
+
+    def __init__(self, workers: int = 2, model_name: str = "turbo", device: str = None,
+                 quantize: bool = False, num_threads: int = None, max_restarts: int = 3):
+        """
+        :param workers: Number of worker processes
+        :param max_restarts: Workers that may die in a row without one becoming ready before the pool gives up
+        """
+        self.workers = workers
+        self.model_name = model_name
+        self.device = device
+        self.quantize = quantize
+        self.num_threads = num_threads
+        self.context = multiprocessing.get_context("spawn")
+        self.jobs = self.context.Queue()
+        self.results = self.context.Queue()
+        self.processes = {}  # pid -> process
+        self.running = {}  # pid -> id of the job the worker is on
+        self.pending = {}  # job id -> job bookkeeping
+        self.ready = threading.Event()
+        self.broken = False  # set when the workers kept dying and weren't restarted any more
+        self.max_restarts = max_restarts
+        self.completed = 0
+        self.failed = 0
+        self.latencies = []  # seconds from submit to result of recent jobs
+        self._ids = itertools.count()
+        self._ready_pids = set()
+        self._failures = 0  # workers that died in a row
+        self._settled = threading.Event()  # set when the pool is ready or broken
+        self._reader = None
+        self._closing = False
+
+    def start(self):
+        for _ in range(self.workers):
+            self._spawn()
+        self._reader = threading.Thread(target=self._read_results, name="stt-pool-results", daemon=True)
+        self._reader.start()
+
+    def _spawn(self):
+        process = self.context.Process(target=_worker_main, name="stt-worker", daemon=True,
+                                       args=(self.model_name, self.device, self.quantize, self.num_threads,
+                                             self.jobs, self.results))
+        process.start()
+        self.processes[process.pid] = process
+
+    def wait_ready(self, timeout: float = None) -> bool:
+        """
+        Blocks until every worker has loaded its model.
+        :param timeout: Seconds to wait at most
+        :return: Whether the pool is ready, False if it timed out or the workers kept dying
+        """
+        self._settled.wait(timeout)
+        return self.ready.is_set() and not self.broken
+
+    def queue_depth(self) -> int:
+        """Jobs submitted but not finished yet, including the ones being processed."""
+        return len(self.pending)
+
+    def metrics(self) -> dict:
+        latencies = sorted(self.latencies)
+        return {
+            "queue_depth": self.queue_depth(),
+            "completed": self.completed,
+            "failed": self.failed,
+            "latency_p50": latencies[len(latencies) // 2] if latencies else None,
+            "latency_p95": latencies[int(len(latencies) * 0.95)] if latencies else None
+        }
+
+    async def submit(self, method: str, clips: list, **kwargs) -> dict:
+        """
+        Runs an STTManager method on the given clips in a worker.
+        :param method: Name of the STTManager method
+        :param clips: Mono float32 clips at 16 kHz. transcribe_segments gets all of them, other methods the first
+        :return: The method's result
+        """
+        if self.broken:
+            return {"success": False, "error": "The STT workers kept dying."}
+        lengths = [clip.shape[0] for clip in clips]
+        shm = shared_memory.SharedMemory(create=True, size=max(sum(lengths), 1) * 4)
+        try:
+            audio = np.ndarray((sum(lengths),), dtype=np.float32, buffer=shm.buf)
+            offset = 0
+            for clip in clips:
+                audio[offset:offset + clip.shape[0]] = clip
+                offset += clip.shape[0]
+            del audio
+
+            loop = asyncio.get_running_loop()
+            job_id = next(self._ids)
+            future = loop.create_future()
+            self.pending[job_id] = {"future": future, "loop": loop, "method": method,
+                                    "submitted": time.time(), "started": None}
+            self.jobs.put((job_id, method, shm.name, lengths, kwargs))
+            LOGGER.info(f"Queued STT job {job_id} ({method}, {sum(lengths) / 16000:.1f} s of audio), "
+                        f"queue depth {self.queue_depth()}.")
+            return await future
+        finally:
+            shm.close()
+            shm.unlink()
+
+    async def transcribe_array(self, audio: np.ndarray, timestamp: float = None, prompt: str = None) -> dict:
+        result = await self.submit("transcribe_array", [audio], prompt=prompt)
+        if result["success"] and timestamp is not None:
+            result["timestamp"] = timestamp
+        return result
+
+    async def transcribe_words(self, audio: np.ndarray, prompt: str = None) -> dict:
+        return await self.submit("transcribe_words", [audio], prompt=prompt)
+
+    async def transcribe_segments(self, segments: list, batch_size: int = 1) -> dict:
+        return await self.submit("transcribe_segments", segments, batch_size=batch_size)
+
+    def proxy(self, loop: asyncio.AbstractEventLoop):
+        """
+        Returns an object with blocking versions of the transcription methods, for code that runs in a
+        thread and expects an STTManager, like IncrementalTranscriber.
+        """
+        return _BlockingPool(self, loop)
+
+    def _read_results(self):
+        while not self._closing:
+            try:
+                job_id, kind, pid, payload = self.results.get(timeout=1)
+            except queue.Empty:
+                self._check_workers()
+                continue
+            except (EOFError, OSError):
+                break
+
+            if kind == "ready":
+                self._ready_pids.add(pid)
+                self._failures = 0
+                LOGGER.info(f"STT worker {pid} is ready ({len(self._ready_pids)}/{len(self.processes)}).")
+                self._update_ready()
+            elif kind == "started":
+                self.running[pid] = job_id
+                if job_id in self.pending:
+                    self.pending[job_id]["started"] = payload
+            elif kind == "done":
+                self.running.pop(pid, None)
+                self._resolve(job_id, payload)
+
+    def _resolve(self, job_id: int, result: dict):
+        job = self.pending.pop(job_id, None)
+        if job is None:
+            return
+        finished = time.time()
+        latency = finished - job["submitted"]
+        waited = (job["started"] or finished) - job["submitted"]
+        self.latencies = self.latencies[-199:] + [latency]
+        if result["success"]:
+            self.completed += 1
+        else:
+            self.failed += 1
+        LOGGER.info(f"STT job {job_id} ({job['method']}) finished in {latency:.2f} s "
+                    f"({waited:.2f} s queued), queue depth {self.queue_depth()}.")
+
+        def set_result():
+            if not job["future"].done():
+                job["future"].set_result(result)
+        job["loop"].call_soon_threadsafe(set_result)
+
+    def _update_ready(self):
+        """The pool is ready while every worker that is alive has loaded its model."""
+        if self._ready_pids and self._ready_pids >= set(self.processes):
+            self.ready.set()
+            self._settled.set()
+
+    def _check_workers(self):
+        """
+        Replaces workers that died, failing the job they were working on. After max_restarts workers died in a
+        row without one becoming ready, no more are started, and once none are left the pool is broken.
+        """
+        for pid, process in list(self.processes.items()):
+            if process.is_alive() or self._closing:
+                continue
+            del self.processes[pid]
+            job_id = self.running.pop(pid, None)
+            if job_id is not None:
+                self._resolve(job_id, {"success": False, "error": f"STT worker {pid} exited."})
+            if pid in self._ready_pids:
+                self._ready_pids.discard(pid)
+                self.ready.clear()
+            self._failures += 1
+            if self._failures <= self.max_restarts:
+                LOGGER.error(f"STT worker {pid} exited with code {process.exitcode}, starting a new one.")
+                self._spawn()
+            else:
+                LOGGER.error(f"STT worker {pid} exited with code {process.exitcode}, {self._failures} workers "
+                             f"died in a row, not starting a new one.")
+
+        self._update_ready()
+        if not self.processes and not self._closing and not self.broken:
+            self.broken = True
+            self.ready.clear()
+            self._settled.set()
+            for job_id in list(self.pending):
+                self._resolve(job_id, {"success": False, "error": "The STT workers kept dying."})
+
+    def close(self):
+        self._closing = True
+        for _ in self.processes:
+            self.jobs.put(None)
+        for process in self.processes.values():
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for job_id in list(self.pending):
+            self._resolve(job_id, {"success": False, "error": "The STT pool was closed."})
+
+
+class _BlockingPool:
+    def __init__(self, pool: STTWorkerPool, loop: asyncio.AbstractEventLoop):
+        self.pool = pool
+        self.loop = loop
+
+    def transcribe_array(self, audio: np.ndarray, timestamp: float = None, prompt: str = None) -> dict:
+        return asyncio.run_coroutine_threadsafe(self.pool.transcribe_array(audio, timestamp, prompt), self.loop).result()
+
+    def transcribe_words(self, audio: np.ndarray, prompt: str = None) -> dict:
+        return asyncio.run_coroutine_threadsafe(self.pool.transcribe_words(audio, prompt), self.loop).result()
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import time
+
+LOGGER: logging.Logger = logging.getLogger("StreamingReply")
+
+# Discord's limit for the content of a message.
+MESSAGE_LIMIT = 2000
+
+
+def split_message(text: str, limit: int = MESSAGE_LIMIT) -> list:
+    """
+    Splits text into parts of at most limit characters, at a line break or a space when there is one in the
+    second half of the part. Only the last part changes when more text is appended, so the parts already
+    posted stay as they are.
+    """
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind("\n", limit // 2, limit)
+        if cut == -1:
+            cut = text.rfind(" ", limit // 2, limit)
+        if cut == -1:
+            cut = limit
+        parts.append(text[:cut])
+        text = text[cut:]
+    parts.append(text)
+    return parts
+
+
+class StreamingReply:
+    """
+    Shows a response in a text channel while it's being generated. A placeholder reply is posted right away,
+    and it's edited with the text received so far at most once every interval seconds, which keeps well within
+    Discord's rate limit for message edits. Text over the message length limit continues in new messages.
+    """
+
+    def __init__(self, reply, send, interval: float = 1.0, started: float = None, placeholder: str = "…"):
+        """
+        :param reply: Coroutine function that posts the first message and returns it
+        :param send: Coroutine function that posts a continuation message and returns it
+        :param interval: Minimum seconds between edits
+        :param started: perf_counter time of the request, for measuring the time to the first visible text
+        :param placeholder: Content shown until the first text arrives
+        """
+        self.reply = reply
+        self.send = send
+        self.interval = interval
+        self.started = started if started is not None else time.perf_counter()
+        self.placeholder = placeholder
+        self.text = ""
+        self.messages = []
+        self.shown = []  # content of each posted message
+        self.edits = 0
+        self.first_visible = None  # seconds from the request to the first text shown
+        self._changed = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._editor = None
+
+    async def start(self):
+        """Posts the placeholder and starts editing it as text arrives."""
+        self.messages.append(await self.reply(self.placeholder))
+        self.shown.append(self.placeholder)
+        self._editor = asyncio.create_task(self._edit_loop())
+
+    def feed(self, chunk: str):
+        self.text += chunk
+        if chunk:
+            self._changed.set()
+
+    async def finish(self, text: str = None) -> dict:
+        """
+        Stops the periodic edits and shows the complete text.
+        :param text: Text to show instead of what was fed, like an error message
+        :return: Time to the first visible text, number of edits and messages
+        """
+        if text is not None:
+            self.text = text
+        if self._editor is not None:
+            # Not in the middle of an edit, so a message can't be posted without being recorded.
+            async with self._lock:
+                self._editor.cancel()
+            try:
+                await self._editor
+            except asyncio.CancelledError:
+                pass
+        await self._update()
+        return {"first_visible": self.first_visible, "edits": self.edits, "messages": len(self.messages)}
+
+    async def _edit_loop(self):
+        while True:
+            await self._changed.wait()
+            self._changed.clear()
+            await self._update()
+            await asyncio.sleep(self.interval)
+
+    async def _update(self):
+        """Brings the posted messages up to date with the text."""
+        async with self._lock:
+            for i, part in enumerate(split_message(self.text)):
+                part = part if part.strip() else self.placeholder
+                try:
+                    if i >= len(self.messages):
+                        self.messages.append(await self.send(part))
+                        self.shown.append(part)
+                    elif self.shown[i] != part:
+                        await self.messages[i].edit(content=part)
+                        self.shown[i] = part
+                        self.edits += 1
+                except Exception as e:
+                    LOGGER.error(f"Failed to update the streamed reply: {e!r}")
+                    return
+                if self.first_visible is None and part != self.placeholder:
+                    self.first_visible = time.perf_counter() - self.started
@@ -0,0 +1,148 @@
+import hashlib
+import logging
+import os
+import struct
+import threading
+from collections import OrderedDict
+
+LOGGER: logging.Logger = logging.getLogger("TTSCache")
+
+
+def write_frames(file_path: str, frames: list):
+    """Writes Opus packets to a file, each one prefixed with its length."""
+    with open(file_path, "wb") as f:
+        for frame in frames:
+            f.write(struct.pack("<H", len(frame)))
+            f.write(frame)
+
+
+def read_frames(file_path: str) -> list:
+    with open(file_path, "rb") as f:
+        data = f.read()
+    frames = []
+    position = 0
+    while position < len(data):
+        (length,) = struct.unpack_from("<H", data, position)
+        frames.append(data[position + 2:position + 2 + length])
+        position += 2 + length
+    return frames
+
+
+class TTSCache:
+    """
+    Keeps synthesized speech on disk, addressed by a hash of the TTS model and the text, so the same text is
+    only synthesized once. The audio is stored ready to play: as 48 kHz stereo PCM, and as Opus packets when
+    an encoder is available, which Discord can send without encoding them again. The cache is capped in size
+    and evicts the least recently used entries first. The cache survives restarts, the recency is taken from
+    the files' modification times.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 256 * 1024 * 1024):
+        """
+        :param directory: Directory for the cached audio
+        :param max_bytes: Maximum total size of the cached files
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> bytes on disk, least recently used first
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()  # the cache is used from worker threads
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\n{text}".encode("utf-8")).hexdigest()
+
+    def _paths(self, key: str) -> tuple:
+        return os.path.join(self.directory, f"{key}.pcm"), os.path.join(self.directory, f"{key}.opus")
+
+    def _load_index(self):
+        files = {}
+        for name in os.listdir(self.directory):
+            key, extension = os.path.splitext(name)
+            if extension not in (".pcm", ".opus"):
+                continue
+            stat = os.stat(os.path.join(self.directory, name))
+            size, used = files.get(key, (0, 0.0))
+            files[key] = (size + stat.st_size, max(used, stat.st_mtime))
+        for key, (size, _) in sorted(files.items(), key=lambda item: item[1][1]):
+            self.entries[key] = size
+            self.size += size
+        self._evict()
+
+    def metrics(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None
+        }
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    def get(self, key: str) -> dict | None:
+        """
+        :param key: See TTSCache.key
+        :return: The cached audio with "pcm" and "opus" keys, "opus" is None if it wasn't encoded, or None
+        """
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            pcm_path, opus_path = self._paths(key)
+            try:
+                with open(pcm_path, "rb") as f:
+                    pcm = f.read()
+                opus = read_frames(opus_path) if os.path.exists(opus_path) else None
+                os.utime(pcm_path)
+            except OSError as e:
+                LOGGER.error(f"Failed to read cached audio {key}: {e}")
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+        LOGGER.info(f"TTS cache hit, hit rate {self.metrics()['hit_rate'] * 100:.0f}%.")
+        return {"pcm": pcm, "opus": opus}
+
+    def put(self, key: str, pcm: bytes, opus: list = None):
+        """
+        :param key: See TTSCache.key
+        :param pcm: 48 kHz stereo 16-bit PCM
+        :param opus: The same audio as Opus packets, if it was encoded
+        """
+        pcm_path, opus_path = self._paths(key)
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            try:
+                with open(pcm_path, "wb") as f:
+                    f.write(pcm)
+                if opus is not None:
+                    write_frames(opus_path, opus)
+            except OSError as e:
+                LOGGER.error(f"Failed to cache audio {key}: {e}")
+                return
+            size = os.path.getsize(pcm_path) + (os.path.getsize(opus_path) if opus is not None else 0)
+            self.entries[key] = size
+            self.size += size
+            self._evict()
+
+    def _remove(self, key: str):
+        self.size -= self.entries.pop(key, 0)
+        for path in self._paths(key):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        while self.size > self.max_bytes and self.entries:
+            self._remove(next(iter(self.entries)))
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+LOGGER: logging.Logger = logging.getLogger("TTSService")
+
+
+class TTSService:
+    """
+    Owns the TTS model and runs every synthesis on a single worker thread, so requests never run inference on
+    the model at the same time. Requests wait in a bounded queue, and the ones that queued up while the worker
+    was busy are synthesized together in one batch. A request whose caller stopped waiting is skipped.
+    """
+
+    def __init__(self, tts, max_queue: int = 32, batch_size: int = 4):
+        """
+        :param tts: TTSManager
+        :param max_queue: Requests that can wait, submitting more waits for room in the queue
+        :param batch_size: Maximum number of requests synthesized together
+        """
+        self.tts = tts
+        self.batch_size = batch_size
+        self.queue = asyncio.Queue(max_queue)
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix="tts")
+        self.jobs = 0
+        self.batches = 0
+        self.waits = []  # recent queue waits in seconds
+        self.synthesis_times = []  # recent synthesis times in seconds
+        self._worker = None
+        self._deferred = None  # job taken from the queue that couldn't join the last batch
+
+    def start(self):
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._work())
+
+    def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+        self.executor.shutdown(wait=False)
+
+    def queue_depth(self) -> int:
+        return self.queue.qsize()
+
+    def metrics(self) -> dict:
+        def percentile(values: list, q: float):
+            values = sorted(values)
+            return values[min(int(len(values) * q), len(values) - 1)] if values else None
+
+        return {
+            "queue_depth": self.queue_depth(),
+            "jobs": self.jobs,
+            "batches": self.batches,
+            "mean_batch_size": self.jobs / self.batches if self.batches else None,
+            "wait_p50": percentile(self.waits, 0.5),
+            "wait_p95": percentile(self.waits, 0.95),
+            "synthesis_p50": percentile(self.synthesis_times, 0.5),
+            "synthesis_p95": percentile(self.synthesis_times, 0.95)
+        }
+
+    async def run(self, func, *args):
+        """Runs a function on the worker thread, for other uses of the model like the warm-up."""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def synthesize(self, text: str, save: bool = False) -> dict:
+        """
+        :param text: Text to synthesize
+        :param save: Also save the audio, see TTSManager.text_to_pcm
+        :return: TTSManager.text_to_pcm's result, with "queue_seconds" and "synthesis_seconds" added
+        """
+        self.start()
+        job = {
+            "text": text,
+            "save": save,
+            "future": asyncio.get_running_loop().create_future(),
+            "queued": time.perf_counter()
+        }
+        await self.queue.put(job)
+        try:
+            return await job["future"]
+        except asyncio.CancelledError:
+            job["future"].cancel()
+            raise
+
+    async def _work(self):
+        while True:
+            batch = [self._deferred or await self.queue.get()]
+            self._deferred = None
+            while len(batch) < self.batch_size and not self.queue.empty():
+                job = self.queue.get_nowait()
+                if job["save"] != batch[0]["save"]:
+                    # Goes first in the next batch, so the order is kept.
+                    self._deferred = job
+                    break
+                batch.append(job)
+            batch = [job for job in batch if not job["future"].done()]
+            if not batch:
+                continue
+            save = batch[0]["save"]
+
+            started = time.perf_counter()
+            try:
+                results = await self.run(self.tts.text_to_pcm_batch, [job["text"] for job in batch], save)
+            except Exception as e:
+                results = [{"success": False, "error": e}] * len(batch)
+            synthesis = time.perf_counter() - started
+
+            self.batches += 1
+            for job, result in zip(batch, results):
+                waited = started - job["queued"]
+                self.jobs += 1
+                self.waits = self.waits[-199:] + [waited]
+                self.synthesis_times = self.synthesis_times[-199:] + [synthesis]
+                LOGGER.info(f"TTS job ({len(job['text'])} characters) waited {waited:.2f} s, synthesized in "
+                            f"{synthesis:.2f} s in a batch of {len(batch)}, queue depth {self.queue_depth()}.")
+                if not job["future"].done():
+                    job["future"].set_result({**result, "queue_seconds": waited, "synthesis_seconds": synthesis})
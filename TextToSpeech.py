@@ -1,9 +1,13 @@
 import os
+import logging
 import dotenv
+import numpy as np
 import torch
 from TTS.api import TTS
 import time
+import uuid
 
+from AudioCapture import to_discord_pcm, write_wav
 from constants import audio_to_play_directory as audio_directory
 
 # List available 🐸TTS models
@@ -13,16 +17,45 @@ from constants import audio_to_play_directory as audio_directory
 
 dotenv.load_dotenv()
 
+LOGGER: logging.Logger = logging.getLogger("TextToSpeech")
+
 class TTSManager:
 
-    def __init__(self):
+    def __init__(self, quantize: bool = False, num_threads: int = None):
+        """
+        :param quantize: Apply dynamic int8 quantization to the linear layers (CPU only)
+        :param num_threads: Number of threads torch uses for inference
+        """
+        if num_threads:
+            torch.set_num_threads(num_threads)
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.model = TTS("tts_models/en/jenny/jenny").to(self.device)
+        self.model_name = "tts_models/en/jenny/jenny"
+        self.model = TTS(self.model_name).to(self.device)
+        # Identifies the voice the model produces, quantization changes it slightly.
+        self.model_id = self.model_name
+        if quantize:
+            if self.device == "cpu":
+                self.model_id += "/int8"
+                synthesizer = self.model.synthesizer
+                synthesizer.tts_model = torch.ao.quantization.quantize_dynamic(
+                    synthesizer.tts_model, {torch.nn.Linear}, dtype=torch.qint8
+                )
+            else:
+                LOGGER.warning("Dynamic quantization is only supported on CPU, using the full precision model.")
         os.makedirs(audio_directory, exist_ok=True)
 
-    def text_to_audio_file(self, text: str = "It took me quite a long time to develop a voice, and now that I have it I'm not going to be silent.") -> dict:
+    @property
+    def sample_rate(self) -> int:
+        return self.model.synthesizer.output_sample_rate
+
+    @staticmethod
+    def output_path() -> str:
         timestamp = time.strftime("%Y%m%d-%H%M%S")
-        output_path = os.path.join(audio_directory, f"{timestamp}.wav")
+        # Several sentences of a streamed response can be synthesized within the same second.
+        return os.path.join(audio_directory, f"{timestamp}-{uuid.uuid4().hex[:8]}.wav")
+
+    def text_to_audio_file(self, text: str = "It took me quite a long time to develop a voice, and now that I have it I'm not going to be silent.") -> dict:
+        output_path = self.output_path()
         self.model.tts_to_file(text=text, file_path=output_path)
 
         if os.path.exists(output_path):
@@ -35,6 +68,73 @@ class TTSManager:
 
         return wav
 
+    def text_to_pcm(self, text: str, save: bool = False) -> dict:
+        """
+        Synthesizes text straight to the 48 kHz stereo PCM Discord plays, without going through a file.
+        :param text: Text to synthesize
+        :param save: Also write the audio to a WAV file in the output directory
+        :return: Result dict with the PCM in "pcm", and the file in "output-path" if it was saved
+        """
+        try:
+            samples = np.asarray(self.model.tts(text=text), dtype=np.float32)
+        except Exception as e:
+            return {"success": False, "error": e}
+        return self._pcm_result(samples, save)
+
+    def text_to_pcm_batch(self, texts: list, save: bool = False) -> list:
+        """
+        Synthesizes several texts like text_to_pcm. With a VITS model, like Jenny, all their sentences go through
+        the model in one padded batch instead of one forward pass each.
+        :return: Result dicts in the same order as the texts
+        """
+        if self.can_batch and len(texts) > 1:
+            try:
+                waveforms = self._synthesize_batch(texts)
+            except Exception as e:
+                LOGGER.warning(f"Batched synthesis failed, synthesizing one text at a time: {e}")
+            else:
+                return [self._pcm_result(samples, save) for samples in waveforms]
+        return [self.text_to_pcm(text, save) for text in texts]
+
+    @property
+    def can_batch(self) -> bool:
+        return type(self.model.synthesizer.tts_model).__name__ == "Vits"
+
+    def _synthesize_batch(self, texts: list) -> list:
+        synthesizer = self.model.synthesizer
+        tts_model = synthesizer.tts_model
+        sentences = [synthesizer.split_into_sentences(text) for text in texts]
+        ids = [tts_model.tokenizer.text_to_ids(sentence) for text in sentences for sentence in text]
+        lengths = torch.tensor([len(sentence) for sentence in ids], dtype=torch.long)
+        x = torch.zeros((len(ids), int(lengths.max())), dtype=torch.long)
+        for row, sentence in enumerate(ids):
+            x[row, :len(sentence)] = torch.tensor(sentence, dtype=torch.long)
+
+        with torch.inference_mode():
+            outputs = tts_model.inference(x.to(self.device), aux_input={"x_lengths": lengths.to(self.device)})
+        # The batch is padded to the longest sentence, the mask tells how long each one really is.
+        samples = outputs["y_mask"].sum(dim=(1, 2)).long() * synthesizer.tts_config.audio.hop_length
+        waveforms = [wav[0, :n].float().cpu().numpy() for wav, n in zip(outputs["model_outputs"], samples)]
+
+        # Joined back into one waveform per text, with the same pause between sentences as tts() leaves.
+        results = []
+        for text in sentences:
+            parts = []
+            for _ in text:
+                parts += [waveforms.pop(0), np.zeros(10000, dtype=np.float32)]
+            results.append(np.concatenate(parts[:-1]) if parts else np.zeros(0, dtype=np.float32))
+        return results
+
+    def _pcm_result(self, samples: np.ndarray, save: bool) -> dict:
+        samples = np.asarray(samples, dtype=np.float32)
+        # Normalized the same way tts_to_file does it.
+        samples *= 1.0 / max(0.01, float(np.abs(samples).max(initial=0.0)))
+        result = {"success": True, "pcm": to_discord_pcm(samples, self.sample_rate)}
+        if save:
+            result["output-path"] = self.output_path()
+            write_wav(result["output-path"], samples, self.sample_rate, channels=1)
+        return result
+
 if __name__ == "__main__":
     tts_manager = TTSManager()
     tts_manager.text_to_audio_file()
\ No newline at end of file
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import time
+
+LOGGER: logging.Logger = logging.getLogger("TurnTaking")
+
+IDLE = "idle"  # nobody has spoken since the last response
+SPEAKING = "speaking"
+PAUSED = "paused"  # speech stopped, waiting to see whether the turn is over
+ENDED = "ended"  # the turn is over, waiting for the last transcriptions
+
+
+class TurnTaking:
+    """
+    Decides when the users' turn is over and the bot should respond. It is driven by the recorder and the
+    transcription code calling its event methods, and by timers, without any polling:
+
+    - speech_started / speech_stopped when voice activity starts and stops
+    - transcription_started / transcription_finished / transcription_failed around every transcription
+
+    Once nobody has spoken for pause_silence seconds and every transcription is done, on_pause is called with
+    the transcript so far, and on_resume if someone speaks again after that. Once nobody has spoken for
+    turn_end_silence seconds the turn is over, and on_turn_end is called with the transcript and the segments the
+    moment the last pending transcription completes.
+
+    The clock and the timer function can be replaced, so sequences of events can be replayed without waiting.
+    """
+
+    def __init__(self, on_turn_end, on_pause=None, on_resume=None, turn_end_silence: float = 2.0,
+                 pause_silence: float = 0.6, clock=time.time, call_later=None):
+        """
+        :param on_turn_end: Function or coroutine function called with the transcript and the segments of a
+            finished turn
+        :param on_pause: Function called with the transcript so far when the speakers pause
+        :param on_resume: Function called when someone speaks again after on_pause
+        :param turn_end_silence: Seconds of silence that end a turn
+        :param pause_silence: Seconds of silence that count as a pause
+        :param clock: Returns the current time in seconds
+        :param call_later: call_later(delay, callback) that returns a handle with cancel(), the event loop's by default
+        """
+        self.on_turn_end = on_turn_end
+        self.on_pause = on_pause
+        self.on_resume = on_resume
+        self.turn_end_silence = turn_end_silence
+        self.pause_silence = pause_silence
+        self.clock = clock
+        self.call_later = call_later
+        self.state = IDLE
+        self.pending = 0  # transcriptions that haven't finished yet
+        self.segments = []  # transcribed segments of the current turn
+        self.paused = False  # whether on_pause was called for the current pause
+        self.stopped_at = None
+        self._timers = []
+
+    def configure(self, turn_end_silence: float = None, pause_silence: float = None):
+        if turn_end_silence is not None:
+            self.turn_end_silence = turn_end_silence
+        if pause_silence is not None:
+            self.pause_silence = pause_silence
+
+    def transcript(self) -> str:
+        """The transcribed turn so far, in the order it was spoken."""
+        return "".join(segment["text"] for segment in sorted(self.segments, key=lambda s: s["timestamp"]))
+
+    def _schedule(self, delay: float, callback):
+        call_later = self.call_later or asyncio.get_running_loop().call_later
+        self._timers.append(call_later(max(delay, 0.0), callback))
+
+    def _cancel_timers(self):
+        for timer in self._timers:
+            timer.cancel()
+        self._timers = []
+
+    def _resume(self):
+        if self.paused:
+            self.paused = False
+            if self.on_resume is not None:
+                self.on_resume()
+
+    def speech_started(self):
+        self._cancel_timers()
+        self._resume()
+        # Speaking again before the response started continues the same turn.
+        self.state = SPEAKING
+
+    def speech_stopped(self, at: float = None):
+        """
+        :param at: When the last voice was heard, if that was earlier than now
+        """
+        self._cancel_timers()
+        self.state = PAUSED
+        self.stopped_at = at if at is not None else self.clock()
+        elapsed = self.clock() - self.stopped_at
+        self._schedule(self.pause_silence - elapsed, self._pause_elapsed)
+        self._schedule(self.turn_end_silence - elapsed, self._turn_ended)
+
+    def transcription_started(self):
+        self.pending += 1
+
+    def transcription_finished(self, segment: dict = None):
+        """
+        :param segment: The transcribed segment, with "timestamp" and "text" keys
+        """
+        self.pending = max(self.pending - 1, 0)
+        if segment is not None:
+            self.segments.append(segment)
+        if self.state == ENDED:
+            self._respond()
+        elif self.state == PAUSED and self.clock() - self.stopped_at >= self.pause_silence:
+            self._pause_elapsed()
+
+    def transcription_failed(self):
+        """Drops the current turn, its transcript can't be trusted any more."""
+        self._cancel_timers()
+        self._resume()
+        self.pending = 0
+        self.segments = []
+        if self.state != SPEAKING:
+            self.state = IDLE
+
+    def _pause_elapsed(self):
+        if self.state != PAUSED or self.pending > 0 or not self.segments:
+            return
+        self.paused = True
+        if self.on_pause is not None:
+            self.on_pause(self.transcript())
+
+    def _turn_ended(self):
+        if self.state != PAUSED:
+            return
+        if not self.segments and self.pending == 0:
+            # Nothing was said that could be responded to.
+            self.state = IDLE
+            return
+        LOGGER.info("End of turn, waiting for the transcription." if self.pending else "End of turn.")
+        self.state = ENDED
+        self._respond()
+
+    def _respond(self):
+        if self.pending > 0:
+            return
+        transcript = self.transcript()
+        segments, self.segments = self.segments, []
+        self.paused = False
+        self.state = IDLE
+        if transcript:
+            result = self.on_turn_end(transcript, segments)
+            if asyncio.iscoroutine(result):
+                asyncio.ensure_future(result)
@@ -14,7 +14,7 @@ from twitchio import eventsub
 import json
 import redis.asyncio as redis
 
-from constants import BOT_CONFIG_KEY
+from constants import BOT_CONFIG_KEY, TWITCH_CHATTERS_KEY
 
 dotenv.load_dotenv()
 
@@ -281,6 +281,8 @@ class MyComponent(commands.Component):
     @commands.Component.listener()
     async def event_message(self, payload: twitchio.ChatMessage) -> None:
         print(f"[{payload.broadcaster.name}] - {payload.chatter.name}: {payload.text}")
+        # Known chatters, so spoken moderation commands can be matched to their usernames.
+        await self.bot.redis_conn.sadd(TWITCH_CHATTERS_KEY, payload.chatter.name)
 
     @commands.Component.listener()
     async def event_subscription_gift(self, payload: twitchio.ChannelSubscriptionGift):
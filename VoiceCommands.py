@@ -0,0 +1,194 @@
+import difflib
+import logging
+import re
+import time
+from collections import Counter
+
+LOGGER: logging.Logger = logging.getLogger("VoiceCommands")
+
+# "[2025-05-12 13.59:53] <John>: text" as written by the transcription code
+TRANSCRIPT_LINE = re.compile(r"^\s*\[[^\]]*\]\s*<(?P<speaker>[^>]*)>:\s*(?P<text>.*)$")
+
+SMALL_NUMBERS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9,
+    "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13, "fourteen": 14, "fifteen": 15, "sixteen": 16,
+    "seventeen": 17, "eighteen": 18, "nineteen": 19
+}
+TENS = {"twenty": 20, "thirty": 30, "forty": 40, "fifty": 50, "sixty": 60, "seventy": 70, "eighty": 80, "ninety": 90}
+
+UNIT_SECONDS = {"second": 1, "sec": 1, "minute": 60, "min": 60, "hour": 3600, "day": 86400, "week": 604800}
+# Twitch doesn't allow longer timeouts.
+MAX_TIMEOUT = 1209600
+# Number of names sharing the most letter pairs with a spoken name that are compared with it.
+FUZZY_CANDIDATES = 20
+
+COMMAND = re.compile(
+    r"^(?:(?:hey|okay|ok)\s+(?:\w+\s+)??)?(?:please\s+)?(?:(?:can|could|would)\s+you\s+)?(?:please\s+)?"
+    r"(?P<action>time\s?out|mute|ban)\s+(?:the\s+)?(?:user\s+|chatter\s+)?"
+    r"(?P<target>.+?)"
+    r"(?:\s+for\s+(?P<amount>\d+|an?)\s+(?P<unit>sec|second|min|minute|hour|day|week)s?)?"
+    r"(?:\s+(?:for|because(?: of)?)\s+(?P<reason>.+?))?"
+    r"(?:\s+please)?$"
+)
+ACTIONS = {"timeout": "timeout", "time out": "timeout", "mute": "timeout", "ban": "ban"}
+
+
+def words_to_numbers(text: str) -> str:
+    """Replaces spelled out numbers below a hundred with digits, "ninety nine" -> "99"."""
+    words = text.split()
+    result = []
+    i = 0
+    while i < len(words):
+        word = words[i]
+        if word in TENS:
+            value = TENS[word]
+            if i + 1 < len(words) and 0 < SMALL_NUMBERS.get(words[i + 1], 0) < 10:
+                value += SMALL_NUMBERS[words[i + 1]]
+                i += 1
+            result.append(str(value))
+        elif word in SMALL_NUMBERS:
+            result.append(str(SMALL_NUMBERS[word]))
+        else:
+            result.append(word)
+        i += 1
+    return " ".join(result)
+
+
+def clean(text: str) -> str:
+    """Lowercases a transcribed line and drops punctuation, with spelled out numbers as digits."""
+    return words_to_numbers(" ".join(re.sub(r"[^\w\s]", " ", text.lower()).split()))
+
+
+class UsernameIndex:
+    """
+    Resolves usernames spoken in a transcript, like "cool gamer ninety nine" for CoolGamer99. Names are
+    indexed by a key without case, punctuation and spaces, so exact matches are a dictionary lookup. For
+    fuzzy matching the keys are also indexed by their letter pairs, and only the names that share the most
+    letter pairs with the spoken one are compared with it.
+    """
+
+    def __init__(self, names=(), cutoff: float = 0.9):
+        """
+        :param names: Usernames to index
+        :param cutoff: Minimum similarity of a fuzzy match, between 0 and 1
+        """
+        self.cutoff = cutoff
+        self.names = {}  # key -> username
+        self.bigrams = {}  # letter pair -> keys
+        self.add(names)
+
+    def __len__(self):
+        return len(self.names)
+
+    @staticmethod
+    def key(name: str) -> str:
+        return clean(name).replace(" ", "").replace("_", "")
+
+    @staticmethod
+    def letter_pairs(key: str) -> set:
+        return {key[i:i + 2] for i in range(len(key) - 1)} or {key}
+
+    def add(self, names):
+        for name in names:
+            key = self.key(name)
+            if key and key not in self.names:
+                self.names[key] = name
+                for pair in self.letter_pairs(key):
+                    self.bigrams.setdefault(pair, []).append(key)
+
+    def resolve(self, spoken: str) -> tuple | None:
+        """
+        :param spoken: The username as transcribed
+        :return: (username, similarity), None if no name is close enough or two names are about as close
+        """
+        key = self.key(spoken)
+        if not key:
+            return None
+        if key in self.names:
+            return self.names[key], 1.0
+
+        shared = Counter()
+        for pair in self.letter_pairs(key):
+            shared.update(self.bigrams.get(pair, ()))
+        matcher = difflib.SequenceMatcher(b=key, autojunk=False)
+        scores = []
+        for candidate, _ in shared.most_common(FUZZY_CANDIDATES):
+            matcher.set_seq1(candidate)
+            if matcher.real_quick_ratio() >= self.cutoff and matcher.quick_ratio() >= self.cutoff:
+                ratio = matcher.ratio()
+                if ratio >= self.cutoff:
+                    scores.append((ratio, candidate))
+        if not scores:
+            return None
+        scores.sort(reverse=True)
+        if len(scores) > 1 and scores[0][0] - scores[1][0] < 0.05:
+            LOGGER.info(f"'{spoken}' is ambiguous between {self.names[scores[0][1]]} and {self.names[scores[1][1]]}.")
+            return None
+        return self.names[scores[0][1]], scores[0][0]
+
+
+class VoiceCommands:
+    """
+    Recognizes spoken moderation commands in a transcript without the LLM, like "timeout CoolGamer99 for
+    10 minutes" or "ban spammer because of spam". A line is only taken as a command if it starts with one and
+    the target resolves to a known username, everything else is left for the LLM. A command is only carried
+    out if the spoken name matches a username exactly, apart from case, spaces and punctuation. A command whose
+    name only matched approximately is returned as unconfirmed, so the speaker can be asked to repeat it.
+    """
+
+    def __init__(self, usernames: UsernameIndex = None):
+        self.usernames = usernames or UsernameIndex()
+
+    def parse(self, text: str) -> dict | None:
+        """
+        :param text: One transcribed line without the timestamp and speaker
+        :return: The command, None if the line isn't one
+        """
+        match = COMMAND.match(clean(text))
+        if match is None:
+            return None
+        resolved = self.usernames.resolve(match["target"])
+        if resolved is None:
+            LOGGER.info(f"Heard a {match['action']} command, but '{match['target']}' isn't a known user.")
+            return None
+
+        command = {
+            "action": ACTIONS[match["action"]],
+            "target": resolved[0],
+            "similarity": resolved[1],
+            "exact": resolved[1] == 1.0
+        }
+        if match["amount"] is not None and command["action"] == "timeout":
+            amount = 1 if match["amount"] in ("a", "an") else int(match["amount"])
+            command["duration"] = min(max(amount * UNIT_SECONDS[match["unit"]], 1), MAX_TIMEOUT)
+        if match["reason"] is not None:
+            command["reason"] = match["reason"]
+        return command
+
+    def match(self, transcript: str, speakers) -> dict:
+        """
+        Finds the commands in a transcript.
+        :param transcript: Transcribed turn, one "[timestamp] <speaker>: text" line per utterance
+        :param speakers: Speakers whose commands are accepted, nobody's if it's empty
+        :return: The exact commands, the unconfirmed ones, the rest of the transcript and the seconds matching took
+        """
+        started = time.perf_counter()
+        commands = []
+        unconfirmed = []
+        remaining = []
+        for line in transcript.splitlines(keepends=True):
+            parsed = TRANSCRIPT_LINE.match(line)
+            command = None
+            if parsed is not None and parsed["speaker"] in speakers:
+                command = self.parse(parsed["text"])
+            if command is not None:
+                command["speaker"] = parsed["speaker"]
+                (commands if command["exact"] else unconfirmed).append(command)
+            else:
+                remaining.append(line)
+        return {
+            "commands": commands,
+            "unconfirmed": unconfirmed,
+            "remaining": "".join(remaining) if any(line.strip() for line in remaining) else "",
+            "seconds": time.perf_counter() - started
+        }
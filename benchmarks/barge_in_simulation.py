@@ -0,0 +1,157 @@
+"""
+Measures how long the bot keeps talking after a user starts speaking over it, by driving PlaybackScheduler and
+TurnTaking the way DiscordClient does. A player task plays the scheduled clips in 20 ms frames, a user's turn is
+answered with a response of a few clips, and a member joining gets a greeting that is still being generated when the
+user speaks over the first clip. The user's voice packets go through the same steps as DiscordClient.detect_barge_in
+and barge_in, and their new turn gets a response of its own. No Discord connection is needed.
+
+Compares playing everything to completion, barge-in that only drops the queue and the voice turn responses, and
+barge-in dropping every response. Reports how long until the interrupted responses are quiet, and how many of their
+clips still started playing after the user spoke.
+
+Run from the repository root:
+    python benchmarks/barge_in_simulation.py [--clips 3] [--clip-length 1] [--runs 5]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from LLMScheduler import VOICE, GREETING  # noqa: E402
+from PlaybackScheduler import PlaybackScheduler  # noqa: E402
+from TurnTaking import TurnTaking  # noqa: E402
+
+FRAME_LENGTH = 0.02
+SYNTHESIS_TIME = 0.2  # seconds to generate and synthesize a clip
+GREETING_TIME = 1.2  # seconds until the greeting is synthesized
+
+COMPLETION = "Play to completion"
+TURNS_ONLY = "Drop voice turns only"
+BARGE_IN = "Barge-in"
+
+
+class Bot:
+    """The playback side of DiscordClient: the audio player, the responses and barge-in."""
+
+    def __init__(self, mode: str, clips: int, clip_length: float):
+        self.mode = mode
+        self.clips = clips
+        self.frames = int(clip_length / FRAME_LENGTH)
+        self.playback = PlaybackScheduler()
+        self.turns = TurnTaking(self.respond_to_turn, turn_end_silence=0.3, pause_silence=0.1)
+        self.responses = {}  # playback group -> (task, whether it answers a voice turn)
+        self.stop = None  # set to stop the clip that is playing
+        self.played = []  # (clip, group, started, stopped)
+        self.heard = None
+
+    async def player(self):
+        while True:
+            item = await self.playback.get()
+            self.stop = stop = asyncio.Event()
+            started = time.perf_counter()
+            for _ in range(self.frames):
+                if stop.is_set():
+                    break
+                # Sending the frame would go here.
+                await asyncio.sleep(FRAME_LENGTH)
+            self.stop = None
+            self.played.append((item["audio"], item["group"], started, time.perf_counter()))
+
+    async def respond(self, name: str, clips: int, priority: int = VOICE, kind: str = None, delay: float = 0.0,
+                      turn: bool = False):
+        group = self.playback.new_group()
+        self.responses[group] = (asyncio.current_task(), turn)
+        try:
+            await asyncio.sleep(delay)
+            for clip in range(clips):
+                await asyncio.sleep(SYNTHESIS_TIME)
+                self.playback.put(f"{name} {clip + 1}", priority, kind, group)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.responses.pop(group, None)
+            self.playback.close_group(group)
+
+    async def respond_to_turn(self, transcript: str, segments: list):
+        await self.respond(transcript, self.clips if transcript == "question" else 1, turn=True)
+
+    def detect_barge_in(self):
+        """A voice packet from the user, on the event loop instead of the recorder thread."""
+        if self.heard is None:
+            self.heard = time.perf_counter()
+        if self.mode == COMPLETION or self.stop is None:
+            return
+        self.stop.set()
+        self.barge_in()
+
+    def barge_in(self):
+        self.playback.flush()
+        for group, (task, turn) in list(self.responses.items()):
+            if self.mode == TURNS_ONLY and not turn:
+                continue
+            if self.mode == BARGE_IN:
+                self.playback.drop(group)
+            task.cancel()
+
+    async def speak(self, text: str, packets: int):
+        self.turns.speech_started()
+        for _ in range(packets):
+            if text == "interruption":
+                self.detect_barge_in()
+            await asyncio.sleep(FRAME_LENGTH)
+        self.turns.speech_stopped()
+        self.turns.transcription_started()
+        await asyncio.sleep(0.05)
+        self.turns.transcription_finished({"timestamp": time.time(), "text": text})
+
+
+async def run(mode: str, clips: int, clip_length: float) -> tuple:
+    """Seconds from the first voice packet until the interrupted responses are quiet, and clips played after it."""
+    bot = Bot(mode, clips, clip_length)
+    player = asyncio.create_task(bot.player())
+
+    await bot.speak("question", 25)
+    await asyncio.sleep(0.1)
+    asyncio.create_task(bot.respond("greeting", 1, GREETING, "greeting:1", delay=GREETING_TIME))
+    while not bot.played and bot.stop is None:
+        await asyncio.sleep(FRAME_LENGTH)
+    await asyncio.sleep(random.uniform(0.2, clip_length - 0.2))
+    interrupted = {group for group in bot.responses} | {bot.playback.playing_group}
+    await bot.speak("interruption", 20)
+
+    # Wait for the response to the interruption to finish playing.
+    while not any(clip == "interruption 1" for clip, _, _, _ in bot.played):
+        await asyncio.sleep(0.05)
+    player.cancel()
+
+    old = [(clip, started, stopped) for clip, group, started, stopped in bot.played if group in interrupted]
+    quiet = max(stopped for _, _, stopped in old) - bot.heard
+    late = sum(1 for _, started, _ in old if started > bot.heard)
+    return quiet, late
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clips", type=int, default=3, help="Clips in the response that is interrupted")
+    parser.add_argument("--clip-length", type=float, default=1.0, help="Seconds per clip")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    logging.disable()
+    for mode in (COMPLETION, TURNS_ONLY, BARGE_IN):
+        results = [await run(mode, args.clips, args.clip_length) for _ in range(args.runs)]
+        times = [quiet for quiet, _ in results]
+        print(f"{mode:22s} bot quiet after p50 {np.percentile(times, 50) * 1000:7.1f} ms   "
+              f"p95 {np.percentile(times, 95) * 1000:7.1f} ms   "
+              f"clips of interrupted responses played after the user spoke: {sum(late for _, late in results)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
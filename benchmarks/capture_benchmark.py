@@ -0,0 +1,99 @@
+"""
+Compares the per-packet AudioSegment capture used by AutoRecordSink before the CaptureStore
+with the CaptureStore itself, for one minute of synthetic Discord voice packets.
+
+Run from the repository root: python benchmarks/capture_benchmark.py [--speakers N] [--minutes M]
+"""
+import argparse
+import gc
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from AudioCapture import CaptureStore  # noqa: E402
+
+PACKET_BYTES = 3840  # 20 ms of 48 kHz stereo s16
+PACKETS_PER_SECOND = 50
+
+
+def make_packets(speakers: int, minutes: float) -> list:
+    rng = np.random.default_rng(0)
+    packets = []
+    start = time.time()
+    total = int(minutes * 60 * PACKETS_PER_SECOND)
+    for i in range(total):
+        data = rng.integers(-3000, 3000, PACKET_BYTES // 2, dtype=np.int16)
+        packets.append((start + i / PACKETS_PER_SECOND, i % speakers, data))
+    return packets
+
+
+def received(packets: list):
+    # The voice decoder hands every packet to the sink as a freshly allocated bytes object.
+    for timestamp, user, data in packets:
+        yield timestamp, user, data.tobytes()
+
+
+def legacy_capture(packets: list):
+    from pydub import AudioSegment
+
+    audio_data = {}
+    utterances = []
+    for timestamp, user, data in received(packets):
+        # WaveSink.write
+        audio_data.setdefault(user, io.BytesIO()).write(data)
+        seg = AudioSegment.from_raw(io.BytesIO(data), sample_width=2, frame_rate=48000, channels=2)
+        utterances.append((timestamp, user, seg))
+    return audio_data, utterances
+
+
+def store_capture(packets: list):
+    capture = CaptureStore()
+    for timestamp, user, data in received(packets):
+        capture.append(user, data, timestamp)
+    return capture
+
+
+def measure(name: str, func, packets: list, minutes: float):
+    gc.collect()
+    collections_before = sum(stat["collections"] for stat in gc.get_stats())
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func(packets)
+    elapsed = time.perf_counter() - started
+    snapshot = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    collections = sum(stat["collections"] for stat in gc.get_stats()) - collections_before
+    blocks = sum(stat.count for stat in snapshot.statistics("filename"))
+
+    print(f"{name:>14}: {elapsed / minutes * 1000:8.1f} ms/min  "
+          f"retained {current / minutes / 2 ** 20:7.2f} MiB/min  "
+          f"peak {peak / minutes / 2 ** 20:7.2f} MiB/min  "
+          f"live blocks {blocks / minutes:9.0f}/min  "
+          f"gc runs {collections / minutes:6.1f}/min")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--speakers", type=int, default=3)
+    parser.add_argument("--minutes", type=float, default=1.0)
+    args = parser.parse_args()
+
+    packets = make_packets(args.speakers, args.minutes)
+    raw = len(packets) * PACKET_BYTES
+    print(f"{len(packets)} packets from {args.speakers} speakers, {raw / 2 ** 20:.2f} MiB of raw PCM")
+
+    measure("AudioSegment", legacy_capture, packets, args.minutes)
+    capture = measure("CaptureStore", store_capture, packets, args.minutes)
+    print(f"CaptureStore holds {capture.nbytes() / 2 ** 20:.2f} MiB of audio")
+
+
+if __name__ == "__main__":
+    main()
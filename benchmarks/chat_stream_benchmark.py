@@ -0,0 +1,93 @@
+"""
+Compares the time until the first text of a !chat reply is visible when the reply waits for the complete
+response with streaming it into a reply that is edited as it grows. Ollama is played by a stand-in server (see
+ollama_standin.py) and Discord by messages that take a fixed time per API call.
+
+Run from the repository root:
+    python benchmarks/chat_stream_benchmark.py [--token-latency 0.05] [--api-latency 0.15] [--interval 1.0]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from OllamaChat import OllamaClient  # noqa: E402
+from StreamingReply import StreamingReply  # noqa: E402
+from ollama_standin import StandIn  # noqa: E402
+
+MESSAGE = "[2025-05-12 13.59:53] <John>: What is Python?"
+
+
+class FakeMessage:
+    """A Discord message whose edits take api_latency seconds, recording when each edit was made."""
+    calls = []
+
+    def __init__(self, content: str, api_latency: float):
+        self.content = content
+        self.api_latency = api_latency
+
+    @classmethod
+    async def post(cls, content: str, api_latency: float):
+        await asyncio.sleep(api_latency)
+        cls.calls.append(time.perf_counter())
+        return cls(content, api_latency)
+
+    async def edit(self, content: str):
+        await asyncio.sleep(self.api_latency)
+        FakeMessage.calls.append(time.perf_counter())
+        self.content = content
+
+
+async def whole(client: OllamaClient, api_latency: float) -> float:
+    started = time.perf_counter()
+    result = await client.ollama_chat(MESSAGE)
+    await FakeMessage.post(result["response"], api_latency)
+    return time.perf_counter() - started
+
+
+async def streamed(client: OllamaClient, api_latency: float, interval: float) -> tuple:
+    started = time.perf_counter()
+
+    async def post(content: str):
+        return await FakeMessage.post(content, api_latency)
+
+    reply = StreamingReply(post, post, interval, started)
+    await reply.start()
+    async for chunk in client.ollama_chat_stream(MESSAGE):
+        reply.feed(chunk)
+    stats = await reply.finish()
+    return stats["first_visible"], time.perf_counter() - started, stats["edits"]
+
+
+def max_calls_per_window(calls: list, window: float = 5.0) -> int:
+    return max((sum(1 for t in calls if start <= t < start + window) for start in calls), default=0)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.3, help="Stand-in seconds before the first token")
+    parser.add_argument("--token-latency", type=float, default=0.05, help="Stand-in seconds per token")
+    parser.add_argument("--api-latency", type=float, default=0.15, help="Seconds per Discord API call")
+    parser.add_argument("--interval", type=float, default=1.0, help="Minimum seconds between edits")
+    args = parser.parse_args()
+
+    standin = StandIn(latency=args.latency, token_latency=args.token_latency, load_time=0).start()
+    client = OllamaClient(None, hosts=[standin.url])
+
+    waited = await whole(client, args.api_latency)
+    print(f"Complete reply:  first text visible after {waited:.2f} s")
+
+    FakeMessage.calls = []
+    first_visible, done, edits = await streamed(client, args.api_latency, args.interval)
+    print(f"Streamed reply:  first text visible after {first_visible:.2f} s, complete after {done:.2f} s, "
+          f"{edits} edits, at most {max_calls_per_window(FakeMessage.calls)} API calls in 5 s")
+
+    standin.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
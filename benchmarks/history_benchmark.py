@@ -0,0 +1,65 @@
+"""
+Replays a long synthetic conversation through OllamaClient, once with the whole history sent on every call
+and once with the token-budgeted history, and reports prompt tokens and call latency as the conversation
+grows. Needs a running Ollama server with the bot's model pulled.
+
+Run from the repository root:
+    python benchmarks/history_benchmark.py [--turns 120] [--budget 2048] [--report-every 20]
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from OllamaChat import OllamaClient  # noqa: E402
+
+SPEAKERS = ["John", "Maria", "Alex"]
+QUESTIONS = [
+    "What is Python?", "Can you recommend a good book about space?", "How do I make a cup of tea?",
+    "What did you think about the last game?", "Tell me a short joke.", "Why is the sky blue?",
+    "What should we play next?", "How far away is the moon?", "What's your favourite colour?",
+]
+
+
+def turn(i: int) -> str:
+    minutes, seconds = divmod(i * 30, 60)
+    return f"[2025-05-12 13.{minutes % 60:02d}:{seconds:02d}] <{SPEAKERS[i % len(SPEAKERS)]}>: {QUESTIONS[i % len(QUESTIONS)]}"
+
+
+async def replay(budget: int | None, turns: int, report_every: int):
+    client = OllamaClient(budget)
+    calls = []
+    for i in range(turns):
+        result = await client.ollama_chat(turn(i))
+        if not result["success"]:
+            raise SystemExit(f"Ollama call failed: {result['error']}")
+        calls.append(client.last_call)
+        if (i + 1) % report_every == 0:
+            recent = calls[-report_every:]
+            print(f"  turns {i + 2 - report_every:4d}-{i + 1:4d}: "
+                  f"prompt tokens {np.mean([c['prompt_tokens'] or 0 for c in recent]):7.0f}  "
+                  f"prompt eval {np.mean([c['prompt_seconds'] for c in recent]):6.2f} s  "
+                  f"call {np.mean([c['seconds'] for c in recent]):6.2f} s")
+    if client.history.summarizing is not None:
+        await client.history.summarizing
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=120)
+    parser.add_argument("--budget", type=int, default=2048)
+    parser.add_argument("--report-every", type=int, default=20)
+    args = parser.parse_args()
+
+    print("Whole history")
+    await replay(None, args.turns, args.report_every)
+    print(f"Token budget {args.budget}")
+    await replay(args.budget, args.turns, args.report_every)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,132 @@
+"""
+Compares the default fp32 models with the dynamically quantized int8 inference mode on CPU, to pick
+the inference_mode and inference_threads config values for a deployment.
+
+For Whisper it reports real-time factor, p50/p95 latency and word error rate against reference
+transcripts. For TTS it reports real-time factor, p50/p95 latency and an intelligibility word error
+rate, measured by transcribing the synthesized audio with the fp32 Whisper model.
+
+The clip set is a directory of 16 kHz mono WAV files, each with a reference transcript in a .txt file
+of the same name. Run from the repository root:
+    python benchmarks/inference_benchmark.py --clips DIR [--model turbo] [--threads 4] [--skip-tts]
+"""
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+import wave
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from SpeechToText import STTManager  # noqa: E402
+
+MODES = ("default", "quantized")
+
+
+def load_clip_set(directory: str) -> list:
+    clips = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.wav"))):
+        with wave.open(path, "rb") as f:
+            if f.getframerate() != 16000 or f.getnchannels() != 1 or f.getsampwidth() != 2:
+                raise SystemExit(f"{path} is not a 16 kHz mono 16-bit WAV file.")
+            audio = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16).astype(np.float32) / 32768.0
+        with open(os.path.splitext(path)[0] + ".txt", encoding="utf-8") as f:
+            reference = f.read().strip()
+        clips.append((os.path.basename(path), audio, reference))
+    if not clips:
+        raise SystemExit(f"No WAV files in {directory}.")
+    return clips
+
+
+def words(text: str) -> list:
+    return re.sub(r"[^a-z0-9' ]", " ", text.lower()).split()
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    ref, hyp = words(reference), words(hypothesis)
+    distances = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        previous, distances[0] = distances[0], i
+        for j, hyp_word in enumerate(hyp, 1):
+            previous, distances[j] = distances[j], min(distances[j] + 1, distances[j - 1] + 1,
+                                                       previous + (ref_word != hyp_word))
+    return distances[len(hyp)] / max(len(ref), 1)
+
+
+def summarize(name: str, latencies: list, audio_seconds: float, errors: list):
+    latencies = sorted(latencies)
+    p50 = latencies[len(latencies) // 2]
+    p95 = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+    rtf = sum(latencies) / audio_seconds
+    wer = float(np.mean(errors))
+    print(f"  {name:>10}: RTF {rtf:5.3f}  p50 {p50 * 1000:8.1f} ms  p95 {p95 * 1000:8.1f} ms  WER {wer * 100:5.1f}%")
+    return wer
+
+
+def benchmark_stt(args, clips: list) -> STTManager:
+    print(f"Whisper {args.model}")
+    audio_seconds = sum(audio.shape[0] for _, audio, _ in clips) / 16000
+    results = {}
+    reference_model = None
+    for mode in MODES:
+        stt = STTManager(args.model, device="cpu", quantize=mode == "quantized", num_threads=args.threads)
+        stt.transcribe_array(clips[0][1])  # warm-up
+        latencies, errors = [], []
+        for _ in range(args.repeats):
+            for _, audio, reference in clips:
+                started = time.perf_counter()
+                result = stt.transcribe_array(audio)
+                latencies.append(time.perf_counter() - started)
+                errors.append(word_error_rate(reference, result["transcription"]))
+        results[mode] = summarize(mode, latencies, audio_seconds * args.repeats, errors)
+        if mode == "default":
+            reference_model = stt
+    print(f"  WER delta of the quantized model: {(results['quantized'] - results['default']) * 100:+.1f} points")
+    return reference_model
+
+
+def benchmark_tts(args, clips: list, stt: STTManager):
+    from scipy.signal import resample_poly
+    from TextToSpeech import TTSManager
+
+    print("TTS jenny")
+    results = {}
+    for mode in MODES:
+        tts = TTSManager(quantize=mode == "quantized", num_threads=args.threads)
+        tts.text_to_audio("Hello.")  # warm-up
+        latencies, errors, audio_seconds = [], [], 0.0
+        for _ in range(args.repeats):
+            for _, _, text in clips:
+                started = time.perf_counter()
+                wav = np.asarray(tts.text_to_audio(text), dtype=np.float32)
+                latencies.append(time.perf_counter() - started)
+                audio_seconds += wav.shape[0] / tts.sample_rate
+                transcript = stt.transcribe_array(resample_poly(wav, 16000, tts.sample_rate).astype(np.float32))
+                errors.append(word_error_rate(text, transcript["transcription"]))
+        results[mode] = summarize(mode, latencies, audio_seconds, errors)
+    print(f"  Intelligibility WER delta of the quantized model: "
+          f"{(results['quantized'] - results['default']) * 100:+.1f} points")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clips", required=True, help="Directory of 16 kHz mono WAV files with .txt transcripts")
+    parser.add_argument("--model", default="turbo")
+    parser.add_argument("--threads", type=int, help="Torch threads, as the inference_threads config value")
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--skip-tts", action="store_true")
+    args = parser.parse_args()
+
+    clips = load_clip_set(args.clips)
+    print(f"{len(clips)} clips, {sum(audio.shape[0] for _, audio, _ in clips) / 16000:.1f} s of audio")
+    stt = benchmark_stt(args, clips)
+    if not args.skip_tts:
+        benchmark_tts(args, clips, stt)
+
+
+if __name__ == "__main__":
+    main()
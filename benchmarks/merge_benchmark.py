@@ -0,0 +1,118 @@
+"""
+Benchmarks the vectorized utterance merge (CaptureStore.merge_runs) against the per-packet Python loop
+STTManager.process_utterances used before, on synthetic multi-speaker streams, and checks that both
+produce the same merged utterances.
+
+Run from the repository root: python benchmarks/merge_benchmark.py [--speakers N] [--minutes M]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from AudioCapture import CaptureStore, STT_SAMPLE_RATE  # noqa: E402
+
+PACKET_SAMPLES = 320  # 20 ms of 16 kHz mono
+MERGE_THRESHOLD = 0.5
+
+
+def make_stream(speakers: int, minutes: float, seed: int = 0) -> CaptureStore:
+    """
+    Simulates speakers taking overlapping turns: each speaker alternates between talking for 0.2-6 s
+    and pausing for 0.1-3 s, so both sides of the merge threshold are exercised.
+    """
+    rng = np.random.default_rng(seed)
+    duration = minutes * 60
+    packets = []
+    for user in range(speakers):
+        t = rng.uniform(0, 2)
+        while t < duration:
+            talk = rng.uniform(0.2, 6)
+            count = int(talk / 0.02)
+            # Packets arrive with a little network jitter.
+            times = t + np.arange(count) * 0.02 + rng.uniform(0, 0.005, count)
+            packets.extend((float(ts), 1000 + user) for ts in times)
+            t += count * 0.02 + rng.uniform(0.1, 3)
+    packets.sort()
+
+    capture = CaptureStore(sample_rate=STT_SAMPLE_RATE, channels=1)
+    samples = rng.standard_normal(PACKET_SAMPLES).astype(np.float32)
+    for timestamp, user in packets:
+        capture.append_samples(user, samples, timestamp)
+    return capture
+
+
+def reference_merge(capture: CaptureStore) -> list:
+    """The merge loop from STTManager.process_utterances before it was vectorized."""
+    timestamps, users, offsets, lengths = capture.packets()
+    sorted_utterances = sorted(range(len(capture)), key=lambda i: (users[i], timestamps[i]))
+
+    merged_utterances = []
+    current_merge = None
+    for i in sorted_utterances:
+        timestamp = float(timestamps[i])
+        user = capture.user_ids[users[i]]
+        offset = int(offsets[i])
+        end = offset + int(lengths[i])
+        if current_merge is None:
+            current_merge = {"end": timestamp, "user": user, "offset": offset, "offset_end": end}
+        elif user == current_merge["user"] and timestamp - current_merge["end"] < MERGE_THRESHOLD:
+            current_merge["end"] = timestamp
+            current_merge["offset_end"] = end
+        else:
+            merged_utterances.append(current_merge)
+            current_merge = {"end": timestamp, "user": user, "offset": offset, "offset_end": end}
+    if current_merge is not None:
+        merged_utterances.append(current_merge)
+
+    merged_utterances = [(m["end"], m["user"], m["offset"], m["offset_end"]) for m in merged_utterances]
+    return sorted(merged_utterances, key=lambda x: x[0])
+
+
+def vectorized_merge(capture: CaptureStore) -> list:
+    """Same output shape as reference_merge, built the way STTManager.merge_utterances does."""
+    end_timestamps, users, offsets, offset_ends = capture.merge_runs(MERGE_THRESHOLD)
+    order = np.argsort(end_timestamps, kind="stable")
+    return [(float(end_timestamps[i]), capture.user_ids[users[i]], int(offsets[i]), int(offset_ends[i]))
+            for i in order]
+
+
+def best_of(func, capture: CaptureStore, repeats: int) -> tuple:
+    timings = []
+    result = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = func(capture)
+        timings.append(time.perf_counter() - started)
+    return result, min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--speakers", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--minutes", type=float, nargs="+", default=[1, 5])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    equivalent = True
+    for speakers in args.speakers:
+        for minutes in args.minutes:
+            capture = make_stream(speakers, minutes, seed=speakers)
+            expected, loop_time = best_of(reference_merge, capture, args.repeats)
+            merged, vector_time = best_of(vectorized_merge, capture, args.repeats)
+            same = merged == expected
+            equivalent &= same
+            print(f"{speakers} speakers, {minutes:4.1f} min: {len(capture):7d} packets -> {len(merged):5d} utterances  "
+                  f"loop {loop_time * 1000:8.2f} ms  vectorized {vector_time * 1000:7.2f} ms  "
+                  f"speed-up {loop_time / vector_time:6.1f}x  {'equivalent' if same else 'DIFFERENT'}")
+
+    if not equivalent:
+        sys.exit("The vectorized merge does not match the reference merge.")
+
+
+if __name__ == "__main__":
+    main()
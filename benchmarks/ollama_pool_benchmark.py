@@ -0,0 +1,99 @@
+"""
+Runs concurrent chat requests through OllamaPool against local Ollama stand-in servers with different
+latencies (see ollama_standin.py), and compares them with sending everything to a single host. Halfway
+through the pooled run one host is stopped, and it is restarted a little later, to show the ejection,
+failover and re-probing.
+
+Run from the repository root:
+    python benchmarks/ollama_pool_benchmark.py [--latencies 0.2 0.3 0.6] [--requests 60] [--concurrency 6]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from OllamaPool import OllamaPool  # noqa: E402
+from ollama_standin import StandIn  # noqa: E402
+
+MODEL = "llama3.2:3b"
+MESSAGES = [{"role": "user", "content": "[2025-05-12 13.59:53] <John>: What is Python?"}]
+
+
+async def run(pool: OllamaPool, requests: int, concurrency: int, on_progress=None) -> tuple:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, failures = [], 0
+    done = 0
+
+    async def one():
+        nonlocal failures, done
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await pool.chat(model=MODEL, messages=MESSAGES)
+                latencies.append(time.perf_counter() - started)
+            except Exception:
+                failures += 1
+            done += 1
+            if on_progress is not None:
+                await on_progress(done)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return latencies, failures, time.perf_counter() - started
+
+
+def report(name: str, latencies: list, failures: int, elapsed: float, pool: OllamaPool):
+    latencies = sorted(latencies)
+    p50 = latencies[len(latencies) // 2] if latencies else float("nan")
+    p95 = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] if latencies else float("nan")
+    print(f"{name}: {len(latencies)} ok, {failures} failed in {elapsed:.1f} s  "
+          f"p50 {p50:.2f} s  p95 {p95:.2f} s  mean {np.mean(latencies):.2f} s")
+    for url, host in pool.metrics().items():
+        print(f"  {url}: {host['calls']:3d} calls  {host['failures']} failures  "
+              f"{'healthy' if host['healthy'] else 'ejected'}")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latencies", type=float, nargs="+", default=[0.2, 0.3, 0.6])
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=6)
+    parser.add_argument("--load-time", type=float, default=1.0)
+    args = parser.parse_args()
+
+    standins = [StandIn(latency=latency, load_time=args.load_time).start() for latency in args.latencies]
+
+    single = OllamaPool([standins[0].url], timeout=10)
+    report("Single host", *await run(single, args.requests, args.concurrency), single)
+
+    pool = OllamaPool([standin.url for standin in standins], timeout=10, probe_interval=1)
+    stopped = {}
+
+    async def on_progress(done: int):
+        # Stop the fastest host halfway through and bring it back a quarter later.
+        if done == args.requests // 2:
+            stopped["port"] = standins[0].server.server_address[1]
+            standins[0].stop()
+            print(f"  stopped {standins[0].url}")
+        elif done == args.requests * 3 // 4 and "port" in stopped:
+            standins[0] = StandIn(stopped.pop("port"), args.latencies[0], load_time=args.load_time).start()
+            print(f"  restarted {standins[0].url}")
+
+    report("Pool", *await run(pool, args.requests, args.concurrency, on_progress), pool)
+    # Give the prober a moment to notice the restarted host.
+    await asyncio.sleep(1.5)
+    healthy = [url for url, host in pool.metrics().items() if host["healthy"]]
+    print(f"Healthy after re-probing: {len(healthy)}/{len(standins)}")
+
+    for standin in standins:
+        standin.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
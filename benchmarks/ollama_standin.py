@@ -0,0 +1,188 @@
+"""
+A stand-in for an Ollama server, for exercising the bot's Ollama client pool without GPUs. It implements the
+parts of the HTTP API the bot uses: /api/chat (streaming and not), /api/embed, /api/ps and /api/tags.
+Responses are canned text, with a configurable latency per request, per generated token and for loading a
+model that isn't loaded yet. Like Ollama, only a limited number of requests is generated at a time.
+keep_alive is honoured, so preloading and unloading can be tested too.
+
+Run one from the repository root, for example:
+    python benchmarks/ollama_standin.py --port 11435 --latency 0.2 --load-time 2
+or start them in-process with StandIn, as benchmarks/ollama_pool_benchmark.py does.
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY = ("Python is a programming language that is easy to read. It is used for scripts, websites and data "
+         "analysis. Many people learn it as their first language.")
+
+
+class StandIn:
+    def __init__(self, port: int = 0, latency: float = 0.2, token_latency: float = 0.01, load_time: float = 1.0,
+                 fail_rate: float = 0.0, keep_alive: float = 300, parallel: int = 1):
+        """
+        :param port: Port to listen on, 0 picks a free one
+        :param latency: Seconds before the first token of every chat
+        :param token_latency: Seconds per generated token
+        :param load_time: Seconds to load a model that isn't loaded
+        :param fail_rate: Share of requests answered with a 500 error
+        :param keep_alive: Default seconds a model stays loaded after a request
+        :param parallel: Requests generated at the same time, the rest wait like with OLLAMA_NUM_PARALLEL
+        """
+        self.latency = latency
+        self.token_latency = token_latency
+        self.load_time = load_time
+        self.fail_rate = fail_rate
+        self.keep_alive = keep_alive
+        self.loaded = {}  # model -> unload time
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.slots = threading.Semaphore(parallel)
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def load(self, model: str, keep_alive) -> float:
+        """Marks a model loaded, returning the seconds it took to load."""
+        with self.lock:
+            now = time.time()
+            self.loaded = {m: until for m, until in self.loaded.items() if until > now}
+            load_seconds = 0.0 if model in self.loaded else self.load_time
+            seconds = self.keep_alive if keep_alive is None else keep_alive
+            if isinstance(seconds, str):
+                seconds = float(seconds.rstrip("s"))
+            if seconds == 0:
+                self.loaded.pop(model, None)
+            else:
+                self.loaded[model] = now + load_seconds + (seconds if seconds > 0 else 1e9)
+            return load_seconds
+
+    def _handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, body: dict, status: int = 200):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path == "/api/ps":
+                    now = time.time()
+                    models = [{"name": m, "model": m,
+                               "expires_at": datetime.datetime.fromtimestamp(until, datetime.timezone.utc).isoformat()}
+                              for m, until in standin.loaded.items() if until > now]
+                    self.send_json({"models": models})
+                elif self.path == "/api/tags":
+                    self.send_json({"models": [{"name": "llama3.2:3b", "model": "llama3.2:3b"}]})
+                else:
+                    self.send_response(200)
+                    self.end_headers()
+                    self.wfile.write(b"Ollama is running")
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with standin.lock:
+                    standin.requests += 1
+                if random.random() < standin.fail_rate:
+                    self.send_json({"error": "stand-in failure"}, 500)
+                    return
+                with standin.slots:
+                    if self.path == "/api/chat":
+                        self.chat(request)
+                    elif self.path == "/api/embed":
+                        self.embed(request)
+                    else:
+                        self.send_json({"error": "not found"}, 404)
+
+            def chat(self, request: dict):
+                model = request.get("model", "")
+                load_seconds = standin.load(model, request.get("keep_alive"))
+                messages = request.get("messages") or []
+                prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+                time.sleep(load_seconds + standin.latency)
+                tokens = REPLY.split(" ") if messages else []
+                stats = {
+                    "model": model,
+                    "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                    "done": True,
+                    "done_reason": "stop" if messages else "load",
+                    "total_duration": int((load_seconds + standin.latency + len(tokens) * standin.token_latency) * 1e9),
+                    "load_duration": int(load_seconds * 1e9),
+                    "prompt_eval_count": prompt_tokens,
+                    "prompt_eval_duration": int(standin.latency * 1e9),
+                    "eval_count": len(tokens),
+                    "eval_duration": int(len(tokens) * standin.token_latency * 1e9)
+                }
+
+                if not request.get("stream", True):
+                    time.sleep(len(tokens) * standin.token_latency)
+                    self.send_json({**stats, "message": {"role": "assistant", "content": " ".join(tokens)}})
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.end_headers()
+                for i, token in enumerate(tokens):
+                    time.sleep(standin.token_latency)
+                    part = {"model": model, "created_at": stats["created_at"], "done": False,
+                            "message": {"role": "assistant", "content": token if i == 0 else " " + token}}
+                    self.wfile.write(json.dumps(part).encode() + b"\n")
+                    self.wfile.flush()
+                self.wfile.write(json.dumps({**stats, "message": {"role": "assistant", "content": ""}}).encode() + b"\n")
+
+            def embed(self, request: dict):
+                inputs = request.get("input", "")
+                inputs = [inputs] if isinstance(inputs, str) else inputs
+                time.sleep(standin.load(request.get("model", ""), request.get("keep_alive")))
+                embeddings = [[b / 255 for b in hashlib.sha256(text.encode()).digest()] for text in inputs]
+                self.send_json({"model": request.get("model", ""), "embeddings": embeddings})
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--token-latency", type=float, default=0.01)
+    parser.add_argument("--load-time", type=float, default=1.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--parallel", type=int, default=1)
+    args = parser.parse_args()
+
+    standin = StandIn(args.port, args.latency, args.token_latency, args.load_time, args.fail_rate,
+                      parallel=args.parallel)
+    print(f"Ollama stand-in listening on {standin.url}")
+    try:
+        standin.server.serve_forever()
+    except KeyboardInterrupt:
+        standin.stop()
+
+
+if __name__ == "__main__":
+    main()
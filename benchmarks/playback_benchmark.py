@@ -0,0 +1,77 @@
+"""
+Compares the time from synthesized samples to the first playable 20 ms frame for the previous file-based playback,
+which wrote a WAV and started an ffmpeg process per clip to resample it to 48 kHz stereo, and for converting the
+samples in-process to PCM that is played from memory. Synthetic tones stand in for TTS output, so no TTS model is
+needed. The ffmpeg path is skipped if ffmpeg isn't installed.
+
+Run from the repository root:
+    python benchmarks/playback_benchmark.py [--sample-rate 22050] [--lengths 0.5 1 2 5] [--runs 20]
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from AudioCapture import to_discord_pcm, write_wav, DISCORD_SAMPLE_RATE, DISCORD_CHANNELS  # noqa: E402
+
+FRAME_SIZE = DISCORD_SAMPLE_RATE // 50 * DISCORD_CHANNELS * 2
+
+
+def tone(seconds: float, sample_rate: int) -> np.ndarray:
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    return (0.5 * np.sin(2 * np.pi * 220 * t) * np.hanning(t.shape[0])).astype(np.float32)
+
+
+def via_ffmpeg(samples: np.ndarray, sample_rate: int, directory: str) -> float:
+    """Seconds until ffmpeg hands over the first frame, the way discord.FFmpegPCMAudio reads it."""
+    started = time.perf_counter()
+    path = os.path.join(directory, "clip.wav")
+    write_wav(path, samples, sample_rate, channels=1)
+    process = subprocess.Popen(["ffmpeg", "-i", path, "-f", "s16le", "-ar", str(DISCORD_SAMPLE_RATE),
+                                "-ac", str(DISCORD_CHANNELS), "-loglevel", "warning", "pipe:1"],
+                               stdout=subprocess.PIPE, stdin=subprocess.DEVNULL)
+    process.stdout.read(FRAME_SIZE)
+    elapsed = time.perf_counter() - started
+    process.kill()
+    process.wait()
+    return elapsed
+
+
+def in_process(samples: np.ndarray, sample_rate: int) -> float:
+    started = time.perf_counter()
+    pcm = to_discord_pcm(samples, sample_rate)
+    bytes(memoryview(pcm)[:FRAME_SIZE])
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sample-rate", type=int, default=22050, help="Sample rate of the TTS model's output")
+    parser.add_argument("--lengths", type=float, nargs="+", default=[0.5, 1.0, 2.0, 5.0])
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    ffmpeg = shutil.which("ffmpeg") is not None
+    if not ffmpeg:
+        print("ffmpeg not found, only timing the in-process conversion.")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for length in args.lengths:
+            samples = tone(length, args.sample_rate)
+            memory = np.median([in_process(samples, args.sample_rate) for _ in range(args.runs)])
+            line = f"{length:4.1f} s clip: in-process {memory * 1000:6.2f} ms"
+            if ffmpeg:
+                files = np.median([via_ffmpeg(samples, args.sample_rate, directory) for _ in range(args.runs)])
+                line += f"   WAV + ffmpeg {files * 1000:6.2f} ms"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
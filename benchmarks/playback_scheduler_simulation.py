@@ -0,0 +1,139 @@
+"""
+Replays a busy stretch of a voice chat through the previous FIFO playback queue and through PlaybackScheduler: a
+streamed reply, members rejoining and getting greeted repeatedly, a burst of error messages and replies that come in
+late. Clips "play" by sleeping for their length, and everything is scaled down so a run takes a few seconds. Reports
+how many clips played, how old they were when they started, and how many played after they were stale. Also checks
+that clips arriving after a flush for the flushed responses, the one that was playing too, are dropped, even after
+many more responses were dropped since.
+
+Run from the repository root:
+    python benchmarks/playback_scheduler_simulation.py [--scale 0.05]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from LLMScheduler import VOICE, GREETING, PRIORITY_NAMES  # noqa: E402
+from PlaybackScheduler import PlaybackScheduler  # noqa: E402
+
+MAX_AGE = {"voice": 30, "greeting": 20, "twitch": 60}
+
+# (seconds into the run, priority, kind, response, clip length in seconds)
+EVENTS = [
+    (0.0, VOICE, None, "reply 1", 4.0),
+    (0.5, VOICE, None, "reply 1", 5.0),
+    (1.0, VOICE, None, "reply 1", 4.0),
+    (2.0, GREETING, "greeting:1", "greeting 1a", 3.0),
+    (3.0, GREETING, "greeting:1", "greeting 1b", 3.0),
+    (4.0, GREETING, "greeting:2", "greeting 2", 3.0),
+    (5.0, GREETING, "greeting:1", "greeting 1c", 3.0),
+    (6.0, VOICE, "error", "error 1", 2.0),
+    (6.5, VOICE, "error", "error 2", 2.0),
+    (7.0, VOICE, "error", "error 3", 2.0),
+    (8.0, VOICE, None, "reply 2", 6.0),
+    (8.5, VOICE, None, "reply 2", 6.0),
+    (9.0, GREETING, "greeting:3", "greeting 3", 3.0),
+    (10.0, VOICE, None, "reply 3", 8.0),
+    (10.5, VOICE, None, "reply 3", 8.0),
+]
+
+
+async def feed(put, scale: float):
+    started = time.perf_counter()
+    for at, priority, kind, response, length in EVENTS:
+        await asyncio.sleep(max(0.0, started + at * scale - time.perf_counter()))
+        put({"response": response, "priority": priority, "kind": kind, "length": length,
+             "queued": time.perf_counter()})
+
+
+async def play(get, scale: float, total: int) -> list:
+    """Plays until the queue stays empty, returns (clip, age in unscaled seconds)."""
+    played = []
+    while True:
+        try:
+            clip = await asyncio.wait_for(get(), timeout=2 * scale + 0.5)
+        except asyncio.TimeoutError:
+            return played
+        played.append((clip, (time.perf_counter() - clip["queued"]) / scale))
+        await asyncio.sleep(clip["length"] * scale)
+        if len(played) == total:
+            return played
+
+
+async def run_fifo(scale: float) -> list:
+    queue = asyncio.Queue()
+    feeder = asyncio.create_task(feed(queue.put_nowait, scale))
+    played = await play(queue.get, scale, len(EVENTS))
+    await feeder
+    return played
+
+
+async def run_scheduler(scale: float) -> tuple:
+    scheduler = PlaybackScheduler({name: age * scale for name, age in MAX_AGE.items()})
+    groups = {}
+
+    def put(clip: dict):
+        group = groups.setdefault(clip["response"], scheduler.new_group())
+        scheduler.put(clip, clip["priority"], clip["kind"], group)
+
+    async def get():
+        return (await scheduler.get())["audio"]
+
+    feeder = asyncio.create_task(feed(put, scale))
+    played = await play(get, scale, len(EVENTS))
+    await feeder
+    return played, scheduler.metrics()
+
+
+async def check_flush() -> bool:
+    """Flushes while a response plays and another is queued, then queues more clips for both and a new one."""
+    scheduler = PlaybackScheduler()
+    playing, queued, new = scheduler.new_group(), scheduler.new_group(), scheduler.new_group()
+    scheduler.put("playing 1", VOICE, group=playing)
+    scheduler.put("queued 1", GREETING, group=queued)
+    await scheduler.get()
+    scheduler.flush()
+    scheduler.put("playing 2", VOICE, group=playing)
+    scheduler.put("queued 2", GREETING, group=queued)
+    scheduler.put("new 1", VOICE, group=new)
+    played = [(await scheduler.get())["audio"]]
+
+    # A barge-in drops many responses at once, the earlier ones have to stay dropped.
+    for _ in range(200):
+        scheduler.drop(scheduler.new_group())
+    scheduler.put("playing 3", VOICE, group=playing)
+    scheduler.put("queued 3", GREETING, group=queued)
+    return played == ["new 1"] and scheduler.queue_depth() == 0
+
+
+def report(name: str, played: list):
+    ages = [age for _, age in played]
+    stale = sum(1 for clip, age in played if age > MAX_AGE[PRIORITY_NAMES[clip["priority"]]])
+    print(f"{name:20s} {len(played):2d} clips played, age at play p50 {np.percentile(ages, 50):5.1f} s, "
+          f"max {max(ages):5.1f} s, {stale} played stale")
+    print(" " * 21 + ", ".join(clip["response"] for clip, _ in played))
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=float, default=0.05, help="Real seconds per simulated second")
+    args = parser.parse_args()
+
+    logging.disable()
+    report("FIFO queue", await run_fifo(args.scale))
+    played, metrics = await run_scheduler(args.scale)
+    report("PlaybackScheduler", played)
+    print(" " * 21 + f"expired {metrics['expired']}, coalesced {metrics['coalesced']}, "
+          f"queue depth p95 {metrics['depth_p95']}")
+    print(f"Clips of flushed responses dropped: {'yes' if await check_flush() else 'NO'}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
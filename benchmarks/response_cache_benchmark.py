@@ -0,0 +1,80 @@
+"""
+Replays transcribed voice turns through ResponseCache and reports the hit rate, and the hits that returned an entry
+stored for another speaker, which would replay one member's answer to someone else. Two members ask the same and
+similar questions, repeat their own, and answer with short context-dependent lines. A hashed bag-of-words embedding
+stands in for the Ollama embedding model, so no server is needed.
+
+Run from the repository root:
+    python benchmarks/response_cache_benchmark.py [--similarity 0.8]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import zlib
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ResponseCache import ResponseCache, normalize, speakers  # noqa: E402
+
+QUESTIONS = [
+    "what is my name",
+    "what is my favourite game",
+    "how long have I been in the call",
+    "can you tell me a joke about cats",
+    "what did I say about the weather",
+]
+SIMILAR = {
+    "what is my name": "what's my name again",
+    "can you tell me a joke about cats": "tell me a joke about cats",
+}
+
+
+def transcript(speaker: str, text: str, second: int) -> str:
+    return f"[2025-05-12 13.59:{second:02d}] <{speaker}>: {text}\n"
+
+
+def turns() -> list:
+    lines = []
+    for round_ in range(3):
+        for speaker in ("Alice", "Bob"):
+            for i, question in enumerate(QUESTIONS):
+                text = SIMILAR.get(question, question) if round_ == 2 else question
+                lines.append(transcript(speaker, text, (round_ * 10 + i) % 60))
+            lines.append(transcript(speaker, "yes", round_))
+    return lines
+
+
+async def embed(text: str) -> np.ndarray:
+    vector = np.zeros(256, dtype=np.float32)
+    for word in text.split():
+        vector[zlib.crc32(word.encode()) % 256] += 1.0
+    return vector
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--similarity", type=float, default=0.8, help="Minimum similarity of a semantic match")
+    args = parser.parse_args()
+
+    logging.disable()
+    cache = ResponseCache(similarity_threshold=args.similarity, embed=embed)
+    wrong_speaker = 0
+    for message in turns():
+        entry = await cache.lookup(message)
+        if entry is None:
+            await cache.store(message, f"answer for {message}")
+        elif entry["speakers"] != speakers(normalize(message)):
+            wrong_speaker += 1
+
+    metrics = cache.metrics()
+    print(f"{len(turns())} turns, {metrics['exact_hits']} exact and {metrics['semantic_hits']} semantic hits, "
+          f"{metrics['misses']} misses, {metrics['skipped']} too short to cache")
+    print(f"Hits with another speaker's entry: {wrong_speaker}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
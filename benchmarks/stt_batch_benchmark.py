@@ -0,0 +1,76 @@
+"""
+CPU-only throughput of batched Whisper decoding (STTManager.transcribe_segments with a batch size)
+against transcribing merged utterances one at a time, for turns of 1, 4 and 16 utterances.
+
+Run from the repository root:
+    python benchmarks/stt_batch_benchmark.py [--model turbo] [--clips DIR] [--turns 1 4 16]
+
+--clips takes a directory of 16 kHz mono WAV files to use as utterances, otherwise synthetic
+2-second clips are used (which only makes sense for timing, not for the transcripts).
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+import wave
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from SpeechToText import STTManager  # noqa: E402
+
+
+def load_clips(directory: str | None, count: int) -> list:
+    if directory:
+        clips = []
+        for path in sorted(glob.glob(os.path.join(directory, "*.wav"))):
+            with wave.open(path, "rb") as f:
+                if f.getframerate() != 16000 or f.getnchannels() != 1 or f.getsampwidth() != 2:
+                    raise SystemExit(f"{path} is not a 16 kHz mono 16-bit WAV file.")
+                samples = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+            clips.append(samples.astype(np.float32) / 32768.0)
+        if not clips:
+            raise SystemExit(f"No WAV files in {directory}.")
+        return [clips[i % len(clips)] for i in range(count)]
+
+    rng = np.random.default_rng(0)
+    t = np.arange(32000) / 16000
+    return [(0.1 * np.sin(2 * np.pi * rng.uniform(120, 300) * t) + rng.normal(0, 0.01, t.shape)).astype(np.float32)
+            for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="turbo")
+    parser.add_argument("--clips", help="Directory of 16 kHz mono WAV files")
+    parser.add_argument("--turns", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--threads", type=int, help="torch.set_num_threads for the run")
+    args = parser.parse_args()
+
+    if args.threads:
+        import torch
+        torch.set_num_threads(args.threads)
+
+    stt = STTManager(args.model, device="cpu")
+    # Warm up so that the first measurement doesn't include one-off initialisation.
+    stt.transcribe_segments(load_clips(args.clips, 1))
+
+    for count in args.turns:
+        clips = load_clips(args.clips, count)
+        audio_seconds = sum(clip.shape[0] for clip in clips) / 16000
+        print(f"{count} utterance(s), {audio_seconds:.1f} s of audio")
+        for name, batch_size in (("sequential", 1), (f"batched ({args.batch_size})", args.batch_size)):
+            started = time.perf_counter()
+            result = stt.transcribe_segments(clips, batch_size)
+            elapsed = time.perf_counter() - started
+            if not result["success"]:
+                raise SystemExit(f"Transcription failed: {result['error']}")
+            print(f"  {name:>14}: {elapsed:7.2f} s  {count / elapsed:6.2f} utterances/s  "
+                  f"real-time factor {elapsed / audio_seconds:5.2f}")
+
+
+if __name__ == "__main__":
+    main()
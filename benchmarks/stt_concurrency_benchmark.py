@@ -0,0 +1,105 @@
+"""
+Runs transcriptions at the same time on one STTManager, the way overlapping speakers in continuous recording and
+streaming partials do in the default in-process mode: two utterances from two threads, and a partial pass of an
+IncrementalTranscriber while another speaker's turn is finalized. Whisper keeps its key/value cache in hooks on the
+shared model, so calls that overlap have to run one after another. Reports the failed calls and the wall time
+against running the same calls in sequence.
+
+Without --model a small Whisper with random weights is built, which is enough to show whether the calls break each
+other but not for the transcripts. Run from the repository root:
+    python benchmarks/stt_concurrency_benchmark.py [--model turbo] [--rounds 3]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import warnings
+
+import numpy as np
+import torch
+from whisper.model import ModelDimensions, Whisper
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from SpeechToText import STTManager, IncrementalTranscriber  # noqa: E402
+
+
+def random_checkpoint(directory: str) -> str:
+    """Saves a small Whisper with random weights and returns its path."""
+    dims = ModelDimensions(n_mels=80, n_audio_ctx=1500, n_audio_state=64, n_audio_head=2, n_audio_layer=1,
+                           n_vocab=51865, n_text_ctx=64, n_text_state=64, n_text_head=2, n_text_layer=1)
+    torch.manual_seed(0)
+    model = Whisper(dims)
+    with torch.no_grad():
+        for parameter in model.parameters():
+            # Some parameters are left uninitialized by Whisper, they are loaded from the checkpoint normally.
+            if not torch.isfinite(parameter).all() or parameter.abs().max() > 100:
+                parameter.normal_(0, 0.02)
+    path = os.path.join(directory, "random.pt")
+    torch.save({"dims": dims.__dict__, "model_state_dict": model.state_dict()}, path)
+    return path
+
+
+def concurrently(calls: list) -> tuple:
+    """Runs each call in its own thread, returns the results and the wall time."""
+    results = [None] * len(calls)
+
+    def run(i: int):
+        results[i] = calls[i]()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(calls))]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - started
+
+
+def sequentially(calls: list) -> tuple:
+    started = time.perf_counter()
+    return [call() for call in calls], time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=None, help="Whisper model name or checkpoint, a random model by default")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    logging.disable()
+    warnings.filterwarnings("ignore")
+    rng = np.random.default_rng(0)
+    first, second = (rng.normal(0, 0.1, 3 * 16000).astype(np.float32) for _ in range(2))
+
+    with tempfile.TemporaryDirectory() as directory:
+        stt = STTManager(args.model or random_checkpoint(directory), device="cpu")
+
+        def two_utterances() -> list:
+            return [lambda: stt.transcribe_array(first), lambda: stt.transcribe_array(second)]
+
+        def partial_and_finalize() -> list:
+            # IncrementalTranscriber.update transcribes with transcribe_words, and logs failures instead of
+            # returning them.
+            finishing = IncrementalTranscriber(stt, 0)
+            return [lambda: stt.transcribe_words(first), lambda: finishing.finalize(second, 0)]
+
+        for name, calls in (("Two utterances", two_utterances), ("Partial and finalize", partial_and_finalize)):
+            failed = 0
+            total = 0
+            concurrent_time = sequential_time = 0.0
+            for _ in range(args.rounds):
+                results, seconds = concurrently(calls())
+                concurrent_time += seconds
+                failed += sum(1 for result in results if not result["success"])
+                total += len(results)
+                sequential_time += sequentially(calls())[1]
+            print(f"{name:22s} failed {failed}/{total} concurrent calls, wall time "
+                  f"{concurrent_time / args.rounds:6.2f} s concurrent, {sequential_time / args.rounds:6.2f} s in sequence")
+
+
+if __name__ == "__main__":
+    main()
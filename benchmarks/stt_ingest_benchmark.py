@@ -0,0 +1,113 @@
+"""
+Measures what ingest-time downmixing and resampling to 16 kHz mono saves on the STT path: audio memory
+per minute of speech, ingest cost per packet, and end-of-turn-to-transcript latency for buffering
+48 kHz stereo (before) versus 16 kHz mono (after).
+
+Run from the repository root:
+    python benchmarks/stt_ingest_benchmark.py [--clip speech.wav] [--turn 10] [--model turbo]
+
+Without --clip a synthetic signal is used. The latency part needs openai-whisper and ffmpeg, and
+--model additionally runs Whisper itself on both versions of the turn.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from AudioCapture import CaptureStore, StreamingDownsampler, write_wav, STT_SAMPLE_RATE  # noqa: E402
+
+PACKET_SAMPLES = 1920  # 20 ms of 48 kHz stereo
+
+
+def load_turn(clip: str | None, seconds: float) -> np.ndarray:
+    """Returns interleaved 48 kHz stereo int16 samples for one turn."""
+    if clip:
+        with wave.open(clip, "rb") as f:
+            if f.getframerate() != 48000 or f.getsampwidth() != 2:
+                raise SystemExit("The clip has to be a 48 kHz 16-bit WAV file.")
+            samples = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+            if f.getnchannels() == 1:
+                samples = np.repeat(samples, 2)
+        return samples[:int(seconds * 96000)]
+    t = np.arange(int(seconds * 48000)) / 48000
+    rng = np.random.default_rng(0)
+    mono = 6000 * np.sin(2 * np.pi * 220 * t) * (1 + np.sin(2 * np.pi * 3 * t)) + rng.normal(0, 300, t.shape)
+    return np.repeat(mono.astype(np.int16), 2)
+
+
+def ingest(samples: np.ndarray, downsample: bool) -> tuple:
+    if downsample:
+        capture = CaptureStore(sample_rate=STT_SAMPLE_RATE, channels=1)
+        downsampler = StreamingDownsampler()
+    else:
+        capture = CaptureStore()
+        downsampler = None
+    started = time.perf_counter()
+    for i, offset in enumerate(range(0, samples.shape[0], PACKET_SAMPLES)):
+        packet = samples[offset:offset + PACKET_SAMPLES]
+        if downsampler is not None:
+            packet = downsampler.process(packet)
+        capture.append_samples("user", packet, i * 0.02)
+    elapsed = time.perf_counter() - started
+    return capture, elapsed
+
+
+def end_of_turn(capture: CaptureStore, model) -> float:
+    """Time from end of turn to decoded audio (and transcript when a model is given) through a WAV file."""
+    import whisper
+
+    started = time.perf_counter()
+    fd, path = tempfile.mkstemp(suffix=".wav")
+    os.close(fd)
+    try:
+        write_wav(path, capture.buffer("user").view(), capture.sample_rate, capture.channels)
+        audio = whisper.load_audio(path)
+        if model is not None:
+            model.transcribe(audio, language="en", fp16=False)
+    finally:
+        os.remove(path)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clip", help="48 kHz 16-bit WAV file to use as the turn")
+    parser.add_argument("--turn", type=float, default=10.0, help="Turn length in seconds")
+    parser.add_argument("--model", help="Whisper model to include transcription in the latency")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    samples = load_turn(args.clip, args.turn)
+    seconds = samples.shape[0] / 96000
+    packets = samples.shape[0] // PACKET_SAMPLES
+
+    before, before_time = ingest(samples, downsample=False)
+    after, after_time = ingest(samples, downsample=True)
+    per_minute = 60 / seconds
+    print(f"Turn of {seconds:.1f} s ({packets} packets)")
+    print(f"  48 kHz stereo s16: {before.nbytes() * per_minute / 2 ** 20:6.2f} MiB/min, "
+          f"ingest {before_time / packets * 1e6:6.1f} us/packet")
+    print(f"  16 kHz mono f32:   {after.nbytes() * per_minute / 2 ** 20:6.2f} MiB/min, "
+          f"ingest {after_time / packets * 1e6:6.1f} us/packet")
+
+    try:
+        import whisper
+    except ImportError:
+        print("openai-whisper is not installed, skipping the latency measurement.")
+        return
+
+    model = whisper.load_model(args.model, device="cpu") if args.model else None
+    for name, capture in (("48 kHz stereo s16", before), ("16 kHz mono f32", after)):
+        timings = [end_of_turn(capture, model) for _ in range(args.repeats)]
+        print(f"  {name}: end of turn to {'transcript' if model else 'decoded audio'} "
+              f"{min(timings) * 1000:8.1f} ms (best of {args.repeats})")
+
+
+if __name__ == "__main__":
+    main()
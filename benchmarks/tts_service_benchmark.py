@@ -0,0 +1,75 @@
+"""
+Compares synthesizing a burst of concurrent TTS requests the previous way, each in its own asyncio.to_thread call on
+the shared model, with TTSService's single worker and batching. The burst mixes a few streamed sentences with a
+greeting and an error message arriving at the same time. Reports the total time and p50/p95 latency per request,
+and the queue and synthesis times the service measured.
+
+Needs the TTS model. Run from the repository root:
+    python benchmarks/tts_service_benchmark.py [--threads 4] [--batch-size 4] [--rounds 3]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from TextToSpeech import TTSManager  # noqa: E402
+from TTSService import TTSService  # noqa: E402
+
+BURST = [
+    "Python is a programming language that is easy to read.",
+    "It is used for scripts, websites and data analysis.",
+    "Many people learn it as their first language.",
+    "Hello John, welcome to the voice channel!",
+    "There was an error creating a response.",
+]
+
+
+async def timed(coroutine) -> float:
+    started = time.perf_counter()
+    await coroutine
+    return time.perf_counter() - started
+
+
+async def run_threads(tts: TTSManager) -> tuple:
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(timed(asyncio.to_thread(tts.text_to_pcm, text)) for text in BURST))
+    return list(latencies), time.perf_counter() - started
+
+
+async def run_service(service: TTSService) -> tuple:
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(timed(service.synthesize(text)) for text in BURST))
+    return list(latencies), time.perf_counter() - started
+
+
+def report(name: str, latencies: list, total: float):
+    print(f"{name:22s} total {total:6.2f} s   p50 {np.percentile(latencies, 50):6.2f} s   "
+          f"p95 {np.percentile(latencies, 95):6.2f} s")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=None, help="Torch threads")
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    tts = TTSManager(num_threads=args.threads)
+    tts.text_to_audio("Hello.")  # warm-up
+    print(f"Batched synthesis {'is' if tts.can_batch else 'is not'} supported by the model.")
+
+    service = TTSService(tts, batch_size=args.batch_size)
+    for _ in range(args.rounds):
+        report("Thread per request", *await run_threads(tts))
+        report("TTS service", *await run_service(service))
+    print(service.metrics())
+    service.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,140 @@
+"""
+Replays synthetic voice and transcription event sequences through TurnTaking with a simulated clock, and compares
+when a response starts with the previous polling loop, which checked a response flag every 0.5 s after three
+silence segments spanning 2 s had been seen. Every scenario also checks what the state machine responded with.
+
+Run from the repository root:
+    python benchmarks/turn_taking_simulation.py [--turn-end-silence 2.0] [--pause-silence 0.6]
+"""
+import argparse
+import heapq
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from TurnTaking import TurnTaking  # noqa: E402
+
+POLL_INTERVAL = 0.5
+SEGMENT_SILENCE = 1.0  # seconds of quiet that ended a recording segment
+
+
+class SimulatedLoop:
+    """A clock and call_later that jump straight to the next due timer."""
+
+    class Handle:
+        def __init__(self):
+            self.cancelled = False
+
+        def cancel(self):
+            self.cancelled = True
+
+    def __init__(self):
+        self.now = 0.0
+        self.timers = []
+        self.counter = 0
+
+    def clock(self) -> float:
+        return self.now
+
+    def call_later(self, delay: float, callback):
+        handle = self.Handle()
+        self.counter += 1
+        heapq.heappush(self.timers, (self.now + delay, self.counter, handle, callback))
+        return handle
+
+    def at(self, when: float, callback):
+        self.call_later(when - self.now, callback)
+
+    def run(self):
+        while self.timers:
+            when, _, handle, callback = heapq.heappop(self.timers)
+            self.now = max(self.now, when)
+            if not handle.cancelled:
+                callback()
+
+
+def segment(timestamp: float, text: str) -> dict:
+    return {"timestamp": timestamp, "text": text}
+
+
+# Each scenario is a list of (kind, start, end, ...) events: someone speaking from start to end, or a transcription
+# running from start until it finishes with the given text or fails at end.
+SCENARIOS = {
+    "single utterance": [
+        ("speech", 0.0, 1.5), ("transcribe", 1.5, 1.9, "Hello there. ")],
+    "slow transcription": [
+        ("speech", 0.0, 1.5), ("transcribe", 1.5, 4.2, "Tell me a joke. ")],
+    "out-of-order transcriptions": [
+        ("speech", 0.0, 1.0), ("transcribe", 1.0, 3.8, "First part, "),
+        ("speech", 1.4, 2.0), ("transcribe", 2.0, 2.3, "second part.")],
+    "short pause then resume": [
+        ("speech", 0.0, 1.0), ("transcribe", 1.0, 1.3, "Well, "),
+        ("speech", 2.0, 3.0), ("transcribe", 3.0, 3.4, "never mind.")],
+    "transcription failure": [
+        ("speech", 0.0, 1.0), ("fail", 1.0, 1.5, None),
+        ("speech", 2.0, 3.0), ("transcribe", 3.0, 3.3, "Can you hear me?")],
+}
+
+
+def simulate(events: list, turn_end_silence: float, pause_silence: float) -> dict:
+    loop = SimulatedLoop()
+    result = {"responses": [], "pauses": [], "resumes": 0}
+
+    def on_turn_end(transcript: str, segments: list):
+        result["responses"].append((loop.now, transcript))
+
+    turns = TurnTaking(on_turn_end, lambda transcript: result["pauses"].append((loop.now, transcript)),
+                       lambda: result.__setitem__("resumes", result["resumes"] + 1),
+                       turn_end_silence, pause_silence, loop.clock, loop.call_later)
+
+    for kind, start, end, *rest in events:
+        if kind == "speech":
+            loop.at(start, turns.speech_started)
+            loop.at(end, lambda end=end: turns.speech_stopped(end))
+        elif kind == "transcribe":
+            loop.at(start, turns.transcription_started)
+            loop.at(end, lambda start=start, text=rest[0]: turns.transcription_finished(segment(start, text)))
+        elif kind == "fail":
+            loop.at(start, turns.transcription_started)
+            loop.at(end, turns.transcription_failed)
+
+    loop.run()
+    return result
+
+
+def polling_response_time(events: list, turn_end_silence: float) -> float:
+    """When the previous loop would have responded: after three 1 s silence segments and the next poll."""
+    last_voice = max(end for kind, start, end, *rest in events if kind == "speech")
+    transcribed = max(end for kind, start, end, *rest in events if kind in ("transcribe", "fail"))
+    # Silence segments are cut one second of quiet after the last voice and every second after that, and the
+    # flag was only raised once the first and third of them were turn_end_silence apart.
+    flagged = last_voice + SEGMENT_SILENCE * (1 + max(2, math.ceil(turn_end_silence / SEGMENT_SILENCE)))
+    ready = max(flagged, transcribed)
+    return math.ceil(ready / POLL_INTERVAL) * POLL_INTERVAL
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turn-end-silence", type=float, default=2.0)
+    parser.add_argument("--pause-silence", type=float, default=0.6)
+    args = parser.parse_args()
+
+    print(f"{'scenario':30s} {'last voice':>10s} {'polling':>8s} {'events':>8s}  response")
+    for name, events in SCENARIOS.items():
+        result = simulate(events, args.turn_end_silence, args.pause_silence)
+        last_voice = max(end for kind, start, end, *rest in events if kind == "speech")
+        polled = polling_response_time(events, args.turn_end_silence)
+        if result["responses"]:
+            responded, transcript = result["responses"][-1]
+            print(f"{name:30s} {last_voice:9.1f}s {polled - last_voice:7.1f}s {responded - last_voice:7.1f}s  "
+                  f"{transcript!r}")
+        else:
+            print(f"{name:30s} {last_voice:9.1f}s {polled - last_voice:7.1f}s {'-':>8s}  no response")
+        print(f"{'':30s} {len(result['pauses'])} speculative pause(s), {result['resumes']} resumed, "
+              f"{len(result['responses'])} response(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Measures how fast and how accurately VoiceCommands recognizes spoken moderation commands against an index of
+synthetic Twitch usernames. The commands are phrased the way Whisper tends to transcribe them: names split into
+words, numbers spelled out and some misheard letters. Lines that aren't commands are mixed in to check that they
+are left for the LLM. Misheard names only match approximately, so those commands aren't carried out but the speaker
+is asked to confirm the suggested username.
+
+Run from the repository root:
+    python benchmarks/voice_command_benchmark.py [--users 5000] [--commands 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from VoiceCommands import VoiceCommands, UsernameIndex, SMALL_NUMBERS, TENS  # noqa: E402
+
+WORDS = ["cool", "gamer", "night", "owl", "shadow", "pixel", "ninja", "dragon", "lucky", "frost", "storm", "wolf",
+         "captain", "potato", "sniper", "queen", "king", "toast", "rocket", "turbo", "mango", "echo", "blaze", "moon"]
+NOT_COMMANDS = ["How are you doing today?", "I got banned from that server once.", "What time is it?",
+                "Tell me about the timeout rules on Twitch.", "Can you say hi to chat?"]
+
+
+def spell(number: int) -> str:
+    small = {value: word for word, value in SMALL_NUMBERS.items()}
+    tens = {value: word for word, value in TENS.items()}
+    if number < 20:
+        return small[number]
+    return tens[number - number % 10] + (" " + small[number % 10] if number % 10 else "")
+
+
+def make_username(rng: random.Random) -> tuple:
+    """A username and how it would be spoken."""
+    words = rng.sample(WORDS, 2)
+    number = rng.randrange(100) if rng.random() < 0.8 else None
+    name = "".join(word.capitalize() if rng.random() < 0.5 else word for word in words)
+    spoken = " ".join(words)
+    if number is not None:
+        name += ("_" if rng.random() < 0.3 else "") + str(number)
+        spoken += " " + (spell(number) if rng.random() < 0.5 else str(number))
+    return name, spoken
+
+
+def mishear(spoken: str, rng: random.Random) -> str:
+    """Drops or doubles a letter, like a slightly misheard name."""
+    i = rng.randrange(len(spoken))
+    if not spoken[i].isalpha():
+        return spoken
+    return spoken[:i] + spoken[i + 1:] if rng.random() < 0.5 else spoken[:i] + spoken[i] + spoken[i:]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--commands", type=int, default=2000)
+    parser.add_argument("--cutoff", type=float, default=0.9)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    users = {}
+    while len(users) < args.users:
+        name, spoken = make_username(rng)
+        users.setdefault(UsernameIndex.key(name), (name, spoken))
+    users = list(users.values())
+
+    started = time.perf_counter()
+    matcher = VoiceCommands(UsernameIndex([name for name, _ in users], args.cutoff))
+    print(f"Indexed {len(matcher.usernames)} usernames in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    results = {"exact": [0, 0, [], 0, 0], "misheard": [0, 0, [], 0, 0], "not a command": [0, 0, [], 0, 0]}
+    for _ in range(args.commands):
+        name, spoken = rng.choice(users)
+        kind = rng.choice(list(results))
+        if kind == "not a command":
+            line, expected = rng.choice(NOT_COMMANDS), None
+        else:
+            if kind == "misheard":
+                spoken = mishear(spoken, rng)
+            line = rng.choice([f"Timeout {spoken} for ten minutes.", f"Ban {spoken}.",
+                               f"Could you time out {spoken} for 5 min?", f"Ban {spoken} because of spam."])
+            expected = name
+        transcript = f"[2025-05-12 13.59:53] <John>: {line}\n"
+        result = matcher.match(transcript, {"John"})
+        target = result["commands"][0]["target"] if result["commands"] else None
+        suggested = result["unconfirmed"][0]["target"] if result["unconfirmed"] else None
+        counts = results[kind]
+        counts[0] += target == expected
+        # A command carried out on the wrong user is the mistake that matters.
+        counts[1] += target is not None and target != expected
+        counts[2].append(result["seconds"])
+        counts[3] += suggested is not None
+        counts[4] += suggested is not None and suggested != expected
+
+    for kind, (correct, wrong, seconds, unconfirmed, wrong_suggestions) in results.items():
+        seconds = sorted(seconds)
+        p50 = seconds[len(seconds) // 2] * 1000
+        p95 = seconds[min(int(len(seconds) * 0.95), len(seconds) - 1)] * 1000
+        print(f"{kind:14s} {correct}/{len(seconds)} correct  {wrong} carried out on the wrong user  {unconfirmed} asked to confirm "
+              f"({wrong_suggestions} wrong suggestions)  p50 {p50:.2f} ms  p95 {p95:.2f} ms  "
+              f"max {seconds[-1] * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
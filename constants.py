@@ -2,4 +2,6 @@ recorded_audio_directory = "dc_audio"
 audio_to_play_directory = "speech_output"
 transcriptions_directory = "transcriptions"
 llm_output_texts_directory = "output_texts"
-BOT_CONFIG_KEY = "bot_config"
\ No newline at end of file
+tts_cache_directory = "tts_cache"
+BOT_CONFIG_KEY = "bot_config"
+TWITCH_CHATTERS_KEY = "twitch_chatters"